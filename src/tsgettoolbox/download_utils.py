@@ -0,0 +1,215 @@
+"""
+Collection of utilities to download files to disk only when they are new.
+"""
+
+import datetime
+import email.utils
+import ftplib
+import os
+import tempfile
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+
+import requests
+
+__all__ = ["dir_list", "download_files", "download_if_new", "open_file_for_url"]
+
+CHUNK_SIZE = 64 * 1024
+
+# reuse connections across downloads
+_session = requests.Session()
+
+# one ftp control connection per host and thread
+_ftp_connections = threading.local()
+
+
+def dir_list(url):
+    """given a path to a ftp directory, returns a list of files in that
+    directory
+    """
+    parsed = urllib.parse.urlparse(url)
+
+    def _list(ftp):
+        ftp.cwd(parsed.path)
+        return ftp.nlst()
+
+    return _ftp_call(parsed.netloc, _list)
+
+
+def download_files(urls_and_paths, check_modified=True, max_workers=4, **kwargs):
+    """downloads several files at the same time with download_if_new, returns
+    the paths
+
+    Parameters
+    ----------
+    urls_and_paths : iterable of (str, str)
+        (url, path) of each file
+    check_modified : bool
+        passed to download_if_new
+    max_workers : int
+        number of files downloaded at the same time
+    **kwargs
+        session and verify, passed to download_if_new
+    """
+    urls_and_paths = list(urls_and_paths)
+
+    def _download(url_and_path):
+        url, path = url_and_path
+        download_if_new(url, path, check_modified=check_modified, **kwargs)
+        return path
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_download, urls_and_paths))
+
+
+def download_if_new(url, path, check_modified=True, session=None, verify=True):
+    """downloads the file located at `url` to `path`, if check_modified is True
+    it will only download if the url's last-modified header has a more recent
+    date than the filesystem's last modified date for the file
+
+    Http downloads are a single conditional GET (If-Modified-Since and
+    If-None-Match), ftp downloads reuse the control connection to the host,
+    and the file at `path` is only replaced once the download is complete.
+    """
+    parsed = urllib.parse.urlparse(url)
+
+    if os.path.exists(path) and not check_modified:
+        return
+
+    if parsed.scheme.startswith("ftp"):
+        _ftp_download_if_new(url, path)
+    elif parsed.scheme.startswith("http"):
+        _http_download_if_new(url, path, session=session, verify=verify)
+    else:
+        raise NotImplementedError("only ftp and http urls are currently implemented")
+
+
+@contextmanager
+def open_file_for_url(url, path, check_modified=True, use_file=None, use_bytes=None):
+    """Context manager that returns an open file handle for a data file;
+    downloading if necessary or otherwise using a previously downloaded file.
+    File downloading will be short-circuited if use_file is either a file path
+    or an open file-like object (i.e. file handler or StringIO obj), in which
+    case the file handler pointing to use_file is returned - if use_file is a
+    file handler then the handler won't be closed upon exit.
+    """
+    if hasattr(use_file, "read"):
+        yield use_file
+        return
+
+    if use_file is None:
+        download_if_new(url, path, check_modified)
+        open_path = path
+    else:
+        open_path = use_file
+
+    with open(open_path) if use_bytes is None else open(open_path, "rb") as f:
+        yield f
+
+
+def _atomic_write(path, write):
+    """calls write(f) with a temporary file next to path, then moves it to
+    path"""
+    dir_path = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dir_path, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=dir_path, prefix=f".{os.path.basename(path)}.", suffix=".part"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _etag_path(path):
+    return f"{path}.etag"
+
+
+def _ftp_call(host, func):
+    """calls func(ftp) with this thread's connection to host, reconnecting
+    once if the connection was dropped"""
+    connections = _ftp_connections.__dict__
+    for attempt in range(2):
+        ftp = connections.get(host)
+        if ftp is None:
+            ftp = connections[host] = ftplib.FTP(host, "anonymous")
+        try:
+            return func(ftp)
+        except (EOFError, OSError, ftplib.error_temp):
+            connections.pop(host, None)
+            with suppress(OSError):
+                ftp.close()
+            if attempt:
+                raise
+
+
+def _ftp_download_if_new(url, path):
+    parsed = urllib.parse.urlparse(url)
+
+    def _download(ftp):
+        ftp.sendcmd("TYPE I")
+        ftp_file_size = ftp.size(parsed.path)
+        timestamp = ftp.sendcmd(f"MDTM {parsed.path}").split()[-1]
+        ftp_last_modified = datetime.datetime.strptime(timestamp, "%Y%m%d%H%M%S")
+
+        if (
+            not os.path.exists(path)
+            or os.path.getsize(path) != ftp_file_size
+            or _path_last_modified(path) < ftp_last_modified
+        ):
+            _atomic_write(
+                path, lambda f: ftp.retrbinary(f"RETR {parsed.path}", f.write)
+            )
+
+    _ftp_call(parsed.netloc, _download)
+
+
+def _http_download_if_new(url, path, session=None, verify=True):
+    if session is None:
+        session = _session
+
+    headers = {}
+    if os.path.exists(path):
+        headers["If-Modified-Since"] = email.utils.formatdate(
+            os.path.getmtime(path), usegmt=True
+        )
+        if os.path.exists(_etag_path(path)):
+            with open(_etag_path(path)) as f:
+                headers["If-None-Match"] = f.read().strip()
+
+    with session.get(
+        url, headers=headers, stream=True, timeout=60, verify=verify
+    ) as response:
+        if response.status_code == 304:
+            return
+        response.raise_for_status()
+
+        def _write(f):
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+
+        _atomic_write(path, _write)
+        etag = response.headers.get("etag")
+
+    if etag:
+        with open(_etag_path(path), "w") as f:
+            f.write(etag)
+    elif os.path.exists(_etag_path(path)):
+        os.remove(_etag_path(path))
+
+
+def _path_last_modified(path):
+    """returns a datetime.datetime object representing the last time the file at
+    a given path was last modified
+    """
+    if not os.path.exists(path):
+        return None
+
+    return datetime.datetime.fromtimestamp(
+        os.path.getmtime(path), datetime.timezone.utc
+    ).replace(tzinfo=None)
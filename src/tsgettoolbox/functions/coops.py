@@ -5,15 +5,18 @@ coops               global station 1T,6T,H,D,M: Center for Operational
 
 import contextlib
 import datetime
+import os
 import warnings
 from collections import defaultdict
 from typing import List, Literal, Optional, Union
 
 import async_retriever as ar
 import dateutil.parser as parser
+import numpy as np
 import pandas as pd
 from dateutil.tz import tzoffset
 
+from tsgettoolbox import utils
 from tsgettoolbox.toolbox_utils.src.toolbox_utils import tsutils
 
 __all__ = ["coops"]
@@ -163,6 +166,125 @@ deltas = {
 }
 
 
+_MDAPI_URL = "https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi"
+
+# Seconds before the local station registry is loaded again from mdapi.
+_REGISTRY_TTL = 7 * 24 * 60 * 60
+
+
+def _registry_entry(station):
+    """Return the registry fields of a mdapi station record."""
+    details = station.get("details")
+    details = details if isinstance(details, dict) else {}
+    entry = {
+        key: details.get(key, station.get(key))
+        for key in ("established", "removed")
+        if key in details or key in station
+    }
+    timezone = details.get("timezone", station.get("timezone"))
+    if not isinstance(timezone, (int, float)):
+        timezone = station.get("timezonecorr", 0)
+    entry["timezone"] = timezone
+    return entry
+
+
+def _load_station_registry(refresh=False):
+    """Return the local registry of COOPS stations, keyed by station id.
+
+    The registry is bulk loaded from the mdapi station list and kept in the
+    tsgettoolbox data directory for _REGISTRY_TTL seconds, or until `refresh`
+    is True.
+    """
+    path = os.path.join(utils.get_tsget_dir("coops"), "stations.json")
+    if refresh:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+    return utils.cached_json(
+        path,
+        _REGISTRY_TTL,
+        lambda: {
+            str(station["id"]): _registry_entry(station)
+            for station in ar.retrieve_json(
+                [f"{_MDAPI_URL}/stations.json"],
+                [{"params": {"expand": "details", "units": "english"}}],
+            )[0]["stations"]
+        },
+    )
+
+
+def _station_metadata(station):
+    """Return the established, removed and timezone metadata of `station`.
+
+    Answered from the local registry.  Only stations missing from the registry,
+    or registry entries without an established date, cost a request to the
+    station details service, and that answer is cached as well.
+    """
+    with contextlib.suppress(ar.exceptions.ServiceError, KeyError):
+        entry = _load_station_registry().get(station)
+        if entry is not None and "established" in entry:
+            return entry
+
+    def _fetch():
+        try:
+            station_data = ar.retrieve_json(
+                [f"{_MDAPI_URL}/stations/{station}/details.json"],
+                [{"params": {"expand": "detail", "units": "english"}}],
+            )
+        except ar.exceptions.ServiceError:
+            station_data = ar.retrieve_json(
+                [f"{_MDAPI_URL}/stations/{station}.json"],
+                [{"params": {"expand": "detail", "units": "english"}}],
+            )
+        return _registry_entry(station_data[0])
+
+    return utils.cached_json(
+        os.path.join(utils.get_tsget_dir("coops/stations"), f"{station}.json"),
+        _REGISTRY_TTL,
+        _fetch,
+    )
+
+
+def _naive(timestamp, tz):
+    """Return `timestamp` as a naive Timestamp in the station timezone `tz`."""
+    if timestamp is None or timestamp == "" or pd.isna(timestamp):
+        return None
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert(tz).tz_localize(None)
+    return timestamp
+
+
+def _decode_records(records, flag_names):
+    """Decode COOPS JSON records into a DataFrame of typed columns.
+
+    Each field is collected into a fixed width string array and converted in
+    one step; fields that are not numeric are kept as strings.  The "f" field
+    is a comma separated list of single digit flags so the flags are read
+    straight from their character positions into boolean columns named by
+    `flag_names`.  Without `flag_names` the "f" field is kept as strings.
+    """
+    columns = {}
+    index = None
+    for key in records[0]:
+        values = np.array(
+            ["" if rec.get(key) is None else rec[key] for rec in records], dtype=str
+        )
+        if key == "t":
+            index = pd.to_datetime(values)
+        elif key == "f" and flag_names:
+            width = 2 * len(flag_names) - 1
+            chars = values.astype(f"S{width}").view(np.uint8).reshape(-1, width)
+            for pos, name in enumerate(flag_names):
+                if name:
+                    columns[name] = chars[:, 2 * pos] == ord("1")
+        else:
+            try:
+                columns[key] = np.where(values == "", "nan", values).astype(np.float64)
+            except ValueError:
+                columns[key] = values
+    return pd.DataFrame(columns, index=index)
+
+
 @tsutils.transform_args(
     product=tsutils.make_list,
     time_zone=str.upper,
@@ -806,37 +928,33 @@ def coops(
     # Normalize begin_data and end_date to not extend beyond the "established"
     # and "removed" dates of the station.
     if (date is None) and (range is None):
-        try:
-            station_data = ar.retrieve_json(
-                [
-                    f"https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations/{station}/details.json"
-                ],
-                [{"params": {"expand": "detail", "units": "english"}}],
-            )
-        except ar.exceptions.ServiceError:
-            station_data = ar.retrieve_json(
-                [
-                    f"https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations/{station}.json"
-                ],
-                [{"params": {"expand": "detail", "units": "english"}}],
-            )
-        try:
-            test_begin = pd.Timestamp(station_data[0]["established"])
-        except KeyError:
+        station_data = _station_metadata(station)
+        datatz = tzoffset(None, station_data["timezone"] * 60 * 60)
+        test_begin = _naive(station_data.get("established"), datatz)
+        if test_begin is None:
             test_begin = pd.Timestamp("1970-01-01")
+        test_end = _naive(station_data.get("removed"), datatz)
+        if test_end is None:
+            test_end = _naive(pd.Timestamp.now(tz=datatz), datatz)
+        begin_date = _naive(begin_date, datatz)
+        end_date = _naive(end_date, datatz)
         if (begin_date is None) or (begin_date < test_begin):
             begin_date = test_begin
-        try:
-            test_end = pd.Timestamp(station_data[0]["removed"])
-        except KeyError:
-            test_end = pd.Timestamp(datetime.datetime.now(datetime.timezone.utc))
-        if test_end is pd.NaT:
-            test_end = pd.Timestamp(datetime.datetime.now(datetime.timezone.utc))
-        datatz = tzoffset(None, station_data[0]["timezone"] * 60 * 60)
-        test_end = test_end.tz_convert(datatz)
-        end_date = end_date.tz_localize(datatz)
         if (end_date is None) or (end_date > test_end):
             end_date = test_end
+        if begin_date > end_date:
+            warnings.warn(
+                tsutils.error_wrapper(
+                    f"""
+                    Station "{station}" has no data between the requested
+                    dates.  The station was established {test_begin} and
+                    removed {test_end}.
+                    """
+                )
+            )
+            return pd.DataFrame()
+        params["begin_date"] = begin_date
+        params["end_date"] = end_date
 
     if params["begin_date"]:
         params["begin_date"] = params["begin_date"].strftime("%Y%m%d")
@@ -844,7 +962,11 @@ def coops(
     if params["end_date"]:
         params["end_date"] = params["end_date"].strftime("%Y%m%d")
 
-    ndf = pd.DataFrame()
+    # Requests for all windows of all products are made in one concurrent
+    # batch.
+    keys = []
+    urls = []
+    kwds = []
     for produc in product:
         periods = []
         if params["begin_date"] is not None and params["end_date"] is not None:
@@ -855,73 +977,78 @@ def coops(
                 periods.append((period_start, period_end))
                 period_start = period_end
 
-        urls = [r"https://tidesandcurrents.noaa.gov/api/prod/datagetter"]
-        kwds = [{"params": params}]
-
-        if params["begin_date"] is not None and params["end_date"] is not None:
-            urls, kwds = zip(
-                *[
-                    (
-                        r"https://tidesandcurrents.noaa.gov/api/prod/datagetter",
-                        {
-                            "params": {
-                                "station": station,
-                                "date": date,
-                                "range": range,
-                                "product": produc,
-                                "bin": bin,
-                                "interval": interval,
-                                "units": "metric",
-                                "time_zone": time_zone,
-                                "datum": datum,
-                                "begin_date": s.strftime("%Y%m%d"),
-                                "end_date": e.strftime("%Y%m%d"),
-                                "format": "json",
-                                "application": "tsgettoolbox",
-                            }
-                        },
-                    )
-                    for s, e in periods
-                ]
-            )
-
-        kwds = [
-            {"params": {k: v for k, v in i["params"].items() if v is not None}}
-            for i in kwds
-        ]
-        resp = ar.retrieve_json(urls, kwds, disable=disable_caching)
-        if produc == "predictions":
-            resp = [i["predictions"] for i in resp if "predictions" in i]
+        if periods:
+            for s, e in periods:
+                keys.append(produc)
+                urls.append(r"https://tidesandcurrents.noaa.gov/api/prod/datagetter")
+                kwds.append(
+                    {
+                        "params": {
+                            "station": station,
+                            "date": date,
+                            "range": range,
+                            "product": produc,
+                            "bin": bin,
+                            "interval": interval,
+                            "units": "metric",
+                            "time_zone": time_zone,
+                            "datum": datum,
+                            "begin_date": s.strftime("%Y%m%d"),
+                            "end_date": e.strftime("%Y%m%d"),
+                            "format": "json",
+                            "application": "tsgettoolbox",
+                        }
+                    }
+                )
         else:
-            resp = [i["data"] for i in resp if "data" in i]
-
-        if not resp:
+            keys.append(produc)
+            urls.append(r"https://tidesandcurrents.noaa.gov/api/prod/datagetter")
+            kwds.append({"params": {**params, "product": produc}})
+
+    kwds = [
+        {"params": {k: v for k, v in i["params"].items() if v is not None}}
+        for i in kwds
+    ]
+    resp = ar.retrieve_json(urls, kwds, disable=disable_caching)
+
+    records = defaultdict(list)
+    for produc, response in zip(keys, resp):
+        field = "predictions" if produc == "predictions" else "data"
+        records[produc].extend(response.get(field, []))
+
+    time_zone_name = params["time_zone"].upper()
+    if time_zone_name == "GMT":
+        time_zone_name = "UTC"
+
+    ndf = []
+    for produc in product:
+        if not records[produc]:
             warnings.warn(
                 tsutils.error_wrapper(
-                    """
-                    No data for this product and time frame at this station.
+                    f"""
+                    No data for product "{produc}" and time frame at this
+                    station.
                     """
                 )
             )
-            return pd.DataFrame()
-
-        resp = [item for sublist in resp for item in sublist]
-        resp = pd.DataFrame(resp)
+            continue
+
+        # Only products with a known flag layout decode the "f" field into
+        # flag columns, otherwise it is kept as a string column.
+        settings = _settings_map[produc]
+        flag_names = []
+        if "f" in records[produc][0] and len(settings) > 2:
+            flag_names = settings[2]
+        resp = _decode_records(records[produc], flag_names)
         if produc == "monthly_mean":
-            resp["t"] = pd.to_datetime(resp[["year", "month"]].assign(Day=1))
+            resp.index = pd.to_datetime(
+                pd.DataFrame({"year": resp["year"], "month": resp["month"], "day": 1})
+            )
             resp = resp.drop(["year", "month"], axis="columns")
-        resp = resp.set_index("t")
-        time_zone_name = params["time_zone"].upper()
-        if time_zone_name == "GMT":
-            time_zone_name = "UTC"
+        # Adjacent windows overlap by a day.
+        resp = resp[~resp.index.duplicated()]
         resp.index.name = f"Datetime:{time_zone_name}"
 
-        if "f" in resp.columns:
-            addcols = resp["f"].str.split(pat=",", expand=True)
-            resp = resp.drop("f", axis="columns")
-            addcols.columns = _settings_map[produc][2]
-            resp = resp.join(addcols)
-
         units = _settings_map[produc][0][params["units"]]
         if produc in ("wind", "currents"):
             rename_cols = {
@@ -952,8 +1079,11 @@ def coops(
             "a": f"{produc}_MinMaxTol",
             "o": f"{produc}_CntSigma",
         }
-        resp = resp.rename(rename_cols, axis="columns")
-        ndf = ndf.join(resp, how="outer")
+        ndf.append(resp.rename(rename_cols, axis="columns"))
+
+    if not ndf:
+        return pd.DataFrame()
+    ndf = pd.concat(ndf, axis="columns").sort_index()
     with contextlib.suppress(Exception):
         ndf.index = pd.to_datetime(ndf.index)
     return ndf
@@ -4,7 +4,10 @@ fawn                US/FL 15T,H,D,M:Florida Automated Weather Network
 """
 
 import datetime
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
+from io import BytesIO
 
 import mechanize
 import pandas as pd
@@ -168,10 +171,28 @@ for key, value in vars__.items():
 # units_table = "\n".join(["        {0}".format(i) for i in units_table.split("\n")])
 
 
+_REPORTS_URL = "https://fawn.ifas.ufl.edu/data/reports/"
+
+# Number of windows submitted at the same time, each with its own browser.
+_MAX_SESSIONS = 4
+
+# Idle browsers showing the report form, reused across windows and calls.
+_SESSIONS = queue.SimpleQueue()
+
+
+def _session():
+    """Return an idle browser showing the report form."""
+    try:
+        return _SESSIONS.get_nowait()
+    except queue.Empty:
+        br = mechanize.Browser()
+        br.open(_REPORTS_URL)
+        return br
+
+
 def core(data):
     """Download a chunk of data."""
-    br = mechanize.Browser()
-    br.open("https://fawn.ifas.ufl.edu/data/reports/")
+    br = _session()
     br.select_form(nr=0)
     for key in data:
         if "locs__" in key or "vars__" in key:
@@ -184,7 +205,13 @@ def core(data):
     br.form["toDate_m"] = [str(data["toDate_m"])]
     br.form["toDate_d"] = [str(data["toDate_d"])]
     br.form["reportType"] = [data["reportType"]]
-    response = br.submit(nr=1)
+    response = BytesIO(br.submit(nr=1).read())
+
+    # Going back re-parses the cached form page, so the browser is ready
+    # for the next window without another request.  A browser that failed
+    # above is dropped instead.
+    br.back()
+    _SESSIONS.put(br)
 
     for line in response.readlines():
         if b"Cancelled CSV output due to lack of data" in line:
@@ -365,13 +392,12 @@ def fawn(
                 )
             ) from exc
 
-    ndf = pd.DataFrame()
-
     sdate = tsutils.parsedate(data["start_date"])
     edate = tsutils.parsedate(data["end_date"])
     _ = data.pop("start_date")
     _ = data.pop("end_date")
 
+    windows = []
     testdate = sdate
     while testdate < edate:
         begin_test_date = tsutils.parsedate(testdate)
@@ -390,12 +416,14 @@ def fawn(
         data["toDate_d"] = end_test_date.day
         data["toDate_y"] = end_test_date.year
 
-        df = core(data)
-        if len(df) == 0:
-            continue
+        windows.append(dict(data))
+
+    with ThreadPoolExecutor(max_workers=_MAX_SESSIONS) as executor:
+        ndf = [df for df in executor.map(core, windows) if len(df) > 0]
 
-        # With multi-index pandas won't combine_first with an empty ndf.
-        ndf = df if len(ndf) == 0 else ndf.combine_first(df)
+    # Adjacent windows share their end and start date, keep the first.
+    ndf = pd.concat(ndf) if ndf else pd.DataFrame()
+    ndf = ndf[~ndf.index.duplicated()].sort_index()
     if len(ndf) == 0:
         raise ValueError(
             tsutils.error_wrapper(
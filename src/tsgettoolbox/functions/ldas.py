@@ -19,20 +19,24 @@ ldas_smerge          global 0.125deg 1997- D:SMERGE-Noah-CCI root zone soil
 ldas_trmm_tmpa       global 0.25deg 1997- 3H:TRMM (TMPA) rainfall estimate
 """
 
+import base64
 import datetime
 import itertools
+import json
 import logging
-import netrc
 import os
+import tempfile
 import textwrap
+import threading
+import time
 from contextlib import suppress
 from io import BytesIO
 
 import async_retriever as ar
 import pandas as pd
 import requests
+from platformdirs import user_config_dir
 from requests.auth import HTTPBasicAuth
-import json
 
 # from pandas._libs.lib import no_default
 from tabulate import tabulate as tb
@@ -475,6 +479,81 @@ _project_version = {
 }
 
 
+_SIGNIN_URL = "https://api.giovanni.earthdata.nasa.gov/signin"
+
+# Lifetime assumed for a Giovanni token whose expiration can't be decoded, and
+# the margin before expiration at which a token is refreshed, in seconds.
+_TOKEN_LIFETIME = 60 * 60
+_TOKEN_MARGIN = 60
+
+_TOKEN_LOCK = threading.Lock()
+_TOKEN = {}
+
+
+def _token_path():
+    return os.path.join(
+        user_config_dir("tsgettoolbox", "tsgettoolbox"), "giovanni_token.json"
+    )
+
+
+def _token_expires(token):
+    """Return the expiration, in seconds since the epoch, of a JWT token."""
+    with suppress(ValueError, IndexError, KeyError, TypeError):
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    return time.time() + _TOKEN_LIFETIME
+
+
+def _giovanni_token(refresh=False, persist=True):
+    """Return a Giovanni authorization token, signing in only when needed.
+
+    The token is kept in memory, and if `persist` is True also in a user only
+    readable file in the tsgettoolbox configuration directory, until shortly
+    before it expires.  Safe to call from several threads.
+
+    Parameters
+    ----------
+    refresh : bool
+        Discard any cached token and sign in again.
+    persist : bool
+        Read and write the token from and to the on disk cache.
+    """
+    with _TOKEN_LOCK:
+        if not refresh and not _TOKEN and persist:
+            with (
+                suppress(OSError, ValueError),
+                open(_token_path(), encoding="ascii") as fptoken,
+            ):
+                _TOKEN.update(json.load(fptoken))
+        if refresh or time.time() > _TOKEN.get("expires", 0) - _TOKEN_MARGIN:
+            # Makes sure the .netrc file has an entry for
+            # urs.earthdata.nasa.gov and if not, will prompt for user
+            # credentials and create the .netrc file (if necessary) and
+            # populate with the urs.earthdata.nasa.gov entry.
+            username, password = utils.read_netrc("urs.earthdata.nasa.gov")
+            resp = requests.get(
+                _SIGNIN_URL,
+                auth=HTTPBasicAuth(username, password),
+                allow_redirects=True,
+                timeout=60,
+            )
+            resp.raise_for_status()
+            token = resp.json()["token"]
+            _TOKEN.clear()
+            _TOKEN.update({"token": token, "expires": _token_expires(token)})
+            if persist:
+                dirname = os.path.dirname(_token_path())
+                os.makedirs(dirname, exist_ok=True)
+                # mkstemp creates the file readable and writable only by the
+                # user.
+                fd, tmppath = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="ascii") as fptoken:
+                    json.dump(_TOKEN, fptoken)
+                os.replace(tmppath, _token_path())
+        return _TOKEN["token"]
+
+
 def make_units_table(units_dict):
     """
     Make a table of variables for the docstring.
@@ -1125,27 +1204,8 @@ def base_ldas(
 
     location = f"[{lat}, {lon}]"
 
-    signin_url = "https://api.giovanni.earthdata.nasa.gov/signin"
-
-    # This will make sure the .netrc file has an entry for
-    # urs.earthdata.nasa.gov and if not, will prompt for user
-    # credentials and create the .netrc file (if necessary) and populate with
-    # the urs.earthdata.nasa.gov entry.
-    _ = utils.read_netrc("urs.earthdata.nasa.gov")
-
-    # This gets the token for Earthdata login authentication from the .netrc
-    # file.
-    token = requests.get(
-        signin_url,
-        auth=HTTPBasicAuth(
-            netrc.netrc().hosts["urs.earthdata.nasa.gov"][0],
-            netrc.netrc().hosts["urs.earthdata.nasa.gov"][2],
-        ),
-        allow_redirects=True,
-    )
-    token = json.loads(token._content)
-    token = token["token"]
-  
+    token = _giovanni_token()
+
     time_series_url = "https://api.giovanni.earthdata.nasa.gov/timeseries"
 
     ndf = pd.DataFrame()
@@ -1211,7 +1271,6 @@ def base_ldas(
                         "data": v,
                         "time": f"{s.strftime('%Y-%m-%dT%H:%M:%S')}/{e.strftime('%Y-%m-%dT%H:%M:%S')}",
                     },
-                    "headers": {"authorizationtoken": token},
                 },
             )
             for (s, e), v in itertools.product(periods, nvariables)
@@ -1220,7 +1279,28 @@ def base_ldas(
 
     if os.path.exists("debug_tsgettoolbox"):
         logging.warning(f"{urls}, {kwds}")
-    resp = ar.retrieve_binary(urls, kwds)
+    resp = ar.retrieve_binary(
+        urls,
+        [{**kwd, "headers": {"authorizationtoken": token}} for kwd in kwds],
+        raise_status=False,
+    )
+
+    # A failed request is most likely an expired or revoked token, so sign in
+    # again and retry the failed requests once, this time raising any error.
+    retry = [index for index, response in enumerate(resp) if response is None]
+    if retry:
+        token = _giovanni_token(refresh=True)
+        for index, response in zip(
+            retry,
+            ar.retrieve_binary(
+                [urls[index] for index in retry],
+                [
+                    {**kwds[index], "headers": {"authorizationtoken": token}}
+                    for index in retry
+                ],
+            ),
+        ):
+            resp[index] = response
 
     ndf = pd.DataFrame()
     for response, keyword in zip(resp, kwds):
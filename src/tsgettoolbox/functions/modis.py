@@ -5,15 +5,31 @@ modis               global 250m,500m,1000m 2000- 4D,8D,16D,A:Download
 
 import datetime
 import json
+import os
+from collections import defaultdict
 
 import async_retriever as ar
 import numpy as np
 import pandas as pd
 
+from tsgettoolbox import utils
 from tsgettoolbox.toolbox_utils.src.toolbox_utils import tsutils
 
 __all__ = ["modis"]
 
+_MODIS_URL = "https://modis.ornl.gov/rst/api/v1"
+
+# The subset service returns at most this many composite dates per request.
+_MAX_SUBSET_DATES = 10
+
+# Maximum number of subset requests in flight at the same time.
+_MAX_SUBSET_REQUESTS = 4
+
+# Seconds to keep the cached product and band catalogs and the per tile lists
+# of composite dates.
+_CATALOG_TTL = 7 * 24 * 60 * 60
+_DATES_TTL = 24 * 60 * 60
+
 _MISSING = {
     "MU": -9999,
     "PE": 255,
@@ -815,6 +831,159 @@ _VALID_RANGE = {
     "Cycle_2.Rate_Greenness_Increase_2": [1, 32766],
 }
 
+# Bit fields of the quality control bands.  Each entry is (name, first bit,
+# number of bits, value) and is unpacked into a boolean column that is True
+# where the bit field equals value.
+_FPARLAI_QC = [
+    ("good_quality", 0, 1, 0),
+    ("aqua", 1, 1, 1),
+    ("dead_detector", 2, 1, 1),
+    ("cloud_clear", 3, 2, 0),
+    ("cloud_significant", 3, 2, 1),
+    ("cloud_mixed", 3, 2, 2),
+    ("main_method", 5, 3, 0),
+    ("main_method_saturation", 5, 3, 1),
+    ("backup_method_geometry", 5, 3, 2),
+    ("backup_method_other", 5, 3, 3),
+    ("not_produced", 5, 3, 4),
+]
+
+_LST_QC = [
+    ("good_quality", 0, 2, 0),
+    ("other_quality", 0, 2, 1),
+    ("not_produced_cloud", 0, 2, 2),
+    ("not_produced_other", 0, 2, 3),
+    ("data_quality_good", 2, 2, 0),
+    ("emis_error_le_0.01", 4, 2, 0),
+    ("emis_error_le_0.02", 4, 2, 1),
+    ("emis_error_le_0.04", 4, 2, 2),
+    ("emis_error_gt_0.04", 4, 2, 3),
+    ("lst_error_le_1K", 6, 2, 0),
+    ("lst_error_le_2K", 6, 2, 1),
+    ("lst_error_le_3K", 6, 2, 2),
+    ("lst_error_gt_3K", 6, 2, 3),
+]
+
+_VI_QUALITY = [
+    ("good_quality", 0, 2, 0),
+    ("check_other_qa", 0, 2, 1),
+    ("probably_cloudy", 0, 2, 2),
+    ("not_produced", 0, 2, 3),
+    ("highest_usefulness", 2, 4, 0),
+    ("adjacent_cloud", 8, 1, 1),
+    ("brdf_correction", 9, 1, 1),
+    ("mixed_clouds", 10, 1, 1),
+    ("land", 11, 3, 1),
+    ("snow_ice", 14, 1, 1),
+    ("shadow", 15, 1, 1),
+]
+
+_QC_FLAGS = {
+    "FparLai_QC": _FPARLAI_QC,
+    "ET_QC_500m": _FPARLAI_QC,
+    "Psn_QC_500m": _FPARLAI_QC,
+    "QC_Day": _LST_QC,
+    "QC_Night": _LST_QC,
+    "250m_16_days_VI_Quality": _VI_QUALITY,
+}
+
+
+def _catalog(url, ttl, *keys):
+    """Return the JSON catalog at `url`, cached on disk for `ttl` seconds.
+
+    The async_retriever response cache is bypassed so that `ttl` alone
+    decides how fresh the catalog is.
+    """
+    return utils.cached_json(
+        os.path.join(utils.get_tsget_dir("modis"), *keys),
+        ttl,
+        lambda: json.loads(ar.retrieve_text([url], disable=True)[0]),
+    )
+
+
+def _sinusoidal_tile(lat, lon):
+    """Return the MODIS sinusoidal grid tile "hHHvVV" that contains lat, lon."""
+    radius = 6371007.181
+    tile_size = 1111950.5197665
+    x = radius * np.radians(lon) * np.cos(np.radians(lat))
+    y = radius * np.radians(lat)
+    h = min(int((x + 18 * tile_size) // tile_size), 35)
+    v = min(int((9 * tile_size - y) // tile_size), 17)
+    return f"h{h:02d}v{v:02d}"
+
+
+def _read_points(lat, lon, points=None):
+    """Return the lists of latitudes and longitudes to extract.
+
+    If `points` is given it is a CSV file, or list of (lat, lon) pairs, and
+    `lat` and `lon` are ignored.
+    """
+    if points is not None:
+        if isinstance(points, str):
+            pdf = pd.read_csv(points)
+            pdf.columns = [i.strip().lower() for i in pdf.columns]
+            pdf = pdf.rename(columns={"latitude": "lat", "longitude": "lon"})
+            return pdf["lat"].to_list(), pdf["lon"].to_list()
+        lat, lon = zip(*points)
+    lat = tsutils.make_list(lat)
+    lon = tsutils.make_list(lon)
+    if len(lat) != len(lon):
+        raise ValueError(
+            tsutils.error_wrapper(
+                f"""
+                The 'lat' and 'lon' arguments must have the same number of
+                values.  You gave {len(lat)} latitudes and {len(lon)}
+                longitudes.
+                """
+            )
+        )
+    return list(lat), list(lon)
+
+
+def _decode_subsets(texts):
+    """Decode subset responses into dates and a (date, pixel) data array."""
+    records = [rec for text in texts for rec in json.loads(text)["subset"]]
+    dates = pd.to_datetime([rec["calendar_date"] for rec in records])
+    data = np.array([rec["data"] for rec in records]).reshape(len(records), -1)
+    return dates, data
+
+
+def _valid(band, data):
+    """Return the mask of `data` that is neither fill nor out of range."""
+    valid = data != _MISSING.get(band, np.nan)
+    if band in _VALID_RANGE:
+        low, high = _VALID_RANGE[band]
+        valid &= (data >= low) & (data <= high)
+    return valid
+
+
+def _decode_band(band, data):
+    """Decode the raw integer `data` of `band` to float32 with NaN.
+
+    Fill values and values outside of the valid range are masked and the
+    scale factor and offset applied with the raw integer array as input, so
+    the only array allocated is the float32 result.
+    """
+    valid = _valid(band, data)
+    decoded = np.full(data.shape, np.nan, dtype=np.float32)
+    np.multiply(data, _SCALE.get(band, 1.0), out=decoded, where=valid, casting="unsafe")
+    decoded += _OFFSET.get(band, 0.0)
+    return decoded
+
+
+def _unpack_qc(band, data):
+    """Unpack the bit fields of a quality control band into boolean arrays.
+
+    Fill and out of range pixels have no quality information, so every flag
+    is False for them.
+    """
+    valid = _valid(band, data)
+    data = data.astype(np.int64)
+    return {
+        f"{band}.{name}": valid & (((data >> first) & ((1 << nbits) - 1)) == value)
+        for name, first, nbits, value in _QC_FLAGS.get(band, [])
+    }
+
 
 def date_parser(strdates):
     """Parse a list of dates in the format YYYYDDD, where DDD is day of year."""
@@ -827,7 +996,18 @@ def date_parser(strdates):
 
 
 @tsutils.doc(tsutils.docstrings)
-def modis(lat, lon, product, band, start_date=None, end_date=None):
+def modis(
+    lat,
+    lon,
+    product,
+    band,
+    start_date=None,
+    end_date=None,
+    km_above_below=0,
+    km_left_right=0,
+    points=None,
+    qc_flags=False,
+):
     """
     global:250m,500m,1000m:2000-:4D,8D,16D,A:Download MODIS derived data.
 
@@ -953,13 +1133,13 @@ def modis(lat, lon, product, band, start_date=None, end_date=None):
 
     Parameters
     ----------
-    lat : float
+    lat : float or list of float
         Latitude (required): Enter single geographic point by
-        latitude.
+        latitude, or a list of latitudes to extract several points.
 
-    lon : float
+    lon : float or list of float
         Longitude (required): Enter single geographic point by
-        longitude.
+        longitude, or a list of longitudes matching 'lat'.
 
     product : str
         One of the following values in the 'product'
@@ -1127,9 +1307,9 @@ def modis(lat, lon, product, band, start_date=None, end_date=None):
         |              | Cover Dynamics (LCD) |           |            |
         +--------------+----------------------+-----------+------------+
 
-    band : str
-        One of the following. The 'band' selected from the first column must
-        match the 'product' keyword in the table title.
+    band : str or list of str
+        One or more of the following. The 'band' selected from the first
+        column must match the 'product' keyword in the table title.
 
         ECO4ESIPTJPL
 
@@ -2538,6 +2718,42 @@ def modis(lat, lon, product, band, start_date=None, end_date=None):
 
     ${end_date}
 
+    km_above_below : int
+        [optional, default is 0]
+
+        Kilometers above and below the point to include in the extracted
+        window of pixels.
+
+    km_left_right : int
+        [optional, default is 0]
+
+        Kilometers left and right of the point to include in the extracted
+        window of pixels.
+
+    points : str or list
+        [optional, default is None]
+
+        A CSV file with 'lat' and 'lon' columns, or a list of (lat, lon)
+        pairs, of the points to extract.  If given, 'lat' and 'lon' are
+        ignored.
+
+    qc_flags : bool
+        [optional, default is False]
+
+        If True, unpack the bit fields of the quality control bands
+        "FparLai_QC", "ET_QC_500m", "Psn_QC_500m", "QC_Day", "QC_Night" and
+        "250m_16_days_VI_Quality" into boolean columns named
+        "{band}.{flag}", for example "FparLai_QC.cloud_clear".  All flags
+        are False for fill and out of range quality control values.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One column for each band.  For a single point without a pixel
+        window the index is the date.  Otherwise the index is the tidy
+        (Datetime, latitude, longitude, pixel) combination, with pixels
+        numbered in row major order across the window.
+
     Notes
     -----
     Citation instructions are from https://modis.ornl.gov/citation.html
@@ -2595,103 +2811,130 @@ def modis(lat, lon, product, band, start_date=None, end_date=None):
     visualization and download page. Please modify it manually for
     multiple sites.
     """
-    query_params = {
-        "latitude": lat,
-        "longitude": lon,
-        "product": product,
-        "band": band,
-        "startdate": (
-            pd.to_datetime("1900-01-01T00")
-            if start_date is None
-            else tsutils.parsedate(start_date)
-        ),
-    }
+    lats, lons = _read_points(lat, lon, points)
+    band = tsutils.make_list(band)
 
-    if end_date is None:
-        query_params["enddate"] = datetime.datetime.now()
-    else:
-        query_params["enddate"] = tsutils.parsedate(end_date)
+    start_date = (
+        pd.to_datetime("1900-01-01T00")
+        if start_date is None
+        else tsutils.parsedate(start_date)
+    )
+    end_date = (
+        datetime.datetime.now() if end_date is None else tsutils.parsedate(end_date)
+    )
 
-    products_url = "https://modis.ornl.gov/rst/api/v1/products?tool=GlobalSubset"
-    r_text = ar.retrieve_text([products_url])[0]
-    r_text = json.loads(r_text)
-    pdf = pd.json_normalize(r_text, record_path=["products"])
-    products = pdf["product"].to_list()
+    products = [
+        i["product"]
+        for i in _catalog(
+            f"{_MODIS_URL}/products?tool=GlobalSubset", _CATALOG_TTL, "products.json"
+        )["products"]
+    ]
 
-    if query_params["product"] not in products:
+    if product not in products:
         raise ValueError(
             tsutils.error_wrapper(
                 f"""
                 Available products at the current time are: {products}.
 
-                You gave {query_params["product"]}.
+                You gave {product}.
                 """
             )
         )
 
-    band_url = f"https://modis.ornl.gov/rst/api/v1/{query_params['product']}/bands"
-    r_text = ar.retrieve_text([band_url])[0]
-    r_text = json.loads(r_text)
-    bdf = pd.json_normalize(r_text, record_path=["bands"])
-    bands = bdf["band"].to_list()
+    bands = [
+        i["band"]
+        for i in _catalog(
+            f"{_MODIS_URL}/{product}/bands", _CATALOG_TTL, product, "bands.json"
+        )["bands"]
+    ]
+
+    for bnd in band:
+        if bnd not in bands:
+            raise ValueError(
+                tsutils.error_wrapper(
+                    f"""
+                    'band' argument must be in the following list for 'product'
+                    = {product}. {bands}.
+
+                    You gave me {bnd}.
+                    """
+                )
+            )
+
+    # The subset service takes one band and one point per request, so the
+    # requests for every point and band are collected and retrieved together.
+    keys = []
+    subset_url = []
+    for plat, plon in zip(lats, lons):
+        # Every point in a sinusoidal tile shares the same composite dates, so
+        # the date list is cached per tile rather than per point.
+        ddf = pd.DataFrame(
+            _catalog(
+                f"{_MODIS_URL}/{product}/dates?latitude={plat}&longitude={plon}",
+                _DATES_TTL,
+                product,
+                f"dates_{_sinusoidal_tile(float(plat), float(plon))}.json",
+            )["dates"]
+        )
+        modis_date = ddf["modis_date"].to_numpy()
+        dr = pd.to_datetime(ddf["calendar_date"]).to_numpy()
+
+        sdate = max(pd.Timestamp(start_date), pd.Timestamp(dr[0]))
+        edate = min(pd.Timestamp(end_date), pd.Timestamp(dr[-1]))
+
+        dates = modis_date[(dr >= sdate) & (dr <= edate)]
+        for bnd in band:
+            for i in range(0, len(dates), _MAX_SUBSET_DATES):
+                chunk = dates[i : i + _MAX_SUBSET_DATES]
+                keys.append((plat, plon, bnd))
+                subset_url.append(
+                    f"{_MODIS_URL}/{product}/subset?band={bnd}&latitude={plat}&longitude={plon}&startDate={chunk[0]}&endDate={chunk[-1]}&kmAboveBelow={km_above_below}&kmLeftRight={km_left_right}"
+                )
+    r_text = ar.retrieve_text(subset_url, limit_per_host=_MAX_SUBSET_REQUESTS)
+
+    responses = defaultdict(list)
+    for key, text in zip(keys, r_text):
+        responses[key].append(text)
+
+    sdf = defaultdict(list)
+    for (plat, plon, bnd), texts in responses.items():
+        dates, data = _decode_subsets(texts)
+        npixels = data.shape[1]
+        columns = {bnd: _decode_band(bnd, data).ravel()}
+        if qc_flags:
+            columns.update(
+                {key: val.ravel() for key, val in _unpack_qc(bnd, data).items()}
+            )
+        sdf[(plat, plon)].append(
+            pd.DataFrame(
+                {
+                    "Datetime": np.repeat(dates, npixels),
+                    "latitude": plat,
+                    "longitude": plon,
+                    "pixel": np.tile(np.arange(npixels), len(dates)),
+                    **columns,
+                }
+            ).set_index(["Datetime", "latitude", "longitude", "pixel"])
+        )
 
-    if query_params["band"] not in bands:
+    if not sdf:
         raise ValueError(
             tsutils.error_wrapper(
                 f"""
-                'band' argument must be in the following list for 'product'
-                = {query_params["product"]}. {bands}.
-
-                You gave me {query_params["band"]}.
+                No data is available for product "{product}" and band(s)
+                "{band}" between {start_date} and {end_date}.
                 """
             )
         )
 
-    start_date = query_params["startdate"]
-    end_date = query_params["enddate"]
-
-    dates_url = f"https://modis.ornl.gov/rst/api/v1/{query_params['product']}/dates?latitude={query_params['latitude']}&longitude={query_params['longitude']}"
-    r_text = ar.retrieve_text([dates_url])[0]
-    r_text = json.loads(r_text)
-    ddf = pd.json_normalize(r_text, record_path=["dates"])
-    modis_date = ddf["modis_date"].to_numpy()
-    dates = ddf["calendar_date"].to_list()
-    dates = [pd.to_datetime(i) for i in dates]
-
-    dr = np.array(dates)
-
-    start_date = max(start_date, dr[0])
-
-    enddate = min(end_date, dr[-1])
-
-    mask = (dr >= start_date) & (dr <= enddate)
-    dates = modis_date[mask]
-    dates = [dates[i : i + 10] for i in range(0, len(dates), 10)]
-    subset_url = [
-        f"https://modis.ornl.gov/rst/api/v1/{query_params['product']}/subset?band={query_params['band']}&latitude={query_params['latitude']}&longitude={query_params['longitude']}&startDate={i[0]}&endDate={i[-1]}&kmAboveBelow=0&kmLeftRight=0"
-        for i in dates
-    ]
-    r_text = ar.retrieve_text(subset_url)
-    sdf = [pd.json_normalize(json.loads(i), record_path=["subset"]) for i in r_text]
-    sdf = pd.concat(sdf)
-
-    sdf = sdf.drop(["modis_date", "tile", "proc_date"], axis="columns")
-
-    sdf["data"] = sdf["data"].apply(lambda x: x[0])
-
-    sdf = sdf.set_index(["calendar_date", "band"])
-
-    sdf = sdf.unstack()
-
-    sdf.columns = [y for x, y in sdf.columns]
+    sdf = pd.concat(
+        [pd.concat(pieces, axis="columns") for pieces in sdf.values()]
+    ).sort_index()
 
-    for col in sdf.columns:
-        sdf[col] = sdf[col].replace(to_replace=_MISSING.get(col, pd.NA), value=pd.NA)
-        sdf.loc[sdf[col] < _VALID_RANGE[col][0], col] = pd.NA
-        sdf.loc[sdf[col] > _VALID_RANGE[col][1], col] = pd.NA
-        sdf[col] = sdf[col] * _SCALE.get(col, 1.0) + _OFFSET.get(col, 0.0)
+    # A single pixel at a single point keeps the plain time series layout.
+    if len(lats) == 1 and km_above_below == 0 and km_left_right == 0:
+        sdf = sdf.droplevel(["latitude", "longitude", "pixel"])
 
-    sdf.index.name = "Datetime"
     sdf.columns = [f"{i}:{_UNITS.get(i, '')}" for i in sdf.columns]
     return sdf
 
@@ -19,22 +19,21 @@ ncei_ish            global:station::H:Integrated Surface Database
 """
 
 import datetime
-import email.utils
-import ftplib
+import json
 import os
-import urllib.parse
-import warnings
-from collections import OrderedDict
+import threading
+import time
+from collections import OrderedDict, defaultdict
 from contextlib import contextmanager
 
+import async_retriever as ar
 import numpy as np
 import pandas as pd
-import requests
 from packaging.version import Version
 from platformdirs import user_data_dir
 
 from tsgettoolbox import utils
-from tsgettoolbox.cdo_api_py.cdo_api_py import Client
+from tsgettoolbox.download_utils import dir_list, download_files, open_file_for_url
 from tsgettoolbox.toolbox_utils.src.toolbox_utils import tsutils
 
 
@@ -53,6 +52,8 @@ def get_tsget_dir(sub_dir=None):
 
 
 CIRS_DIR = get_tsget_dir("ncdc/cirs")
+CIRS_FTP_DIR = "ftp://ftp.ncdc.noaa.gov/pub/data/cirs/climdiv/"
+CDO_DIR = get_tsget_dir("ncei/cdo")
 
 NO_DATA_VALUES = {
     "cddc": "-9999.",
@@ -1581,164 +1582,24 @@ def _most_recent(files, element, by_state):
     return sorted(matches, key=_file_key)[0]
 
 
-def dir_list(url):
-    """given a path to a ftp directory, returns a list of files in that
-    directory
+def _download_element_files(elements, by_state):
+    """downloads the most recent file of each element at the same time, returns
+    a dict of element to local path
     """
-    parsed = urllib.parse.urlparse(url)
-    ftp = ftplib.FTP(parsed.netloc, "anonymous")
-    ftp.cwd(parsed.path)
-    return ftp.nlst()
-
-
-def _get_url(element, by_state):
-    ftp_dir = "ftp://ftp.ncdc.noaa.gov/pub/data/cirs/climdiv/"
-    files = dir_list(ftp_dir)
-    most_recent = _most_recent(files, element, by_state)
-    return ftp_dir + most_recent
-
-
-def _path_last_modified(path):
-    """returns a datetime.datetime object representing the last time the file at
-    a given path was last modified
-    """
-    if not os.path.exists(path):
-        return None
-
-    return datetime.datetime.utcfromtimestamp(os.path.getmtime(path))
-
-
-def _request_file_size_matches(request, path):
-    """returns True if request content-length header matches file size"""
-    content_length = request.headers.get("content-length")
-    return bool(content_length and int(content_length) == os.path.getsize(path))
-
-
-def _parse_rfc_1123_timestamp(timestamp_str):
-    return datetime.datetime(*email.utils.parsedate(timestamp_str)[:6])
-
-
-def _request_is_newer_than_file(request, path):
-    """returns true if a request's last-modified header is more recent than a
-    file's last modified timestamp
-    """
-    path_last_modified = _path_last_modified(path)
-
-    if path_last_modified is None:
-        return True
-
-    if not request.headers.get("last-modified"):
-        warnings.warn(
-            f"no last-modified date for request: {request.url}, downloading file again"
+    files = dir_list(CIRS_FTP_DIR)
+    urls_and_paths = {}
+    for element in elements:
+        filename = _most_recent(files, element, by_state)
+        urls_and_paths[element] = (
+            CIRS_FTP_DIR + filename,
+            os.path.join(CIRS_DIR, filename),
         )
-        return True
-
-    request_last_modified = _parse_rfc_1123_timestamp(
-        request.headers.get("last-modified")
-    )
-    return request_last_modified > path_last_modified
-
-
-def _ftp_download_if_new(url, path, check_modified=True):
-    parsed = urllib.parse.urlparse(url)
-    ftp = ftplib.FTP(parsed.netloc, "anonymous")
-    directory, filename = parsed.path.rsplit("/", 1)
-    ftp_last_modified = _ftp_last_modified(ftp, parsed.path)
-    ftp_file_size = _ftp_file_size(ftp, parsed.path)
-
-    if not os.path.exists(path) or os.path.getsize(path) != ftp_file_size:
-        _ftp_download_file(ftp, parsed.path, path)
-    elif check_modified and _path_last_modified(path) < ftp_last_modified:
-        _ftp_download_file(ftp, parsed.path, path)
-
-
-def _ftp_download_file(ftp, ftp_path, local_path):
-    with open(local_path, "wb") as f:
-        ftp.retrbinary(f"RETR {ftp_path}", f.write)
-
-
-def _ftp_file_size(ftp, file_path):
-    ftp.sendcmd("TYPE I")
-    return ftp.size(file_path)
-
-
-def _ftp_last_modified(ftp, file_path):
-    timestamp = ftp.sendcmd(f"MDTM {file_path}").split()[-1]
-    return datetime.datetime.strptime(timestamp, "%Y%m%d%H%M%S")
-
-
-def _http_download_file(url, path):
-    request = requests.get(url, timeout=60)
-    mkdir_if_doesnt_exist(os.path.dirname(path))
-    chunk_size = 64 * 1024
-    with open(path, "wb") as f:
-        for content in request.iter_content(chunk_size):
-            f.write(content)
-
-
-def _http_download_if_new(url, path, check_modified):
-    head = requests.head(url, timeout=60)
-    if not os.path.exists(path) or not _request_file_size_matches(head, path):
-        _http_download_file(url, path)
-    elif check_modified and _request_is_newer_than_file(head, path):
-        _http_download_file(url, path)
-
-
-def download_if_new(url, path, check_modified=True):
-    """downloads the file located at `url` to `path`, if check_modified is True
-    it will only download if the url's last-modified header has a more recent
-    date than the filesystem's last modified date for the file
-    """
-    parsed = urllib.parse.urlparse(url)
-
-    if os.path.exists(path) and not check_modified:
-        return
-
-    if parsed.scheme.startswith("ftp"):
-        _ftp_download_if_new(url, path, check_modified)
-    elif parsed.scheme.startswith("http"):
-        _http_download_if_new(url, path, check_modified)
-    else:
-        raise NotImplementedError("only ftp and http urls are currently implemented")
-
-
-@contextmanager
-def open_file_for_url(url, path, check_modified=True, use_file=None, use_bytes=None):
-    """Context manager that returns an open file handle for a data file;
-    downloading if necessary or otherwise using a previously downloaded file.
-    File downloading will be short-circuited if use_file is either a file path
-    or an open file-like object (i.e. file handler or StringIO obj), in which
-    case the file handler pointing to use_file is returned - if use_file is a
-    file handler then the handler won't be closed upon exit.
-    """
-    leave_open = False
-
-    if use_file is None:
-        download_if_new(url, path, check_modified)
-        open_path = path
-
-    elif hasattr(use_file, "read"):
-        leave_open = True
-        yield use_file
-    else:
-        open_path = use_file
-    open_file = open(open_path) if use_bytes is None else open(open_path, "rb")
-    yield open_file
-
-    if not leave_open:
-        open_file.close()
+    download_files(urls_and_paths.values())
+    return {element: path for element, (_, path) in urls_and_paths.items()}
 
 
 def _get_element_data(element, by_state, use_file, location_names):
-    if use_file:
-        url = None
-        path = None
-    else:
-        url = _get_url(element, by_state)
-        filename = url.rsplit("/", 1)[-1]
-        path = os.path.join(CIRS_DIR, filename)
-
-    with open_file_for_url(url, path, use_file=use_file) as f:
+    with open_file_for_url(None, None, use_file=use_file) as f:
         element_df = _parse_values(f, by_state, location_names, element)
 
     return element_df
@@ -1986,10 +1847,16 @@ def get_data(
             "zndx",
         ]
 
+    if use_file is None:
+        element_files = _download_element_files(elements, by_state)
+
     df = None
 
     for element in elements:
-        element_file = _get_element_file(use_file, element, elements, by_state)
+        if use_file is None:
+            element_file = element_files[element]
+        else:
+            element_file = _get_element_file(use_file, element, elements, by_state)
 
         element_df = _get_element_data(element, by_state, element_file, location_names)
 
@@ -2373,30 +2240,256 @@ def add_units(dfcols):
     return ncols
 
 
+_CDO_URL = "https://www.ncei.noaa.gov/cdo-web/api/v2"
+
+# Page size and quotas documented for the CDO web services.
+_CDO_LIMIT = 1000
+_CDO_PER_SECOND = 5
+_CDO_PER_DAY = 10000
+
+# Maximum span, in calendar years, of a single CDO "data" request.  Annual and
+# monthly datasets allow ten years, everything else is limited to one year.
+_CDO_MAX_YEARS = defaultdict(
+    lambda: 1,
+    {
+        "ANNUAL": 10,
+        "GHCNDMS": 10,
+        "GSOM": 10,
+        "GSOY": 10,
+        "NORMAL_ANN": 10,
+        "NORMAL_MLY": 10,
+    },
+)
+
+# Windows that ended more than this many days ago are considered final and are
+# cached on disk.  More recent windows are always fetched again.
+_CDO_SETTLED_DAYS = 30
+
+
+class _TokenBucket:
+    """Thread safe token bucket that allows `rate` acquisitions per second."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, count=1):
+        """Block until `count` tokens are available, then take them."""
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.rate, self.tokens + (now - self.stamp) * self.rate
+                )
+                self.stamp = now
+                if self.tokens >= count:
+                    self.tokens -= count
+                    return
+                time.sleep((count - self.tokens) / self.rate)
+
+
+_CDO_BUCKET = _TokenBucket(_CDO_PER_SECOND)
+
+
+@contextmanager
+def _cdo_budget_lock():
+    """Hold an exclusive lock on the daily CDO quota across processes."""
+    with open(os.path.join(CDO_DIR, "budget.lock"), "a+b") as fplock:
+        if os.name == "nt":
+            import msvcrt
+
+            fplock.seek(0)
+            msvcrt.locking(fplock.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(fplock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                fplock.seek(0)
+                msvcrt.locking(fplock.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fplock, fcntl.LOCK_UN)
+
+
+def _cdo_spend_budget(count):
+    """Record `count` requests against the daily CDO quota.
+
+    The running total is kept in CDO_DIR so that it survives between calls,
+    and is updated under a file lock so that concurrent processes never spend
+    the same budget.  Raises ValueError instead of sending requests that
+    would exceed the quota.
+    """
+    path = os.path.join(CDO_DIR, "budget.json")
+    today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+    with _cdo_budget_lock():
+        try:
+            with open(path, encoding="ascii") as fpbudget:
+                budget = json.load(fpbudget)
+        except (OSError, ValueError):
+            budget = {}
+        if budget.get("date") != today:
+            budget = {"date": today, "count": 0}
+        if budget["count"] + count > _CDO_PER_DAY:
+            raise ValueError(
+                tsutils.error_wrapper(f"""
+                    The NCEI CDO daily quota of {_CDO_PER_DAY} requests would
+                    be exceeded.  Already used {budget["count"]} requests
+                    today and need {count} more.
+                    """)
+            )
+        budget["count"] += count
+        _cdo_write_cache(path, budget)
+
+
+def _cdo_retrieve(token, urls, params):
+    """Concurrently retrieve CDO JSON, at most _CDO_PER_SECOND per second."""
+    resp = []
+    for i in range(0, len(urls), _CDO_PER_SECOND):
+        chunk = list(zip(urls, params))[i : i + _CDO_PER_SECOND]
+        _cdo_spend_budget(len(chunk))
+        _CDO_BUCKET.acquire(len(chunk))
+        resp.extend(
+            ar.retrieve_json(
+                [url for url, _ in chunk],
+                [{"params": param, "headers": {"token": token}} for _, param in chunk],
+                limit_per_host=_CDO_PER_SECOND,
+                disable=True,
+            )
+        )
+    return resp
+
+
+def _cdo_cache_path(*keys):
+    """Return the cache file path for `keys`, creating directories as needed."""
+    keys = [str(key).replace(":", "_") for key in keys]
+    return os.path.join(get_tsget_dir(os.path.join("ncei/cdo", *keys[:-1])), keys[-1])
+
+
+def _cdo_write_cache(path, data):
+    """Atomically write `data` as JSON to `path`."""
+    with open(f"{path}.tmp", "w", encoding="utf-8") as fpcache:
+        json.dump(data, fpcache)
+    os.replace(f"{path}.tmp", path)
+
+
+def _cdo_station_dates(stationid, token):
+    """Return the (mindate, maxdate) of `stationid`, cached for one day."""
+    path = _cdo_cache_path("stations", f"{stationid}.json")
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < 86400:
+        with open(path, encoding="utf-8") as fpcache:
+            meta = json.load(fpcache)
+    else:
+        meta = _cdo_retrieve(token, [f"{_CDO_URL}/stations/{stationid}"], [{}])[0]
+        _cdo_write_cache(path, meta)
+    return pd.to_datetime(meta["mindate"]), pd.to_datetime(meta["maxdate"])
+
+
+def _cdo_windows(datasetid, start_date, end_date):
+    """Split a date range into calendar aligned CDO request windows.
+
+    Windows are aligned to whole years (or decades) so the same window, and
+    therefore the same cache entry, is reused by any request that overlaps it.
+    """
+    span = _CDO_MAX_YEARS[datasetid]
+    first = start_date.year - start_date.year % span
+    return [
+        (pd.Timestamp(year, 1, 1), pd.Timestamp(year + span - 1, 12, 31))
+        for year in range(first, end_date.year + 1, span)
+    ]
+
+
+def _cdo_get_data(datasetid, stationid, start_date, end_date, token):
+    """Return all CDO "data" results for the station between the dates.
+
+    Cached windows cost no requests.  For the remaining windows the first
+    pages are all requested together, then the record counts in the metadata
+    are used to request every remaining page together.
+    """
+    settled = pd.Timestamp.now().normalize() - pd.Timedelta(days=_CDO_SETTLED_DAYS)
+
+    results = {}
+    fetch = []
+    for window in _cdo_windows(datasetid, start_date, end_date):
+        path = _cdo_cache_path(
+            datasetid, stationid, f"{window[0]:%Y%m%d}_{window[1]:%Y%m%d}.json"
+        )
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as fpcache:
+                results[window] = json.load(fpcache)
+        else:
+            fetch.append(window)
+
+    def _params(window, offset):
+        return {
+            "datasetid": datasetid,
+            "stationid": stationid,
+            "startdate": f"{window[0]:%Y-%m-%d}",
+            "enddate": f"{window[1]:%Y-%m-%d}",
+            "units": "metric",
+            "limit": _CDO_LIMIT,
+            "offset": offset,
+        }
+
+    url = f"{_CDO_URL}/data"
+    pages = []
+    resp = _cdo_retrieve(
+        token, [url] * len(fetch), [_params(window, 1) for window in fetch]
+    )
+    for window, page in zip(fetch, resp):
+        results[window] = page.get("results", [])
+        count = page.get("metadata", {}).get("resultset", {}).get("count", 0)
+        pages.extend(
+            (window, offset) for offset in range(1 + _CDO_LIMIT, count + 1, _CDO_LIMIT)
+        )
+
+    resp = _cdo_retrieve(
+        token, [url] * len(pages), [_params(window, offset) for window, offset in pages]
+    )
+    for (window, _), page in zip(pages, resp):
+        results[window].extend(page.get("results", []))
+
+    for window in fetch:
+        if window[1] < settled:
+            _cdo_write_cache(
+                _cdo_cache_path(
+                    datasetid,
+                    stationid,
+                    f"{window[0]:%Y%m%d}_{window[1]:%Y%m%d}.json",
+                ),
+                results[window],
+            )
+
+    return [item for window in sorted(results) for item in results[window]]
+
+
 def ncei_cdo_json_to_df(datasetid, stationid, start_date=None, end_date=None):
     """Convert a NCEI CDO JSON to a pandas dataframe."""
     # Read in API key
     token = utils.read_api_key("ncei_cdo")
 
-    my_client = Client(token, default_units="metric", default_limit=1000)
-    my_client.verbose = False
+    start_date = pd.to_datetime(start_date)
+    end_date = pd.to_datetime(end_date)
+    if start_date is None or end_date is None:
+        mindate, maxdate = _cdo_station_dates(stationid, token)
+        start_date = mindate if start_date is None else start_date
+        end_date = maxdate if end_date is None else end_date
 
-    df = my_client.get_data_by_station(
-        datasetid=datasetid,
-        stationid=stationid,
-        startdate=pd.to_datetime(start_date),
-        enddate=pd.to_datetime(end_date),
-        return_dateframe=True,
-    )
+    results = _cdo_get_data(datasetid, stationid, start_date, end_date, token)
+    if not results:
+        return pd.DataFrame()
 
-    df.columns = list(df.columns)
+    df = pd.DataFrame(results)
+    df["date"] = pd.to_datetime(df["date"])
+    df = df[(df["date"] >= start_date) & (df["date"] <= end_date)]
+    df = df.pivot_table(values="value", index="date", columns="datatype")
 
-    if "station" in df.columns:
-        df = df.drop("station", axis="columns")
-    if "date" in df.columns:
-        df = df.set_index("date")
-        df.index.name = "Datetime"
-        df.index = pd.to_datetime(df.index)
+    df.columns = list(df.columns)
+    df.index.name = "Datetime"
 
     return df.rename(columns=add_units(df.columns))
 
@@ -4,17 +4,23 @@ ndbc                US station T,6T,10T,15T,H,D:Download historical from
 """
 
 import datetime
+import os
+import tempfile
 from contextlib import suppress
 from gzip import GzipFile
-from io import BytesIO, StringIO
+from io import BytesIO
 
 import async_retriever as ar
+import numpy as np
 import pandas as pd
 
 from tsgettoolbox.toolbox_utils.src.toolbox_utils import tsutils
+from tsgettoolbox.utils import get_tsget_dir
 
 __all__ = ["ndbc"]
 
+NDBC_DIR = get_tsget_dir("ndbc")
+
 _lmap = {
     "stdmet": "h",
     "cwind": "c",
@@ -149,6 +155,17 @@ _rename = {
 for value in _headermap.values():
     _rename.update(value)
 
+# Extension of the files in the realtime2 directory, which holds the last 45
+# days.  There isn't a realtime file for 'wlevel'.
+_realtime_ext = {
+    "stdmet": "txt",
+    "cwind": "cwind",
+    "ocean": "ocean",
+    "adcp": "adcp",
+    "supl": "supl",
+    "srad": "srad",
+}
+
 _mapnumtoname = {
     0: "Jan",
     1: "Feb",
@@ -165,6 +182,11 @@ _mapnumtoname = {
 }
 
 
+# Date columns in the order of the arguments to _datetime_index.  The year
+# column is "#YY" in current files, "YYYY" or "YY" in older ones.
+_date_columns = ("YY", "YYYY", "MM", "DD", "hh", "mm")
+
+
 class BadGzipFile(OSError):
     """Exception raised in some cases for invalid gzip files."""
 
@@ -177,87 +199,194 @@ def date_parser(*x):
     return datetime.datetime(*x)
 
 
-def ndbc_to_df(url, **query_params):
-    """Read NDBC data into a pandas DataFrame."""
+def _datetime_index(year, month, day, hour, minute=0):
+    """Build a DatetimeIndex from integer date columns with array arithmetic."""
+    year = np.where(year < 100, year + 1900, year)
+    months = (year - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (
+        month - 1
+    ).astype("timedelta64[M]")
+    minutes = ((day - 1) * 1440 + hour * 60 + minute).astype("timedelta64[m]")
+    return pd.DatetimeIndex(
+        (months.astype("datetime64[m]") + minutes).astype("datetime64[ns]"),
+        name="datetime",
+    )
+
+
+def _read_ndbc_file(raw):
+    """Parse one NDBC file into a DataFrame indexed by datetime.
+
+    Gzipped files are inflated while the C engine of read_csv parses them,
+    so the decompressed text is never held in memory as a whole.  Date columns are
+    read as integers and data columns as floats.
+    """
+    fpgz = BytesIO(raw)
+    if raw[:2] == b"\x1f\x8b":
+        fpgz = GzipFile(fileobj=fpgz)
+    with fpgz:
+        names = fpgz.readline().decode("ascii").split()
+        start = fpgz.tell()
+        # Newer files have a second header line with units.
+        if not fpgz.readline().decode("ascii").startswith("#"):
+            fpgz.seek(start)
+        names[0] = names[0].lstrip("#")
+        dates = [i for i in names if i in _date_columns]
+        tdf = pd.read_csv(
+            fpgz,
+            header=None,
+            names=names,
+            sep=r"\s+",
+            dtype={i: np.int64 if i in dates else np.float64 for i in names},
+            na_values={
+                i: ["MM", 999.0, 99.0, 9999, 99999] for i in names if i not in dates
+            },
+        )
+    tdf.index = _datetime_index(*[tdf[i].to_numpy() for i in dates])
+    return tdf.drop(columns=dates)
+
+
+def _wlevel_to_long(df):
+    """Reshape the hourly rows of ten 6-minute water levels into one column.
+
+    Each timestamp is the hourly row time plus the minute offset of the
+    column, computed for all samples at once by broadcasting.  Missing
+    samples are dropped before the reshape.
+    """
+    values = df.to_numpy(dtype=np.float64)
+    offsets = np.arange(0, 6 * values.shape[1], 6).astype("timedelta64[m]")
+    index = df.index.to_numpy()[:, None] + offsets[None, :]
+    valid = ~np.isnan(values)
+    return pd.DataFrame(
+        {"WLEVEL:ft:MLLW": values[valid]},
+        index=pd.DatetimeIndex(index[valid], name="Datetime"),
+    )
+
+
+def _utc64(date):
+    """Return `date` as a naive UTC numpy datetime64."""
+    date = pd.Timestamp(date)
+    if date.tzinfo is not None:
+        date = date.tz_convert(None)
+    return date.to_datetime64()
+
+
+def _partition_path(station, table, name):
+    """Return the path of one partition of the local mirror."""
+    return os.path.join(NDBC_DIR, station, table, f"{name}.npz")
+
+
+def _write_partition(path, df):
+    """Store `df` column by column, replacing any earlier partition."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = {f"c{i}": df[col].to_numpy() for i, col in enumerate(df.columns)}
+    fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as fpnpz:
+        np.savez(
+            fpnpz,
+            index=df.index.to_numpy(dtype="datetime64[ns]"),
+            columns=np.array(df.columns, dtype=str),
+            **arrays,
+        )
+    os.replace(tmppath, path)
+
+
+def _read_partition(path, sdate, edate):
+    """Read the rows of one partition between `sdate` and `edate`.
+
+    Only the index is read to find the rows, then the matching slice of each
+    column.
+    """
+    with np.load(path) as npz:
+        index = npz["index"]
+        lo = np.searchsorted(index, sdate, side="left")
+        hi = np.searchsorted(index, edate, side="right")
+        return pd.DataFrame(
+            {col: npz[f"c{i}"][lo:hi] for i, col in enumerate(npz["columns"])},
+            index=pd.DatetimeIndex(index[lo:hi], name="datetime"),
+        )
+
+
+def ndbc_to_df(url, realtime=False, **query_params):
+    """Read NDBC data into a pandas DataFrame.
+
+    Data is served from a local mirror with one partition for each
+    historical year and each month of the current year.  Past years and
+    months are only downloaded once, the current month and the realtime
+    tail are downloaded on every call.
+    """
     sdate = tsutils.parsedate(query_params.pop("startUTC"))
     edate = tsutils.parsedate(query_params.pop("endUTC"))
     if edate is None:
         edate = pd.Timestamp.utcnow()
 
     table = query_params["table"]
-
-    df = pd.DataFrame()
+    station = query_params["station"]
 
     cyear = datetime.datetime.now()
-    filenames = []
+    parts = {}
     for yr in range(sdate.year, edate.year + 1):
+        if yr == cyear.year:
+            continue
         # Yearly
         # https://www.ndbc.noaa.gov/data/historical/stdmet/41012h2012.txt.gz
-        filenames.append(
-            f"{url}/historical/{table}/{query_params['station']}{_lmap[table]}{yr}.txt.gz"
-        )
+        parts[str(yr)] = f"{url}/historical/{table}/{station}{_lmap[table]}{yr}.txt.gz"
     if edate.year == cyear.year:
-        filenames.extend(
-            f"{url}/{table}/{_mapnumtoname[mnth]}/{query_params['station']}{mnth + 1}{yr}.txt.gz"
+        parts.update(
+            (
+                f"{cyear.year}-{mnth + 1:02d}",
+                f"{url}/{table}/{_mapnumtoname[mnth]}/{station}{mnth + 1}{cyear.year}.txt.gz",
+            )
             for mnth in range(edate.month)
         )
-
-    resp = ar.retrieve_binary(filenames, [{}] * len(filenames))
-    resp = [BytesIO(i) for i in resp]
-    nresp = []
-    for i in resp:
-        with suppress(BadGzipFile):
-            nresp.append(GzipFile(fileobj=i).read())
-
-    skiprows = []
-    for r in nresp:
-        f = StringIO(r.decode("utf-8"))
-        _ = f.readline()
-        head2 = f.readline()
-        f.seek(0)
-
-        words2 = head2.split()
-        try:
-            _ = int(words2[0])
-            skiprows = None
-        except ValueError:
-            skiprows = [1]
-
-        tdf = pd.read_csv(
-            f,
-            header=0,
-            skiprows=skiprows,
-            sep=r"\s+",
-            na_values=["MM", 999.0, 99.0, 9999, 99999],
+    if realtime and table in _realtime_ext:
+        parts["realtime"] = f"{url}/realtime2/{station}.{_realtime_ext[table]}"
+
+    current = f"{cyear.year}-{cyear.month:02d}"
+    fetch = {
+        name: fname
+        for name, fname in parts.items()
+        if name in (current, "realtime")
+        or not os.path.exists(_partition_path(station, table, name))
+    }
+    # The current month and the realtime tail change all the time, they
+    # bypass async_retriever's response cache.
+    resp = {}
+    for live in (False, True):
+        names = [name for name in fetch if (name in (current, "realtime")) == live]
+        if not names:
+            continue
+        raws = ar.retrieve_binary(
+            [fetch[name] for name in names],
+            [{}] * len(names),
+            disable=live,
+            raise_status=False,
         )
-
-        if "mm" in tdf.columns:
-            tdf["datetime"] = pd.to_datetime(
-                {
-                    "year": tdf["#YY"],
-                    "month": tdf["MM"],
-                    "day": tdf["DD"],
-                    "hour": tdf["hh"],
-                    "minute": tdf["mm"],
-                }
-            )
-            tdf = tdf.drop(columns=["#YY", "MM", "DD", "hh", "mm"])
-        else:
-            tdf["datetime"] = pd.to_datetime(
-                {
-                    "year": tdf["#YY"],
-                    "month": tdf["MM"],
-                    "day": tdf["DD"],
-                    "hour": tdf["hh"],
-                }
-            )
-            tdf = tdf.drop(columns=["#YY", "MM", "DD", "hh"])
-
-        tdf.set_index("datetime", inplace=True)
-
-        if len(tdf) > 0:
-            tdf.rename(columns=_rename, inplace=True)
-            df = pd.concat([df, tdf])
+        resp.update(zip(names, raws))
+
+    # Missing files are expected, stations don't report every table every
+    # year.  A missing year is only recorded as empty once the historical
+    # file for it should have been published.
+    for name, raw in resp.items():
+        tdf = pd.DataFrame(index=pd.DatetimeIndex([], name="datetime"))
+        if raw is not None:
+            with suppress(OSError, EOFError):
+                tdf = _read_ndbc_file(raw).rename(columns=_rename).sort_index()
+        if len(tdf) > 0 or (name.isdigit() and int(name) < cyear.year - 1):
+            _write_partition(_partition_path(station, table, name), tdf)
+
+    start = _utc64(sdate)
+    if table == "wlevel":
+        # Each wlevel row holds the hour of 6-minute values after it.
+        start = start - np.timedelta64(1, "h")
+    df = []
+    for name in parts:
+        path = _partition_path(station, table, name)
+        if os.path.exists(path):
+            df.append(_read_partition(path, start, _utc64(edate)))
+    df = [i for i in df if len(i) > 0]
+    df = pd.concat(df) if df else pd.DataFrame()
+    # The partitions are in order of precedence, the historical and monthly
+    # files win over the realtime tail.
+    df = df[~df.index.duplicated()]
 
     if len(df) == 0:
         raise ValueError(
@@ -269,14 +398,10 @@ def ndbc_to_df(url, **query_params):
         )
 
     if table == "wlevel":
-        df.columns = list(range(0, 55, 6))
-        df = pd.DataFrame(df.stack())
-        df.index = [i + datetime.timedelta(minutes=j) for i, j in df.index]
-        df.index.name = "Datetime"
-        df.columns = ["WLEVEL:ft:MLLW"]
+        df = _wlevel_to_long(df)
 
     # Clean up the dataframe...
-    df = df.sort_index()
+    df = df.sort_index(kind="stable")
     df = df[~df.index.duplicated()]
 
     df.columns = [i.replace(r"%", "PERCENT") for i in df.columns]
@@ -284,7 +409,7 @@ def ndbc_to_df(url, **query_params):
     return df.loc[sdate:edate, :]
 
 
-def ndbc(station, table, startUTC, endUTC=None):
+def ndbc(station, table, startUTC, endUTC=None, realtime=False):
     r"""US:station::T,6T,10T,15T,H,D:Download historical from the National Data Buoy Center.
 
     Download historical data from the National Data Buoy Center.
@@ -528,9 +653,24 @@ def ndbc(station, table, startUTC, endUTC=None):
         an ISO 8601 date/time string.
         (only seconds are optional)
 
+    realtime
+        [optional, default to False]
+
+        If True also download the realtime data for the last 45 days, which
+        fills the gap until the monthly file for the current month is
+        published.  Not available for the 'wlevel' table.
+
+    Notes
+    -----
+    Downloaded data is kept in a local mirror in the tsgettoolbox data
+    directory, with one file for each station, table, and year.  Past years
+    and months are only downloaded once, the current month and the realtime
+    data are downloaded on every call.
+
     """
     return ndbc_to_df(
         r"https://www.ndbc.noaa.gov/data/",
+        realtime=realtime,
         table=table,
         station=station,
         startUTC=startUTC,
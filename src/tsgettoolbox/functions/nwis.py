@@ -10,15 +10,23 @@ nwis_stat           US station:USGS NWIS Statistic
 """
 
 import logging
+import math
 import os
+import tempfile
+import threading
+import time
 import warnings
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
 from urllib.parse import urlencode
 
 import async_retriever as ar
+import numpy as np
 import pandas as pd
+import requests
 
 from tsgettoolbox.toolbox_utils.src.toolbox_utils import tsutils
+from tsgettoolbox.utils import get_tsget_dir
 
 __all__ = [
     "nwis",
@@ -920,7 +928,11 @@ def _read_rdb(url, kwds):
         raise ValueError(f"{url}?{urlencode(kwds[0])}")
 
     column_names, _, *record = data
+    return _rdb_records_to_df(column_names, record)
 
+
+def _rdb_records_to_df(column_names, record):
+    """Build the DataFrame for the records of a USGS RDB file."""
     rdb_df = pd.DataFrame.from_dict(dict(zip(column_names, d)) for d in record)
 
     rdb_df = rdb_df.replace(to_replace="<NA>", value=pd.NA)
@@ -997,6 +1009,17 @@ def usgs_iv_dv_rdb_to_df(url, **kwargs):
     return ndf
 
 
+def _int_column(column):
+    """Return an RDB column of integers as a numpy array."""
+    return pd.to_numeric(column).to_numpy(dtype="int64")
+
+
+def _month_starts(year, month):
+    """Return datetime64 values for the first day of `year` and `month`."""
+    months = (np.asarray(year) - 1970) * 12 + np.asarray(month) - 1
+    return months.astype("datetime64[M]").astype("datetime64[ns]")
+
+
 def usgs_stat_rdb_to_df(url, **kwargs):
     """Convert from USGS STAT_RDB type to pd.DataFrame."""
     # set defaults.
@@ -1020,33 +1043,38 @@ def usgs_stat_rdb_to_df(url, **kwargs):
     if kwargs["statReportType"] == "daily":
         kwargs["missingData"] = None
 
+    long_format = kwargs.pop("long_format", False)
+
     ndf = _read_rdb(url, [kwargs])
 
+    # The date parts are built with integer arithmetic on whole columns.
     if kwargs["statReportType"] == "daily":
-        ndf["Datetime"] = [
-            f"{int(i):02d}-{int(j):02d}" for i, j in zip(ndf["month_nu"], ndf["day_nu"])
-        ]
+        # Daily statistics don't have a year, so the label is "MM-DD".
+        codes = _int_column(ndf["month_nu"]) * 100 + _int_column(ndf["day_nu"])
+        codes, inverse = np.unique(codes, return_inverse=True)
+        labels = np.array([f"{i // 100:02d}-{i % 100:02d}" for i in codes])
+        ndf["Datetime"] = labels[inverse]
         ndf.drop(["month_nu", "day_nu"], axis=1, inplace=True)
     elif kwargs["statReportType"] == "monthly":
-        ndf["Datetime"] = pd.to_datetime(
-            [f"{i}-{int(j):02d}" for i, j in zip(ndf["year_nu"], ndf["month_nu"])]
+        ndf["Datetime"] = _month_starts(
+            _int_column(ndf["year_nu"]), _int_column(ndf["month_nu"])
         )
         ndf.drop(["year_nu", "month_nu"], axis=1, inplace=True)
     else:
+        years = _int_column(ndf["year_nu"])
         if kwargs["statYearType"] == "water":
-            ndf["Datetime"] = pd.to_datetime(
-                [f"{int(i) - 1}-10-01" for i in ndf["year_nu"]]
-            )
+            ndf["Datetime"] = _month_starts(years - 1, 10)
         else:
-            ndf["Datetime"] = pd.to_datetime(ndf["year_nu"])
+            ndf["Datetime"] = _month_starts(years, 1)
         ndf.drop("year_nu", axis=1, inplace=True)
-    ndf.sort_values(
-        ["agency_cd", "site_no", "parameter_cd", "ts_id", "Datetime"], inplace=True
-    )
-    ndf.set_index(
-        ["agency_cd", "site_no", "parameter_cd", "ts_id", "Datetime"], inplace=True
-    )
-    ndf = ndf.unstack(level=["agency_cd", "site_no", "parameter_cd", "ts_id"])
+
+    levels = ["agency_cd", "site_no", "parameter_cd", "ts_id", "Datetime"]
+    if long_format:
+        return ndf.set_index(levels).sort_index()
+
+    ndf.sort_values(levels, inplace=True)
+    ndf.set_index(levels, inplace=True)
+    ndf = ndf.unstack(level=levels[:-1])
     ndf = ndf.reorder_levels([1, 2, 3, 4, 0], axis=1)
 
     ndf.columns = _make_nice_names(ndf)
@@ -1109,6 +1137,289 @@ statelookup = {
 }
 
 
+NWIS_CATALOG_DIR = get_tsget_dir("nwis/catalog")
+
+_SITE_URL = r"http://waterservices.usgs.gov/nwis/site/"
+
+# Catalog partitions older than this, in seconds, are refreshed with the
+# sites modified since they were downloaded.
+_CATALOG_TTL = 86400
+
+# Largest number of sites in one request for the "sites" partition.
+_CATALOG_MAX_SITES = 100
+
+# The "expanded" table has the site metadata including state, county and
+# HUC, the "series" table has the parameter codes and period of record.
+_CATALOG_PARAMS = {
+    "expanded": {"siteOutput": "expanded"},
+    "series": {"seriesCatalogOutput": "true"},
+}
+
+# The columns of the site service's default (basic) site output, a
+# subset of the "expanded" table.
+_CATALOG_BASIC_COLUMNS = [
+    "agency_cd",
+    "site_no",
+    "station_nm",
+    "site_tp_cd",
+    "dec_lat_va",
+    "dec_long_va",
+    "coord_acy_cd",
+    "dec_coord_datum_cd",
+    "alt_va",
+    "alt_acy_va",
+    "alt_datum_cd",
+    "huc_cd",
+]
+
+# Partitions loaded in this process, keyed by (table, kind, key).
+_CATALOG = {}
+_CATALOG_LOCK = threading.Lock()
+
+
+def _codes(value):
+    """Return a comma separated string or list of codes as a list of str."""
+    if isinstance(value, str):
+        return [i.strip() for i in value.split(",")]
+    return [str(i) for i in value]
+
+
+def _catalog_path(table, kind, key):
+    return os.path.join(NWIS_CATALOG_DIR, table, f"{kind}_{key}.pkl")
+
+
+def _catalog_queries(kind, key, sites=None):
+    """Return the site service queries that download one partition.
+
+    The partitions are a state, a 2-digit HUC region, a 1 degree grid cell,
+    or the "sites" partition of sites looked up by number.
+    """
+    if kind == "state":
+        return [{"stateCd": key}]
+    if kind == "huc":
+        return [{"huc": key}]
+    if kind == "cell":
+        lat, lon = (int(i) for i in key.split("_"))
+        return [{"bBox": f"{lon},{lat},{lon + 1},{lat + 1}"}]
+    return [
+        {"sites": ",".join(sites[i : i + _CATALOG_MAX_SITES])}
+        for i in range(0, len(sites), _CATALOG_MAX_SITES)
+    ]
+
+
+def _catalog_fetch(table, queries):
+    """Download the catalog rows for each query.
+
+    The site service answers a query without matches with a 404 status, that
+    is returned as an empty DataFrame.  Queries that failed for any other
+    reason are returned as None.
+    """
+    params = [
+        {**query, **_CATALOG_PARAMS[table], "siteStatus": "all", "format": "rdb"}
+        for query in queries
+    ]
+    resp = ar.retrieve_text(
+        [_SITE_URL] * len(queries),
+        [{"params": i} for i in params],
+        raise_status=False,
+    )
+    frames = []
+    for text, query_params in zip(resp, params):
+        if text is None:
+            # async_retriever doesn't say why, ask again for the status
+            frames.append(
+                pd.DataFrame(columns=["site_no"])
+                if _catalog_status(query_params) == 404
+                else None
+            )
+            continue
+        lines = [i.split("\t") for i in text.strip().split("\n") if i[:1] != "#"]
+        frames.append(_rdb_records_to_df(lines[0], lines[2:]) if lines else None)
+    return frames
+
+
+def _catalog_status(params):
+    """Return the status code of a site service query, None on error."""
+    try:
+        return requests.get(_SITE_URL, params=params, timeout=60).status_code
+    except requests.exceptions.RequestException:
+        return None
+
+
+def _catalog_upsert(old, new):
+    """Replace the rows of `old` for every site in `new`."""
+    new = [i for i in new if i is not None and len(i) > 0]
+    if not new:
+        return old
+    new = pd.concat(new, ignore_index=True)
+    if old is not None:
+        new = pd.concat([old[~old["site_no"].isin(new["site_no"])], new])
+    return new.set_index("site_no", drop=False).rename_axis(None)
+
+
+def _catalog_save(table, kind, key, part):
+    path = _catalog_path(table, kind, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    pd.to_pickle(part, tmppath)
+    os.replace(tmppath, path)
+
+
+def _catalog_partitions(table, keys, sites=None):
+    """Return the DataFrames of the catalog partitions `keys`.
+
+    Partitions are read from memory or disk, missing partitions are
+    downloaded, and partitions older than _CATALOG_TTL are refreshed with
+    "modifiedSince".  For the "sites" partition the `sites` that are not in
+    it yet are downloaded.  All downloads are made in one batch.  A
+    partition that could not be downloaded is returned as None.
+    """
+    now = time.time()
+    parts = {}
+    queries = []
+    owners = []
+    for kind, key in keys:
+        part = _CATALOG.get((table, kind, key))
+        if part is None:
+            with suppress(Exception):
+                part = pd.read_pickle(_catalog_path(table, kind, key))
+        parts[(kind, key)] = part
+
+        if part is not None and now - part["fetched"] > _CATALOG_TTL:
+            days = math.ceil((now - part["fetched"]) / 86400)
+            sites_in = list(part["df"]["site_no"].unique()) if kind == "sites" else None
+            for query in _catalog_queries(kind, key, sites=sites_in):
+                queries.append({**query, "modifiedSince": f"P{days}D"})
+                owners.append((kind, key, "refresh"))
+        if kind == "sites":
+            missing = list(sites)
+            if part is not None:
+                missing = [i for i in sites if i not in part["df"].index]
+            for query in _catalog_queries(kind, key, sites=missing):
+                queries.append(query)
+                owners.append((kind, key, "add"))
+        elif part is None:
+            for query in _catalog_queries(kind, key):
+                queries.append(query)
+                owners.append((kind, key, "load"))
+
+    new = {}
+    for owner, frame in zip(owners, _catalog_fetch(table, queries) if queries else []):
+        new.setdefault(owner[:2], []).append((owner[2], frame))
+
+    with _CATALOG_LOCK:
+        for (kind, key), frames in new.items():
+            part = parts[(kind, key)]
+            failed = any(how != "add" and frame is None for how, frame in frames)
+            if failed:
+                # Don't cache a partition that failed to download, a grid
+                # cell without any sites is an empty DataFrame instead.
+                continue
+            fetched = part["fetched"] if part is not None else now
+            if any(how != "add" for how, _ in frames):
+                fetched = now
+            df = _catalog_upsert(
+                part["df"] if part is not None else None,
+                [frame for _, frame in frames],
+            )
+            if df is None and kind == "cell":
+                df = pd.DataFrame(columns=["site_no", "dec_lat_va", "dec_long_va"])
+            if df is None:
+                continue
+            part = {"fetched": fetched, "df": df}
+            parts[(kind, key)] = part
+            _catalog_save(table, kind, key, part)
+        for (kind, key), part in parts.items():
+            if part is not None:
+                _CATALOG[(table, kind, key)] = part
+    return [None if parts[k] is None else parts[k]["df"] for k in keys]
+
+
+def _catalog_site_query(kwargs):
+    """Answer a site service query from the local catalog.
+
+    Only queries with one major filter and no other filters are answered
+    locally, for anything else, or if the catalog can't answer, None is
+    returned and the caller queries the site service.
+    """
+    table = "series" if kwargs.get("seriesCatalogOutput") is True else "expanded"
+    if kwargs.get("siteOutput") not in (None, "expanded"):
+        return None
+    if table == "series" and kwargs.get("siteOutput") is not None:
+        return None
+    if kwargs.get("siteStatus") not in (None, "all"):
+        return None
+    filters = {
+        key: value
+        for key, value in kwargs.items()
+        if value is not None
+        and value is not False
+        and key not in ("siteOutput", "siteStatus", "seriesCatalogOutput", "format")
+    }
+    if len(filters) != 1:
+        return None
+    major, value = next(iter(filters.items()))
+    codes = _codes(value)
+
+    if major == "sites":
+        keys = [("sites", "all")]
+        (df,) = _catalog_partitions(table, keys, sites=codes)
+        if df is not None:
+            df = df.loc[df.index.isin(codes)]
+    elif major == "stateCd":
+        keys = [("state", i.upper()) for i in codes]
+        df = _catalog_partitions(table, keys)
+    elif major == "countyCd":
+        keys = []
+        with suppress(KeyError, ValueError):
+            keys = sorted({("state", statelookup[int(i[:2])]) for i in codes})
+        if not keys:
+            return None
+        expanded = _catalog_partitions("expanded", keys)
+        if any(i is None for i in expanded):
+            return None
+        expanded = pd.concat(expanded)
+        county = expanded["state_cd"].astype(str) + expanded["county_cd"].astype(str)
+        sites = expanded.index[county.isin(codes)]
+        df = [expanded] if table == "expanded" else _catalog_partitions(table, keys)
+        df = [i if i is None else i.loc[i.index.isin(sites)] for i in df]
+    elif major == "huc":
+        keys = sorted({("huc", i[:2]) for i in codes})
+        df = []
+        for i in _catalog_partitions(table, keys):
+            if i is not None:
+                i = i.loc[i["huc_cd"].astype(str).str.startswith(tuple(codes))]
+            df.append(i)
+    elif major == "bBox":
+        west, south, east, north = (float(i) for i in codes)
+        keys = [
+            ("cell", f"{lat}_{lon}")
+            for lat in range(math.floor(south), math.floor(north) + 1)
+            for lon in range(math.floor(west), math.floor(east) + 1)
+        ]
+        df = []
+        for i in _catalog_partitions(table, keys):
+            if i is not None:
+                lat = pd.to_numeric(i["dec_lat_va"], errors="coerce")
+                lon = pd.to_numeric(i["dec_long_va"], errors="coerce")
+                i = i.loc[lat.between(south, north) & lon.between(west, east)]
+            df.append(i)
+    else:
+        return None
+
+    if isinstance(df, list):
+        if any(i is None for i in df):
+            return None
+        df = pd.concat(df).drop_duplicates()
+    if df is None or len(df) == 0:
+        return None
+    if table == "expanded" and kwargs.get("siteOutput") is None:
+        # basic site output
+        df = df[[i for i in _CATALOG_BASIC_COLUMNS if i in df.columns]]
+    return df.reset_index(drop=True)
+
+
 def usgs_site_rdb_to_df(url, **kwargs):
     """Convert from USGS RDB type to pd.DataFrame."""
     # Need to enforce rdb format
@@ -1122,6 +1433,11 @@ def usgs_site_rdb_to_df(url, **kwargs):
     if kwargs["outputDataTypeCd"] is not None or kwargs["seriesCatalogOutput"] is True:
         kwargs["siteOutput"] = None
 
+    if url == _SITE_URL:
+        ndf = _catalog_site_query(kwargs)
+        if ndf is not None:
+            return ndf
+
     return _read_rdb(url, [kwargs])
 
 
@@ -1134,11 +1450,16 @@ def usgs_measurements_peak_rdb_to_df(url, **kwargs):
     kwargs["site_no"] = kwargs.get("site_no", kwargs.get("sites", None))
     kwargs.pop("sites")
 
-    # Get the state code and insert into URL
-    r = usgs_site_rdb_to_df(url, **kwargs)
+    # Get the state code from the local site catalog and insert into URL
+    (r,) = _catalog_partitions(
+        "expanded", [("sites", "all")], sites=_codes(kwargs["site_no"])[:1]
+    )
     try:
-        url = url.replace("XX", statelookup[int(r.loc[0, "state_cd"])].lower())
-    except KeyError as e:
+        state_cd = r.loc[_codes(kwargs["site_no"])[0], "state_cd"]
+        if isinstance(state_cd, pd.Series):
+            state_cd = state_cd.iloc[0]
+        url = url.replace("XX", statelookup[int(state_cd)].lower())
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
         raise ValueError(
             tsutils.error_wrapper(
                 """
@@ -1636,8 +1957,16 @@ def nwis_site(
     ${siteName}
     ${siteNameMatchOperator}
     ${hasDataTypeCd}
+
+    Notes
+    -----
+    Queries that only use one of `sites`, `stateCd`, `countyCd`, `huc`, or
+    `bBox` are answered from a local catalog of sites in the tsgettoolbox
+    data directory.  The catalog is downloaded by state, 2-digit HUC, or 1
+    degree grid cell the first time it is needed and afterwards refreshed
+    once a day with only the sites modified since.
     """
-    url = r"http://waterservices.usgs.gov/nwis/site/"
+    url = _SITE_URL
     return usgs_site_rdb_to_df(
         url,
         sites=sites,
@@ -2151,6 +2480,7 @@ def nwis_stat(
     statType=None,
     missingData=None,
     statYearType=None,
+    long_format=False,
 ):
     r"""US:station:::USGS NWIS Statistic
 
@@ -2258,6 +2588,13 @@ def nwis_stat(
     ${statType}
     ${missingData}
     ${statYearType}
+    long_format
+        [optional, default is False]
+
+        If True return one row for each agency, site, parameter, time series
+        and date, with a column for each statistic, instead of one column for
+        each combination.  This avoids a very wide, mostly empty table when
+        requesting many sites.
     """
     url = r"http://waterservices.usgs.gov/nwis/stat/"
     return usgs_stat_rdb_to_df(
@@ -2285,9 +2622,152 @@ def nwis_stat(
         statType=statType,
         missingData=missingData,
         statYearType=statYearType,
+        long_format=long_format,
     )
 
 
+_WQP_URL = r"https://www.waterqualitydata.us/data/Result/search"
+
+_WQP_CODES_URL = r"https://www.waterqualitydata.us/Codes/countycode"
+
+# Number of split requests streamed at the same time.
+_WQP_WORKERS = 4
+
+# The Result profile is read as strings, except for these columns.
+_WQP_FLOAT_COLUMNS = (
+    "ActivityDepthHeightMeasure/MeasureValue",
+    "ActivityTopDepthHeightMeasure/MeasureValue",
+    "ActivityBottomDepthHeightMeasure/MeasureValue",
+    "ResultDepthHeightMeasure/MeasureValue",
+    "DetectionQuantitationLimitMeasure/MeasureValue",
+)
+_WQP_DATE_COLUMNS = ("ActivityStartDate", "ActivityEndDate", "AnalysisStartDate")
+
+
+class _WqpWriter:
+    """Collect chunks of WQP results, or append them to a CSV/Parquet file.
+
+    Chunks can come from several threads, each write holds a lock so that
+    the output file has a single writer.
+    """
+
+    def __init__(self, output=None):
+        self.output = output
+        self.frames = []
+        self._lock = threading.Lock()
+        self._parquet = None
+        self._schema = None
+        self._header = True
+
+    def write(self, chunk):
+        with self._lock:
+            if self.output is None:
+                self.frames.append(chunk)
+            elif self.output.endswith(".parquet"):
+                self._write_parquet(chunk)
+            else:
+                chunk.to_csv(
+                    self.output,
+                    mode="w" if self._header else "a",
+                    header=self._header,
+                    index=False,
+                )
+                self._header = False
+
+    def _write_parquet(self, chunk):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ValueError(
+                tsutils.error_wrapper(
+                    """
+                    Writing Parquet output requires the "pyarrow" package.
+                    """
+                )
+            ) from exc
+
+        if self._parquet is None:
+            fields = []
+            for col, dtype in chunk.dtypes.items():
+                if pd.api.types.is_float_dtype(dtype):
+                    fields.append((col, pa.float64()))
+                elif pd.api.types.is_datetime64_any_dtype(dtype):
+                    fields.append((col, pa.timestamp("ns")))
+                else:
+                    fields.append((col, pa.string()))
+            self._schema = pa.schema(fields)
+            self._parquet = pq.ParquetWriter(self.output, self._schema)
+        self._parquet.write_table(
+            pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False)
+        )
+
+    def close(self):
+        """Finish the output and return the collected DataFrame, if any."""
+        if self._parquet is not None:
+            self._parquet.close()
+        if self.output is not None:
+            return None
+        return (
+            pd.concat(self.frames, ignore_index=True) if self.frames else pd.DataFrame()
+        )
+
+
+def _wqp_stream(query_params, writer, columns=None, chunksize=100000):
+    """Parse one WQP Result/search response in chunks as it is downloaded."""
+    with requests.get(_WQP_URL, params=query_params, stream=True, timeout=600) as resp:
+        resp.raise_for_status()
+        resp.raw.decode_content = True
+        # Files need the same schema in every chunk, in memory the columns
+        # are inferred, so ResultMeasureValue stays numeric.
+        dtype = None if writer.output is None else str
+        for chunk in pd.read_csv(
+            resp.raw, dtype=dtype, usecols=columns, chunksize=chunksize
+        ):
+            for col in chunk.columns.intersection(_WQP_FLOAT_COLUMNS):
+                chunk[col] = pd.to_numeric(chunk[col], errors="coerce")
+            for col in chunk.columns.intersection(_WQP_DATE_COLUMNS):
+                chunk[col] = pd.to_datetime(
+                    chunk[col], format="%Y-%m-%d", errors="coerce"
+                )
+            writer.write(chunk)
+
+
+def _wqp_splits(query_params, split_by):
+    """Split one WQP query into one query per county or HUC."""
+    if split_by is None:
+        return [query_params]
+    if split_by not in ("county", "huc"):
+        raise ValueError(
+            tsutils.error_wrapper(
+                f"""
+                The "split_by" argument must be None, "county", or "huc", not
+                "{split_by}".
+                """
+            )
+        )
+    key = "countycode" if split_by == "county" else "huc"
+    if key in query_params:
+        codes = query_params[key].split(";")
+    elif split_by == "county" and "statecode" in query_params:
+        codes = ar.retrieve_json(
+            [_WQP_CODES_URL],
+            [{"params": {"statecode": query_params["statecode"], "mimeType": "json"}}],
+        )[0]["codes"]
+        codes = [i["value"] for i in codes]
+    else:
+        raise ValueError(
+            tsutils.error_wrapper(
+                f"""
+                Splitting by "{split_by}" requires "{key}" with one or more
+                codes separated by semicolons.  Splitting by "county" can also
+                use "statecode".
+                """
+            )
+        )
+    return [{**query_params, key: code} for code in codes]
+
+
 @tsutils.doc(nwis_docstrings)
 def epa_wqp(
     bBox=None,
@@ -2308,6 +2788,10 @@ def epa_wqp(
     activityId=None,
     startDateLo=None,
     startDateHi=None,
+    columns=None,
+    output=None,
+    chunksize=100000,
+    split_by=None,
 ):
     r"""US:station::E:EPA Water Quality Portal.
 
@@ -2479,6 +2963,46 @@ def epa_wqp(
 
         Date of last desired data-collection activity.  A very wide range of
         date strings can be used but the closer to ISO 8601 the better.
+
+    columns : str
+        [optional, default is None]
+
+        Only return these columns of the result.  At the command line can
+        supply a comma separated list of column names.  Using the Python API
+        needs to be a Python list.
+
+    output : str
+        [optional, default is None]
+
+        Write the results to this file instead of returning them.  The file
+        is written in chunks as the results are downloaded, so the memory
+        used does not depend on the size of the result.  If the name ends in
+        ".parquet" a Parquet file is written, which requires the "pyarrow"
+        package, otherwise a CSV file.
+
+    chunksize : int
+        [optional, default is 100000]
+
+        Number of rows parsed and written at a time.
+
+    split_by : str
+        [optional, default is None]
+
+        Split the query into one request per county ("county") or HUC
+        ("huc") and download them at the same time.  Splitting by county
+        uses the semicolon separated `countycode` list, or every county of
+        `statecode`.  Splitting by HUC uses the semicolon separated `huc`
+        list.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The results, or None if `output` is given.
+
+    Notes
+    -----
+    Columns are read as strings except for the depth and detection limit
+    measure values, which are floats, and the activity and analysis dates.
     """
     if (
         not bBox
@@ -2529,10 +3053,12 @@ def epa_wqp(
         )
 
     if countycode:
-        countycode = ":".join([countrycode, statecode, countycode])
+        countycode = ";".join(
+            f"{countrycode}:{statecode}:{i}" for i in str(countycode).split(";")
+        )
 
     if statecode:
-        statecode = ":".join([countrycode, statecode])
+        statecode = f"{countrycode}:{statecode}"
 
     query_params = {
         "bBox": bBox,
@@ -2564,17 +3090,25 @@ def epa_wqp(
             startDateHi, strftime="%m-%d-%Y"
         )
 
-    url = r"https://www.waterqualitydata.us/data/Result/search"
     if os.path.exists("debug_tsgettoolbox"):
-        logging.warning(url, query_params)
+        logging.warning(_WQP_URL, query_params)
 
     query_params = {
         key: value for key, value in query_params.items() if value is not None
     }
-    resp = ar.retrieve_binary([url], [{"params": query_params}])
+    columns = tsutils.make_list(columns)
 
-    ndf = [pd.read_csv(BytesIO(i)) for i in resp]
-    ndf = pd.concat(ndf)
+    writer = _WqpWriter(output)
+    try:
+        with ThreadPoolExecutor(max_workers=_WQP_WORKERS) as executor:
+            futures = [
+                executor.submit(_wqp_stream, params, writer, columns, chunksize)
+                for params in _wqp_splits(query_params, split_by)
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        ndf = writer.close()
     return ndf
 
 
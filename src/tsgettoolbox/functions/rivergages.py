@@ -3,13 +3,8 @@ rivergages          US station:USACE river gages
 """
 
 import datetime
-import email.utils
-import ftplib
 import os
 import ssl
-import urllib.parse
-import warnings
-from contextlib import contextmanager
 
 import pandas as pd
 import requests
@@ -17,6 +12,7 @@ from bs4 import BeautifulSoup
 from platformdirs import user_data_dir
 from requests.adapters import HTTPAdapter
 
+from tsgettoolbox.download_utils import download_if_new
 from tsgettoolbox.toolbox_utils.src.toolbox_utils import tsutils
 
 URL = "https://rivergages.mvr.usace.army.mil/WaterControl/datamining2.cfm"
@@ -70,141 +66,11 @@ def _parse_options(options):
     }
 
 
-def _path_last_modified(path):
-    """returns a datetime.datetime object representing the last time the file at
-    a given path was last modified
-    """
-    if not os.path.exists(path):
-        return None
-
-    return datetime.datetime.utcfromtimestamp(os.path.getmtime(path))
-
-
-def _request_file_size_matches(request, path):
-    """returns True if request content-length header matches file size"""
-    content_length = request.headers.get("content-length")
-    return bool(content_length and int(content_length) == os.path.getsize(path))
-
-
-def _parse_rfc_1123_timestamp(timestamp_str):
-    return datetime.datetime(*email.utils.parsedate(timestamp_str)[:6])
-
-
-def _request_is_newer_than_file(request, path):
-    """returns true if a request's last-modified header is more recent than a
-    file's last modified timestamp
-    """
-    path_last_modified = _path_last_modified(path)
-
-    if path_last_modified is None:
-        return True
-
-    if not request.headers.get("last-modified"):
-        warnings.warn(
-            f"no last-modified date for request: {request.url}, downloading file again"
-        )
-        return True
-
-    request_last_modified = _parse_rfc_1123_timestamp(
-        request.headers.get("last-modified")
-    )
-    return request_last_modified > path_last_modified
-
-
-def _ftp_download_if_new(url, path, check_modified=True):
-    parsed = urllib.parse.urlparse(url)
-    ftp = ftplib.FTP(parsed.netloc, "anonymous")
-    directory, filename = parsed.path.rsplit("/", 1)
-    ftp_last_modified = _ftp_last_modified(ftp, parsed.path)
-    ftp_file_size = _ftp_file_size(ftp, parsed.path)
-
-    if not os.path.exists(path) or os.path.getsize(path) != ftp_file_size:
-        _ftp_download_file(ftp, parsed.path, path)
-    elif check_modified and _path_last_modified(path) < ftp_last_modified:
-        _ftp_download_file(ftp, parsed.path, path)
-
-
-def _ftp_download_file(ftp, ftp_path, local_path):
-    with open(local_path, "wb") as f:
-        ftp.retrbinary(f"RETR {ftp_path}", f.write)
-
-
-def _ftp_file_size(ftp, file_path):
-    ftp.sendcmd("TYPE I")
-    return ftp.size(file_path)
-
-
-def _ftp_last_modified(ftp, file_path):
-    timestamp = ftp.sendcmd(f"MDTM {file_path}").split()[-1]
-    return datetime.datetime.strptime(timestamp, "%Y%m%d%H%M%S")
-
-
-def _http_download_file(url, path):
-    request = sess.get(url, timeout=60, verify=False)
-    mkdir_if_doesnt_exist(os.path.dirname(path))
-    chunk_size = 64 * 1024
-    with open(path, "wb") as f:
-        for content in request.iter_content(chunk_size):
-            f.write(content)
-
-
-def _http_download_if_new(url, path, check_modified):
-    head = sess.head(url, timeout=60, verify=False)
-    if not os.path.exists(path) or not _request_file_size_matches(head, path):
-        _http_download_file(url, path)
-    elif check_modified and _request_is_newer_than_file(head, path):
-        _http_download_file(url, path)
-
-
-def download_if_new(url, path, check_modified=True):
-    """downloads the file located at `url` to `path`, if check_modified is True
-    it will only download if the url's last-modified header has a more recent
-    date than the filesystem's last modified date for the file
-    """
-    parsed = urllib.parse.urlparse(url)
-
-    if os.path.exists(path) and not check_modified:
-        return
-
-    if parsed.scheme.startswith("ftp"):
-        _ftp_download_if_new(url, path, check_modified)
-    elif parsed.scheme.startswith("http"):
-        _http_download_if_new(url, path, check_modified)
-    else:
-        raise NotImplementedError("only ftp and http urls are currently implemented")
-
-
-@contextmanager
-def open_file_for_url(url, path, check_modified=True, use_file=None, use_bytes=None):
-    """Context manager that returns an open file handle for a data file;
-    downloading if necessary or otherwise using a previously downloaded file.
-    File downloading will be short-circuited if use_file is either a file path
-    or an open file-like object (i.e. file handler or StringIO obj), in which
-    case the file handler pointing to use_file is returned - if use_file is a
-    file handler then the handler won't be closed upon exit.
-    """
-    leave_open = False
-
-    if use_file is None:
-        download_if_new(url, path, check_modified)
-        open_path = path
-
-    elif hasattr(use_file, "read"):
-        leave_open = True
-        yield use_file
-    else:
-        open_path = use_file
-    open_file = open(open_path) if use_bytes is None else open(open_path, "rb")
-    yield open_file
-
-    if not leave_open:
-        open_file.close()
-
-
 def get_stations():
     path = os.path.join(USACE_RIVERGAGES_DIR, "datamining_field_list.cfm")
 
-    with open_file_for_url(URL, path, use_bytes=True) as f:
+    download_if_new(URL, path, session=sess, verify=False)
+    with open(path, "rb") as f:
         soup = BeautifulSoup(f, features="lxml")
         options = soup.find("select", id="fld_station").find_all("option")
         stations = _parse_options(options)
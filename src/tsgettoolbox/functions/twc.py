@@ -4,12 +4,9 @@ twc                 US/TX station D:Download Texas Weather Connection
 """
 
 import datetime
-import email.utils
-import ftplib
 import os
-import urllib.parse
-import warnings
-from contextlib import contextmanager
+import tempfile
+from contextlib import suppress
 from io import StringIO
 
 import async_retriever as ar
@@ -17,12 +14,22 @@ import numpy as np
 import pandas as pd
 import requests
 
+from tsgettoolbox.download_utils import open_file_for_url
 from tsgettoolbox.toolbox_utils.src.toolbox_utils import tsutils
+from tsgettoolbox.utils import get_tsget_dir
 
 __all__ = ["twc"]
 
 CSV_SWITCHOVER = pd.Timestamp("2016-10-01")
 
+TWC_DIR = get_tsget_dir("twc/kbdi")
+
+_KBDI_COLUMNS = ["KBDI_MIN", "KBDI_MAX", "KBDI_AVG"]
+
+# Days without a file are only recorded in the archive once they are this
+# old, recent files might still be posted.
+_SETTLED_DAYS = 7
+
 
 def _get_text_url(date):
     return f"http://twc.tamu.edu/weather_images/summ/summ{date.strftime('%Y%m%d')}.txt"
@@ -81,167 +88,6 @@ def _parse_csv_file(data_file):
     return dataframe
 
 
-def _path_last_modified(path):
-    """returns a datetime.datetime object representing the last time the file at
-    a given path was last modified
-    """
-    if not os.path.exists(path):
-        return None
-
-    return datetime.datetime.utcfromtimestamp(os.path.getmtime(path))
-
-
-def _request_file_size_matches(request, path):
-    """returns True if request content-length header matches file size"""
-    content_length = request.headers.get("content-length")
-    return bool(content_length and int(content_length) == os.path.getsize(path))
-
-
-def _parse_rfc_1123_timestamp(timestamp_str):
-    return datetime.datetime(*email.utils.parsedate(timestamp_str)[:6])
-
-
-def _request_is_newer_than_file(request, path):
-    """returns true if a request's last-modified header is more recent than a
-    file's last modified timestamp
-    """
-    path_last_modified = _path_last_modified(path)
-
-    if path_last_modified is None:
-        return True
-
-    if not request.headers.get("last-modified"):
-        warnings.warn(
-            f"no last-modified date for request: {request.url}, downloading file again"
-        )
-        return True
-
-    request_last_modified = _parse_rfc_1123_timestamp(
-        request.headers.get("last-modified")
-    )
-    return request_last_modified > path_last_modified
-
-
-def _ftp_download_if_new(url, path, check_modified=True):
-    parsed = urllib.parse.urlparse(url)
-    ftp = ftplib.FTP(parsed.netloc, "anonymous")
-    directory, filename = parsed.path.rsplit("/", 1)
-    ftp_last_modified = _ftp_last_modified(ftp, parsed.path)
-    ftp_file_size = _ftp_file_size(ftp, parsed.path)
-
-    if not os.path.exists(path) or os.path.getsize(path) != ftp_file_size:
-        _ftp_download_file(ftp, parsed.path, path)
-    elif check_modified and _path_last_modified(path) < ftp_last_modified:
-        _ftp_download_file(ftp, parsed.path, path)
-
-
-def _ftp_download_file(ftp, ftp_path, local_path):
-    with open(local_path, "wb") as f:
-        ftp.retrbinary(f"RETR {ftp_path}", f.write)
-
-
-def _ftp_file_size(ftp, file_path):
-    ftp.sendcmd("TYPE I")
-    return ftp.size(file_path)
-
-
-def _ftp_last_modified(ftp, file_path):
-    timestamp = ftp.sendcmd(f"MDTM {file_path}").split()[-1]
-    return datetime.datetime.strptime(timestamp, "%Y%m%d%H%M%S")
-
-
-def mkdir_if_doesnt_exist(dir_path):
-    """makes a directory if it doesn't exist"""
-    if not os.path.exists(dir_path):
-        os.makedirs(dir_path)
-
-
-def _http_download_file(url, path):
-    request = requests.get(url, timeout=60)
-    mkdir_if_doesnt_exist(os.path.dirname(path))
-    chunk_size = 64 * 1024
-    with open(path, "wb") as f:
-        for content in request.iter_content(chunk_size):
-            f.write(content)
-
-
-def _http_download_if_new(url, path, check_modified):
-    head = requests.head(url, timeout=60)
-    if not os.path.exists(path) or not _request_file_size_matches(head, path):
-        _http_download_file(url, path)
-    elif check_modified and _request_is_newer_than_file(head, path):
-        _http_download_file(url, path)
-
-
-def download_if_new(url, path, check_modified=True):
-    """downloads the file located at `url` to `path`, if check_modified is True
-    it will only download if the url's last-modified header has a more recent
-    date than the filesystem's last modified date for the file
-    """
-    parsed = urllib.parse.urlparse(url)
-
-    if os.path.exists(path) and not check_modified:
-        return
-
-    if parsed.scheme.startswith("ftp"):
-        _ftp_download_if_new(url, path, check_modified)
-    elif parsed.scheme.startswith("http"):
-        _http_download_if_new(url, path, check_modified)
-    else:
-        raise NotImplementedError("only ftp and http urls are currently implemented")
-
-
-@contextmanager
-def open_file_for_url(url, path, check_modified=True, use_file=None, use_bytes=None):
-    """Context manager that returns an open file handle for a data file;
-    downloading if necessary or otherwise using a previously downloaded file.
-    File downloading will be short-circuited if use_file is either a file path
-    or an open file-like object (i.e. file handler or StringIO obj), in which
-    case the file handler pointing to use_file is returned - if use_file is a
-    file handler then the handler won't be closed upon exit.
-    """
-    leave_open = False
-
-    if use_file is None:
-        download_if_new(url, path, check_modified)
-        open_path = path
-
-    elif hasattr(use_file, "read"):
-        leave_open = True
-        yield use_file
-    else:
-        open_path = use_file
-    open_file = open(open_path) if use_bytes is None else open(open_path, "rb")
-    yield open_file
-
-    if not leave_open:
-        open_file.close()
-
-    """Context manager that returns an open file handle for a data file;
-    downloading if necessary or otherwise using a previously downloaded file.
-    File downloading will be short-circuited if use_file is either a file path
-    or an open file-like object (i.e. file handler or StringIO obj), in which
-    case the file handler pointing to use_file is returned - if use_file is a
-    file handler then the handler won't be closed upon exit.
-    """
-    leave_open = False
-
-    if use_file is None:
-        download_if_new(url, path, check_modified)
-        open_path = path
-
-    elif hasattr(use_file, "read"):
-        leave_open = True
-        yield use_file
-    else:
-        open_path = use_file
-    open_file = open(open_path) if use_bytes is None else open(open_path, "rb")
-    yield open_file
-
-    if not leave_open:
-        open_file.close()
-
-
 def _open_data_file(url, data_dir):
     """returns an open file handle for a data file; downloading if necessary or
     otherwise using a previously downloaded file
@@ -551,6 +397,83 @@ def convert_date(date):
     return pd.Timestamp(date).date()
 
 
+def _kbdi_url(date):
+    """Return the URL of the county summary for `date`."""
+    ext = "txt" if date < CSV_SWITCHOVER else "csv"
+    return (
+        f"https://twc.tamu.edu/weather_images/summ/summ{date.strftime('%Y%m%d')}.{ext}"
+    )
+
+
+def _parse_kbdi(date, text):
+    """Parse the county summary for `date` into a DataFrame."""
+    if date < CSV_SWITCHOVER:
+        resp = pd.read_fwf(
+            StringIO(text),
+            skiprows=[0, 1],
+            header=None,
+            usecols=[0, 1, 2, 3],
+        )
+        resp.columns = ["COUNTY", "KBDI_AVG", "KBDI_MAX", "KBDI_MIN"]
+    else:
+        resp = pd.read_csv(
+            StringIO(text),
+            header=0,
+            usecols=[0, 1, 2, 3],
+        )
+        resp.columns = ["COUNTY", "KBDI_MIN", "KBDI_MAX", "KBDI_AVG"]
+
+    resp = resp[["COUNTY"] + _KBDI_COLUMNS].dropna()
+    resp["COUNTY"] = resp["COUNTY"].str.upper()
+    resp[_KBDI_COLUMNS] = resp[_KBDI_COLUMNS].astype("float64")
+    resp["Date"] = date
+    return resp
+
+
+def _confirm_absent(dates):
+    """Return the set of `dates` the server answers with 404 Not Found."""
+    absent = set()
+    with requests.Session() as session:
+        for date in dates:
+            with suppress(requests.exceptions.RequestException):
+                if session.head(_kbdi_url(date), timeout=60).status_code == 404:
+                    absent.add(date)
+    return absent
+
+
+def _archive_path(year):
+    return os.path.join(TWC_DIR, f"{year}.npz")
+
+
+def _read_archive(year):
+    """Return the days already fetched and the archived counties of `year`."""
+    with suppress(OSError), np.load(_archive_path(year)) as npz:
+        return npz["days"], pd.DataFrame(
+            {
+                "COUNTY": npz["county"],
+                **{col: npz[col] for col in _KBDI_COLUMNS},
+                "Date": npz["date"].astype("datetime64[ns]"),
+            }
+        )
+    return np.array([], dtype="datetime64[D]"), pd.DataFrame(
+        columns=["COUNTY"] + _KBDI_COLUMNS + ["Date"]
+    )
+
+
+def _write_archive(year, days, df):
+    """Store the counties of `year` column by column."""
+    fd, tmppath = tempfile.mkstemp(dir=TWC_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as fpnpz:
+        np.savez(
+            fpnpz,
+            days=np.asarray(days, dtype="datetime64[D]"),
+            county=df["COUNTY"].to_numpy(dtype=str),
+            date=df["Date"].to_numpy(dtype="datetime64[D]"),
+            **{col: df[col].to_numpy(dtype="float64") for col in _KBDI_COLUMNS},
+        )
+    os.replace(tmppath, _archive_path(year))
+
+
 @tsutils.transform_args(county=tsutils.make_list)
 def get_data(county, start=None, end=None):
     """
@@ -587,43 +510,60 @@ def get_data(county, start=None, end=None):
 
     county = [inv_codes.get(c, c) for c in county]
 
-    data_df = []
-    for date in dates:
-        if date < CSV_SWITCHOVER:
-            resp = pd.read_fwf(
-                StringIO(
-                    ar.retrieve_text(
-                        [
-                            f"https://twc.tamu.edu/weather_images/summ/summ{date.strftime('%Y%m%d')}.txt"
-                        ]
-                    )[0]
-                ),
-                skiprows=[0, 1],
-                header=None,
-                usecols=[0, 1, 2, 3],
-            )
-
-            resp.columns = ["COUNTY", "KBDI_AVG", "KBDI_MAX", "KBDI_MIN"]
-        else:
-            resp = pd.read_csv(
-                StringIO(
-                    ar.retrieve_text(
-                        [
-                            f"https://twc.tamu.edu/weather_images/summ/summ{date.strftime('%Y%m%d')}.csv"
-                        ]
-                    )[0]
-                ),
-                header=0,
-                usecols=[0, 1, 2, 3],
-            )
-            resp.columns = ["COUNTY", "KBDI_MIN", "KBDI_MAX", "KBDI_AVG"]
+    # Read what is archived for each year and collect the missing days.
+    archives = {}
+    missing = []
+    for year, ydates in dates.groupby(dates.year).items():
+        archives[year] = _read_archive(year)
+        missing.extend(ydates[~ydates.isin(archives[year][0])])
+
+    resp = []
+    if missing:
+        resp = ar.retrieve_text(
+            [_kbdi_url(date) for date in missing], raise_status=False
+        )
 
-        resp = resp[["COUNTY", "KBDI_MIN", "KBDI_MAX", "KBDI_AVG"]].dropna()
-        resp["COUNTY"] = resp["COUNTY"].str.upper()
-        resp = resp.loc[resp["COUNTY"].isin(county), :]
-        resp["Date"] = date
+    today = pd.Timestamp(datetime.date.today())
+    settled = today - pd.Timedelta(days=_SETTLED_DAYS)
+    # A settled day is only recorded as missing when the server confirms
+    # there is no file, other failures are retried on the next call.
+    absent = _confirm_absent(
+        [date for date, text in zip(missing, resp) if text is None and date < settled]
+    )
+    updated = {}
+    for date, text in zip(missing, resp):
+        # Today's file might still change.
+        if date >= today or (text is None and date not in absent):
+            continue
+        days, frames = updated.setdefault(
+            date.year, ([archives[date.year][0]], [archives[date.year][1]])
+        )
+        days.append([date.to_datetime64()])
+        if text is not None:
+            frames.append(_parse_kbdi(date, text))
+    for year, (days, frames) in updated.items():
+        frames = [i for i in frames if len(i) > 0] or frames[:1]
+        archives[year] = (np.concatenate(days), pd.concat(frames))
+        _write_archive(year, *archives[year])
 
-        data_df.append(resp)
+    data_df = []
+    for days, df in archives.values():
+        data_df.append(df.loc[df["Date"].isin(dates) & df["COUNTY"].isin(county)])
+    for date, text in zip(missing, resp):
+        if date >= today and text is not None:
+            df = _parse_kbdi(date, text)
+            data_df.append(df.loc[df["COUNTY"].isin(county)])
+    data_df = [i for i in data_df if len(i) > 0]
+
+    if not data_df:
+        raise ValueError(
+            tsutils.error_wrapper(
+                f"""
+                No KBDI data available for county "{county}" between
+                "{start_date}" and "{end_date}".
+                """
+            )
+        )
 
     df = pd.concat(data_df)
     df = df.reset_index()
@@ -358,9 +358,31 @@ def main():
 
     @cltoolbox.command("modis", formatter_class=HelpFormatter)
     @tsutils.copy_doc(modis)
-    def modis_cli(lat, lon, product, band, start_date=None, end_date=None):
+    def modis_cli(
+        lat,
+        lon,
+        product,
+        band,
+        start_date=None,
+        end_date=None,
+        km_above_below=0,
+        km_left_right=0,
+        points=None,
+        qc_flags=False,
+    ):
         tsutils.printiso(
-            modis(lat, lon, product, band, start_date=start_date, end_date=end_date)
+            modis(
+                lat,
+                lon,
+                product,
+                band,
+                start_date=start_date,
+                end_date=end_date,
+                km_above_below=km_above_below,
+                km_left_right=km_left_right,
+                points=points,
+                qc_flags=qc_flags,
+            )
         )
 
     @cltoolbox.command("ncei_ghcnd_ftp", formatter_class=HelpFormatter)
@@ -497,8 +519,10 @@ def main():
 
     @cltoolbox.command("ndbc", formatter_class=HelpFormatter)
     @tsutils.copy_doc(ndbc)
-    def ndbc_cli(station, table, startUTC, endUTC=None):
-        tsutils.printiso(ndbc(station, table, startUTC, endUTC=endUTC))
+    def ndbc_cli(station, table, startUTC, endUTC=None, realtime=False):
+        tsutils.printiso(
+            ndbc(station, table, startUTC, endUTC=endUTC, realtime=realtime)
+        )
 
     @cltoolbox.command("nwis", formatter_class=HelpFormatter)
     @tsutils.copy_doc(nwis)
@@ -927,6 +951,7 @@ def main():
         statType=None,
         missingData=None,
         statYearType=None,
+        long_format=False,
     ):
         tsutils.printiso(
             nwis_stat(
@@ -953,6 +978,7 @@ def main():
                 statType=statType,
                 missingData=missingData,
                 statYearType=statYearType,
+                long_format=long_format,
             )
         )
 
@@ -977,29 +1003,37 @@ def main():
         activityId=None,
         startDateLo=None,
         startDateHi=None,
+        columns=None,
+        output=None,
+        chunksize=100000,
+        split_by=None,
     ):
-        tsutils.printiso(
-            epa_wqp(
-                bBox=bBox,
-                lat=lat,
-                lon=lon,
-                within=within,
-                countrycode=countrycode,
-                statecode=statecode,
-                countycode=countycode,
-                siteType=siteType,
-                organization=organization,
-                siteid=siteid,
-                huc=huc,
-                sampleMedia=sampleMedia,
-                characteristicType=characteristicType,
-                characteristicName=characteristicName,
-                pCode=pCode,
-                activityId=activityId,
-                startDateLo=startDateLo,
-                startDateHi=startDateHi,
-            )
+        ndf = epa_wqp(
+            bBox=bBox,
+            lat=lat,
+            lon=lon,
+            within=within,
+            countrycode=countrycode,
+            statecode=statecode,
+            countycode=countycode,
+            siteType=siteType,
+            organization=organization,
+            siteid=siteid,
+            huc=huc,
+            sampleMedia=sampleMedia,
+            characteristicType=characteristicType,
+            characteristicName=characteristicName,
+            pCode=pCode,
+            activityId=activityId,
+            startDateLo=startDateLo,
+            startDateHi=startDateHi,
+            columns=columns,
+            output=output,
+            chunksize=chunksize,
+            split_by=split_by,
         )
+        if output is None:
+            tsutils.printiso(ndf)
 
     @cltoolbox.command("rivergages", formatter_class=HelpFormatter)
     @tsutils.copy_doc(rivergages)
@@ -2,6 +2,19 @@
 .. include:: ../ulmo/cuahsi/wof/README.rst
 """
 
-__all__ = ["core", "get_site_info", "get_sites", "get_values", "get_variable_info"]
+__all__ = [
+    "core",
+    "get_multiple_values",
+    "get_site_info",
+    "get_sites",
+    "get_values",
+    "get_variable_info",
+]
 from . import core
-from .core import get_site_info, get_sites, get_values, get_variable_info
+from .core import (
+    get_multiple_values,
+    get_site_info,
+    get_sites,
+    get_values,
+    get_variable_info,
+)
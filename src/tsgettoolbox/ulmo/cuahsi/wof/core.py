@@ -6,16 +6,47 @@ This module provides direct access to `CUAHSI WaterOneFlow`_ web services.
 .. _CUAHSI WaterOneFlow: https://his.cuahsi.org/wofws.html
 """
 
+import concurrent.futures
+import contextlib
+import datetime
 import io
+import logging
 import os
+import queue
+import threading
 
 import isodate
+import requests
 import suds.client
+import suds.options
+import suds.transport.https
+from lxml import etree
 from suds.cache import ObjectCache
 
 from ... import util, waterml
 
-_suds_client = None
+# suds clients keyed by (wsdl_url, suds_cache, user_cache); each entry holds
+# the client that parsed the WSDL and a queue of idle clones that share it
+_suds_clients = {}
+_suds_clients_lock = threading.Lock()
+
+# connection pool used for streamed GetValuesObject requests
+_session = requests.Session()
+
+# errors of a single GetValues request, suds' urllib transport raises
+# OSError subclasses for network errors
+_REQUEST_ERRORS = (
+    OSError,
+    ValueError,
+    etree.XMLSyntaxError,
+    requests.exceptions.RequestException,
+    suds.MethodNotFound,
+    suds.WebFault,
+    suds.transport.TransportError,
+)
+
+# set up logger
+log = logging.getLogger(__name__)
 
 
 def get_sites(wsdl_url, suds_cache=("default",), timeout=None, user_cache=False):
@@ -49,16 +80,17 @@ def get_sites(wsdl_url, suds_cache=("default",), timeout=None, user_cache=False)
     sites_dict : dict
         a python dict with site codes mapped to site information
     """
-    suds_client = _get_client(wsdl_url, suds_cache, timeout, user_cache)
+    with _pooled_client(wsdl_url, suds_cache, timeout, user_cache) as suds_client:
+        waterml_version = _waterml_version(suds_client)
+        if waterml_version == "1.0":
+            response = suds_client.service.GetSitesXml("")
+        elif waterml_version == "1.1":
+            response = suds_client.service.GetSites("")
 
-    waterml_version = _waterml_version(suds_client)
+    response_buffer = io.BytesIO(util.to_bytes(response))
     if waterml_version == "1.0":
-        response = suds_client.service.GetSitesXml("")
-        response_buffer = io.BytesIO(util.to_bytes(response))
         sites = waterml.v1_0.parse_site_infos(response_buffer)
     elif waterml_version == "1.1":
-        response = suds_client.service.GetSites("")
-        response_buffer = io.BytesIO(util.to_bytes(response))
         sites = waterml.v1_1.parse_site_infos(response_buffer)
 
     return {site["network"] + ":" + site["code"]: site for site in list(sites.values())}
@@ -99,16 +131,14 @@ def get_site_info(
     site_info : dict
         a python dict containing site information
     """
-    suds_client = _get_client(wsdl_url, suds_cache, timeout, user_cache)
+    with _pooled_client(wsdl_url, suds_cache, timeout, user_cache) as suds_client:
+        waterml_version = _waterml_version(suds_client)
+        response = suds_client.service.GetSiteInfo(site_code)
 
-    waterml_version = _waterml_version(suds_client)
+    response_buffer = io.BytesIO(util.to_bytes(response))
     if waterml_version == "1.0":
-        response = suds_client.service.GetSiteInfo(site_code)
-        response_buffer = io.BytesIO(util.to_bytes(response))
         sites = waterml.v1_0.parse_sites(response_buffer)
     elif waterml_version == "1.1":
-        response = suds_client.service.GetSiteInfo(site_code)
-        response_buffer = io.BytesIO(util.to_bytes(response))
         sites = waterml.v1_1.parse_sites(response_buffer)
 
     if len(sites) == 0:
@@ -185,8 +215,6 @@ def get_values(
     of '1753-01-01' has been known to return valid results while catching the oldest
     start times, though the response may be broken up into chunks ('paged').
     """
-    suds_client = _get_client(wsdl_url, suds_cache, timeout, user_cache)
-
     # Note from Emilio:
     #   Not clear if WOF servers really do handle time zones (time offsets or
     #   "Z" in the iso8601 datetime strings. In the past, I (Emilio) have
@@ -206,20 +234,86 @@ def get_values(
         end_datetime = util.convert_datetime(end)
         end_dt_isostr = isodate.datetime_isoformat(end_datetime)
 
-    waterml_version = _waterml_version(suds_client)
-    response = suds_client.service.GetValues(
-        site_code, variable_code, startDate=start_dt_isostr, endDate=end_dt_isostr
-    )
-
-    response_buffer = io.BytesIO(util.to_bytes(response))
-    if waterml_version == "1.0":
-        values = waterml.v1_0.parse_site_values(response_buffer)
-    elif waterml_version == "1.1":
-        values = waterml.v1_1.parse_site_values(response_buffer)
+    with _pooled_client(wsdl_url, suds_cache, timeout, user_cache) as suds_client:
+        values = _get_values(
+            suds_client, site_code, variable_code, start_dt_isostr, end_dt_isostr
+        )
 
     return list(values.values())[0] if variable_code is not None else values
 
 
+def get_multiple_values(
+    queries,
+    start=None,
+    end=None,
+    suds_cache=("default",),
+    timeout=None,
+    user_cache=False,
+    max_workers=4,
+):
+    """
+    Retrieves values for many sites and variables, possibly from several
+    WaterOneFlow services, with concurrent GetValues requests.
+
+    Parameters
+    ----------
+    queries : list of tuples
+        (wsdl_url, site_code, variable_code) tuples, see ``get_values()``.
+        Requests to the same service share its parsed WSDL description and its
+        connections.
+    start : ``None`` or datetime (see :ref:`dates-and-times`)
+        Start of the query datetime range, see ``get_values()``.
+    end : ``None`` or datetime (see :ref:`dates-and-times`)
+        End of the query datetime range, see ``get_values()``.
+    suds_cache : ``None`` or tuple
+        SOAP local cache duration for WSDL description and client object, see
+        ``get_values()``.
+    timeout : int or float
+        suds SOAP URL open timeout (seconds).
+        If unspecified, the suds default (90 seconds) will be used.
+    user_cache : bool
+        If False (default), use the system temp location to store cache WSDL and
+        other files. Use the default user ulmo directory if True.
+    max_workers : int
+        Maximum number of requests made at the same time.
+
+    Returns
+    -------
+    values_dict : dict
+        a python dict with each (wsdl_url, site_code, variable_code) query
+        mapped to its values as returned by ``get_values()``, or to ``None`` if
+        the request failed
+    """
+
+    def _query_values(query):
+        wsdl_url, site_code, variable_code = query
+        return get_values(
+            wsdl_url,
+            site_code,
+            variable_code,
+            start=start,
+            end=end,
+            suds_cache=suds_cache,
+            timeout=timeout,
+            user_cache=user_cache,
+        )
+
+    values_dict = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_query_values, tuple(query)): tuple(query)
+            for query in queries
+        }
+        for future in concurrent.futures.as_completed(futures):
+            query = futures[future]
+            try:
+                values_dict[query] = future.result()
+            except _REQUEST_ERRORS as e:
+                log.warning(f"GetValues request {query} failed: {e}")
+                values_dict[query] = None
+    return values_dict
+
+
 def get_variable_info(
     wsdl_url,
     variable_code=None,
@@ -263,10 +357,9 @@ def get_variable_info(
         `None` (default) then this will be a nested set of dicts keyed by
         <vocabulary>:<variable_code>
     """
-    suds_client = _get_client(wsdl_url, suds_cache, timeout, user_cache)
-
-    waterml_version = _waterml_version(suds_client)
-    response = suds_client.service.GetVariableInfo(variable_code)
+    with _pooled_client(wsdl_url, suds_cache, timeout, user_cache) as suds_client:
+        waterml_version = _waterml_version(suds_client)
+        response = suds_client.service.GetVariableInfo(variable_code)
     response_buffer = io.BytesIO(util.to_bytes(response))
 
     if waterml_version == "1.0":
@@ -295,11 +388,44 @@ def _waterml_version(suds_client):
         )
 
 
+def _client_key(wsdl_url, suds_cache, user_cache):
+    return (
+        wsdl_url,
+        None if suds_cache is None else tuple(suds_cache),
+        bool(user_cache),
+    )
+
+
+def _clone_client(suds_client):
+    """A lightweight copy of suds_client that shares its parsed WSDL, like
+    suds.client.Client.clone(), which fails with infinite recursion while deep
+    copying the options in some suds versions"""
+
+    class _Clone(suds.client.Client):
+        def __init__(self):
+            pass
+
+    clone = _Clone()
+    clone.options = suds.options.Options()
+    clone.options.transport = suds.transport.https.HttpAuthenticated()
+    clone.set_options(
+        cache=suds_client.options.cache, timeout=suds_client.options.timeout
+    )
+    clone.wsdl = suds_client.wsdl
+    clone.factory = suds_client.factory
+    clone.service = suds.client.ServiceSelector(clone, suds_client.wsdl.services)
+    clone.sd = suds_client.sd
+    clone.messages = {"tx": None, "rx": None}
+    return clone
+
+
 def _get_client(wsdl_url, suds_cache=("default",), suds_timeout=None, user_cache=False):
     """
-    Open and re-use (persist) a suds.client.Client instance _suds_client throughout
-    the session, to minimize WOF server impact and improve performance.  _suds_client
-    is global in scope.
+    Open and re-use (persist) a suds.client.Client instance for each WSDL
+    throughout the session, to minimize WOF server impact and improve
+    performance.  Clients are kept in _suds_clients, keyed by WSDL url and
+    cache settings, so alternating between services does not parse their WSDL
+    descriptions again.
 
     Parameters
     ----------
@@ -322,37 +448,122 @@ def _get_client(wsdl_url, suds_cache=("default",), suds_timeout=None, user_cache
 
     Returns
     -------
-    _suds_client : suds Client
+    suds_client : suds Client
         Newly or previously instantiated (reused) suds Client object.
     """
-    global _suds_client
-
-    # Handle new or changed client request (create new client)
-    if (
-        _suds_client is None
-        or _suds_client.wsdl.url != wsdl_url
-        or suds_timeout is not None
-    ):
+    key = _client_key(wsdl_url, suds_cache, user_cache)
+    entry = _suds_clients.get(key)
+
+    # Handle new client request (create new client)
+    if entry is None:
         if user_cache:
             cache_dir = os.path.join(util.get_ulmo_dir(), "suds")
             util.mkdir_if_doesnt_exist(cache_dir)
-            _suds_client = suds.client.Client(
+            suds_client = suds.client.Client(
                 wsdl_url, cache=ObjectCache(location=cache_dir)
             )
         else:
-            _suds_client = suds.client.Client(wsdl_url)
+            suds_client = suds.client.Client(wsdl_url)
 
         if suds_cache is None:
-            _suds_client.set_options(cache=None)
+            suds_client.set_options(cache=None)
         else:
-            cache = _suds_client.options.cache
+            cache = suds_client.options.cache
             # could add some error catching ...
             if suds_cache[0] == "default":
-                cache.setduration(days=1)
+                duration = {"days": 1}
             else:
-                cache.setduration(**dict([suds_cache]))
+                duration = dict([suds_cache])
+            if hasattr(cache, "setduration"):
+                cache.setduration(**duration)
+            else:
+                # suds-community caches only have a duration attribute
+                cache.duration = datetime.timedelta(**duration)
+
+        with _suds_clients_lock:
+            entry = _suds_clients.setdefault(key, (suds_client, queue.SimpleQueue()))
 
+    suds_client = entry[0]
     if suds_timeout is not None:
-        _suds_client.set_options(timeout=suds_timeout)
+        suds_client.set_options(timeout=suds_timeout)
 
-    return _suds_client
+    return suds_client
+
+
+def _get_values(suds_client, site_code, variable_code, start, end):
+    """Makes a GetValues request and parses the response. The response of a
+    GetValuesObject request is streamed into the waterml parser where the
+    service supports it, otherwise GetValues is used."""
+    waterml_version = _waterml_version(suds_client)
+    if waterml_version == "1.0":
+        parse_site_values = waterml.v1_0.parse_site_values
+    elif waterml_version == "1.1":
+        parse_site_values = waterml.v1_1.parse_site_values
+
+    try:
+        return _stream_values(
+            suds_client, parse_site_values, site_code, variable_code, start, end
+        )
+    except (
+        requests.exceptions.RequestException,
+        etree.XMLSyntaxError,
+        suds.MethodNotFound,
+    ) as e:
+        log.debug(f"GetValuesObject failed, falling back to GetValues: {e}")
+
+    response = suds_client.service.GetValues(
+        site_code, variable_code, startDate=start, endDate=end
+    )
+    return parse_site_values(io.BytesIO(util.to_bytes(response)))
+
+
+@contextlib.contextmanager
+def _pooled_client(
+    wsdl_url, suds_cache=("default",), suds_timeout=None, user_cache=False
+):
+    """Checks out a suds client for wsdl_url for the duration of a request.
+    Clients are clones that share the parsed WSDL of _get_client(wsdl_url)
+    and go back to the pool afterwards, so concurrent requests never share a
+    client."""
+    suds_client = _get_client(wsdl_url, suds_cache, None, user_cache)
+    idle = _suds_clients[_client_key(wsdl_url, suds_cache, user_cache)][1]
+    try:
+        pooled_client = idle.get_nowait()
+    except queue.Empty:
+        pooled_client = _clone_client(suds_client)
+    if suds_timeout is not None:
+        pooled_client.set_options(timeout=suds_timeout)
+    try:
+        yield pooled_client
+    finally:
+        idle.put(pooled_client)
+
+
+def _stream_values(
+    suds_client, parse_site_values, site_code, variable_code, start, end
+):
+    """Sends a GetValuesObject request built by suds over the shared session
+    and parses the response as it is read"""
+    suds_client.set_options(nosend=True)
+    try:
+        request = suds_client.service.GetValuesObject(
+            site_code, variable_code, startDate=start, endDate=end
+        )
+    finally:
+        suds_client.set_options(nosend=False)
+
+    method = suds_client.service.GetValuesObject.method
+    headers = {
+        "Content-Type": "text/xml; charset=utf-8",
+        "SOAPAction": method.soap.action,
+    }
+    with _session.post(
+        method.location,
+        data=request.envelope,
+        headers=headers,
+        stream=True,
+        timeout=suds_client.options.timeout,
+    ) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return parse_site_values(response.raw)
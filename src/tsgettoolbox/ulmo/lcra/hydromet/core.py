@@ -9,15 +9,19 @@ River Basin (Texas) provided by the `Lower Colorado River Authority`_
 .. _Hydromet: http://hydromet.lcra.org
 """
 
+import concurrent.futures
 import datetime
 import logging
+import time
 
+import lxml.html
 import numpy as np
 import pandas
 import requests
 from bs4 import BeautifulSoup
 from dateutil.relativedelta import relativedelta
 from geojson import Feature, FeatureCollection, Point
+from lxml import etree
 
 from ... import util
 
@@ -43,6 +47,12 @@ PARAMETERS = {
 
 current_data_services = ["GetLowerBasin", "GetUpperBasin"]
 
+# seconds a current data response is reused for
+CURRENT_DATA_CACHE_SECONDS = 60
+
+# {service: (monotonic time fetched, response content)}
+_current_data_cache = {}
+
 # in the site list by parameter web page, in order to make distinction between
 # stage measurements in lake and stream, the LCRA uses 'stage' for stream sites
 # and 'lake' for lake sites
@@ -135,22 +145,34 @@ def get_current_data(service, as_geojson=False):
     else:
         log.info(f"service {service} not recognized")
         return {}
-    request_body = request_body_template % service
-    headers = {"Content-Type": "text/xml; charset=utf-8"}
-    res = requests.post(
-        CURRENT_DATA_URL, data=request_body, headers=headers, timeout=10
-    )
-    if res.status_code != 200:
-        log.info(f"http request failed with status code {res.status_code}")
-        return {}
-    soup = BeautifulSoup(res.content)
-    sites_els = soup.findAll(f"cls{service.lower().replace('get', '')}")
+    cached = _current_data_cache.get(service)
+    if cached is not None and time.monotonic() - cached[0] < CURRENT_DATA_CACHE_SECONDS:
+        content = cached[1]
+    else:
+        request_body = request_body_template % service
+        headers = {"Content-Type": "text/xml; charset=utf-8"}
+        res = requests.post(
+            CURRENT_DATA_URL, data=request_body, headers=headers, timeout=10
+        )
+        if res.status_code != 200:
+            log.info(f"http request failed with status code {res.status_code}")
+            return {}
+        content = res.content
+        _current_data_cache[service] = (time.monotonic(), content)
+
+    site_tag = f"cls{service.lower().replace('get', '')}"
+    sites_els = [
+        el
+        for el in etree.fromstring(content).iter(etree.Element)
+        if etree.QName(el).localname.lower() == site_tag
+    ]
     current_values_dicts = [_parse_current_values(site_el) for site_el in sites_els]
     if not as_geojson:
         return current_values_dicts
+    sites = get_all_sites()["features"]
     features = []
     for value_dict in current_values_dicts:
-        feature = _feature_for_values_dict(value_dict)
+        feature = _feature_for_values_dict(value_dict, sites)
         if len(feature):
             features.append(feature[0])
     if len(features) != len(current_values_dicts):
@@ -165,6 +187,7 @@ def get_site_data(
     start_date=None,
     end_date=None,
     dam_site_location="head",
+    max_workers=4,
 ):
     """Fetches site's parameter data
 
@@ -186,6 +209,9 @@ def get_site_data(
         dictionary.
     dam_site_location : 'head' (default) or 'tail'
         The site location relative to the dam.
+    max_workers : int
+        Date ranges longer than 180 days are fetched in 180 day chunks, at
+        most max_workers at the same time.
 
     Returns
     -------
@@ -196,43 +222,46 @@ def get_site_data(
     if parameter_code.lower() not in PARAMETERS:
         log.info(f"{parameter_code} is not an LCRA parameter")
         return None
-    initial_request = requests.get(HISTORICAL_DATA_URL, timeout=10)
-    if initial_request.status_code != 200:
-        return None
-    list_request_headers = {
-        "__EVENTTARGET": "DropDownList1",
-        "DropDownList1": site_code,
-    }
-    list_request = _make_next_request(
-        HISTORICAL_DATA_URL, initial_request, list_request_headers
-    )
-    if list_request.status_code != 200:
-        return None
-
-    if parameter_code == "STAGE" and site_code in dam_sites:
-        parameter_code = dam_site_location.upper()
-    elif (
-        parameter_code == "STAGE"
-        or parameter_code != "RHUMID"
-        and parameter_code == "FLOW"
-    ):
-        parameter_code = "STAGE"
-    elif parameter_code == "RHUMID":
-        parameter_code = "Rhumid"
-    if start_date is None:
-        start_date = datetime.date.today()
-    if end_date is None:
-        end_date = datetime.date.today() + relativedelta(days=1)
-    if (end_date - start_date).days < 180:
-        values_dict = _get_data(
-            site_code[:4], parameter_code, list_request, start_date, end_date
+    # one session per query carries the ASP.NET session cookie and pools the
+    # connections of the chunk requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    with session:
+        initial_request = session.get(HISTORICAL_DATA_URL, timeout=10)
+        if initial_request.status_code != 200:
+            return None
+        list_request_headers = {
+            "__EVENTTARGET": "DropDownList1",
+            "DropDownList1": site_code,
+        }
+        list_request = _make_next_request(
+            HISTORICAL_DATA_URL, initial_request, list_request_headers, session=session
         )
-        if not values_dict:
+        if list_request.status_code != 200:
             return None
-    else:
-        values_dict = []
-        chunks = np.ceil((end_date - start_date).days / 180.0)
-        for chunk in np.arange(chunks) + 1:
+
+        if parameter_code == "STAGE" and site_code in dam_sites:
+            parameter_code = dam_site_location.upper()
+        elif (
+            parameter_code == "STAGE"
+            or parameter_code != "RHUMID"
+            and parameter_code == "FLOW"
+        ):
+            parameter_code = "STAGE"
+        elif parameter_code == "RHUMID":
+            parameter_code = "Rhumid"
+        if start_date is None:
+            start_date = datetime.date.today()
+        if end_date is None:
+            end_date = datetime.date.today() + relativedelta(days=1)
+
+        # the form state of the site list page is the same for every chunk
+        list_payload = _extract_headers_for_next_request(list_request)
+
+        def _get_chunk(chunk):
             request_start_date = start_date + relativedelta(days=180 * (chunk - 1))
             chunk_end_date = start_date + relativedelta(days=180 * chunk)
             request_end_date = (
@@ -242,16 +271,44 @@ def get_site_data(
                 "getting chunk: %i, start: %s, end: %s, parameter: %s"
                 % (chunk, request_start_date, request_end_date, parameter_code)
             )
-            values_chunk = _get_data(
+            df = _get_data(
                 site_code[:4],
                 parameter_code,
                 list_request,
                 request_start_date,
                 request_end_date,
+                session=session,
+                payload=list_payload,
             )
-            values_dict += values_chunk
+            if df is None:
+                log.warning(
+                    f"chunk {chunk} ({request_start_date} to {request_end_date}) "
+                    f"of {parameter_code} at {site_code} failed, the returned "
+                    "data has a gap"
+                )
+            return df
+
+        if (end_date - start_date).days < 180:
+            df = _get_data(
+                site_code[:4],
+                parameter_code,
+                list_request,
+                start_date,
+                end_date,
+                session=session,
+                payload=list_payload,
+            )
+            if df is None or df.empty:
+                return None
+        else:
+            chunks = np.arange(np.ceil((end_date - start_date).days / 180.0)) + 1
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers
+            ) as executor:
+                dfs = [df for df in executor.map(_get_chunk, chunks) if df is not None]
+            df = pandas.concat(dfs) if dfs else pandas.DataFrame({})
 
-    df = _values_dict_to_df(values_dict).astype(float)
+    df = _clean_data_df(df).astype(float)
 
     return df if as_dataframe else df.to_dict("records")
 
@@ -262,8 +319,9 @@ def _create_feature(row):
     return Feature(geometry=geometry, properties=site_props)
 
 
-def _feature_for_values_dict(site_values_dict):
-    sites = get_all_sites()["features"]
+def _feature_for_values_dict(site_values_dict, sites=None):
+    if sites is None:
+        sites = get_all_sites()["features"]
     return [
         _update_feature_props(site, site_values_dict)
         for site in sites
@@ -273,43 +331,35 @@ def _feature_for_values_dict(site_values_dict):
 
 
 def _parse_current_values(site_el):
-    site_value_els = site_el.findChildren()
     site_values = {}
-    for value_el in site_value_els:
-        if value_el.name.lower() == "datetime":
-            site_values[value_el.name.lower()] = (
-                None
-                if value_el.get_text().strip() == ""
-                else util.convert_datetime(value_el.get_text())
+    for value_el in site_el.iterdescendants(etree.Element):
+        name = etree.QName(value_el).localname.lower()
+        text = "".join(value_el.itertext())
+        if name == "datetime":
+            site_values[name] = (
+                None if text.strip() == "" else util.convert_datetime(text)
             )
-        elif value_el.name.lower() == "location":
-            site_values[value_el.name.lower()] = value_el.get_text().strip()
-        elif value_el.get_text().strip() == "":
-            site_values[value_el.name.lower()] = None
+        elif name == "location":
+            site_values[name] = text.strip()
+        elif text.strip() == "":
+            site_values[name] = None
         else:
-            site_values[value_el.name.lower()] = float(value_el.get_text())
+            site_values[name] = float(text)
     return site_values
 
 
-def _values_dict_to_df(values_dict):
-    if not values_dict:
-        return pandas.DataFrame({})
-    df = pandas.DataFrame(values_dict)
-    df.index = df["Date - Time"].apply(util.convert_datetime)
-    df.drop("Date - Time", axis=1, inplace=True)
+def _clean_data_df(df):
+    if df.empty:
+        return df
     df = df.sort_index()
     df = df.dropna(axis=1, how="all")
     df = df.dropna(axis=0, how="all")
     return df
 
 
-def _get_row_values(row, columns):
-    value_els = row.findAll("td")
-    values = [_parse_val(value_el.get_text()) for value_el in value_els]
-    return dict(zip(columns, values))
-
-
-def _get_data(site_code, parameter_code, list_request, start, end):
+def _get_data(
+    site_code, parameter_code, list_request, start, end, session=None, payload=None
+):
     data_request_headers = {
         "Date1": start.strftime("%m/%d/%Y"),
         "Date2": end.strftime("%m/%d/%Y"),
@@ -318,21 +368,54 @@ def _get_data(site_code, parameter_code, list_request, start, end):
 
     data_request_headers["DropDownList2"] = parameter_code
     data_request = _make_next_request(
-        HISTORICAL_DATA_URL, list_request, data_request_headers
+        HISTORICAL_DATA_URL,
+        list_request,
+        data_request_headers,
+        session=session,
+        payload=payload,
     )
 
     if data_request.status_code != 200:
         return None
 
-    soup = BeautifulSoup(data_request.content, "html.parser")
-    columns = [col.get_text() for col in soup.findAll("th")]
-    return [_get_row_values(row, columns) for row in soup.findAll("tr")[1:]]
+    return _parse_data_table(data_request.content)
+
+
+def _parse_data_table(content):
+    """parses the data table of a chronhist.aspx page in one pass into a
+    dataframe indexed by "Date - Time" with float columns"""
+    doc = lxml.html.fromstring(content)
+    columns = [th.text_content() for th in doc.iter("th")]
+    rows = [
+        [_parse_val(td.text_content()) for td in row.iter("td")]
+        for row in list(doc.iter("tr"))[1:]
+    ]
+    if not rows or "Date - Time" not in columns:
+        return pandas.DataFrame({})
+
+    # like zip(columns, values), missing values are None and extra ones dropped
+    rows = [row[: len(columns)] + [None] * (len(columns) - len(row)) for row in rows]
+    df = pandas.DataFrame(rows, columns=columns)
+    dates = df.pop("Date - Time")
+    df = df.apply(pandas.to_numeric, errors="coerce").astype(float)
+    df.index = _parse_datetimes(dates)
+    return df
+
+
+def _parse_datetimes(dates):
+    """parses the "Dec  3 2015  1:10PM" dates of the data table"""
+    normalized = dates.str.split().str.join(" ")
+    try:
+        parsed = pandas.to_datetime(normalized, format="%b %d %Y %I:%M%p")
+    except (TypeError, ValueError):
+        parsed = dates.apply(util.convert_datetime)
+    return pandas.DatetimeIndex(parsed, name="Date - Time")
 
 
 def _extract_headers_for_next_request(request):
     payload = {}
-    for tag in BeautifulSoup(request.content, "html.parser").findAll("input"):
-        tag_dict = dict(tag.attrs)
+    for tag in lxml.html.fromstring(request.content).iter("input"):
+        tag_dict = dict(tag.attrib)
         if tag_dict.get("value") == "tabular":
             #
             continue
@@ -341,10 +424,14 @@ def _extract_headers_for_next_request(request):
     return payload
 
 
-def _make_next_request(url, previous_request, data):
-    data_headers = _extract_headers_for_next_request(previous_request)
+def _make_next_request(url, previous_request, data, session=None, payload=None):
+    if payload is None:
+        payload = _extract_headers_for_next_request(previous_request)
+    data_headers = dict(payload)
     data_headers.update(data)
-    return requests.post(
+    if session is None:
+        session = requests
+    return session.post(
         url, cookies=previous_request.cookies, data=data_headers, timeout=10
     )
 
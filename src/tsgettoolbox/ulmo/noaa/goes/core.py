@@ -1,6 +1,6 @@
 import logging
+import math
 import os
-import shutil
 from datetime import datetime, timedelta
 
 import isodate
@@ -14,12 +14,29 @@ DCS_URL = "https://dcs1.noaa.gov/Account/FieldTestData"
 
 DEFAULT_FILE_PATH = "noaa/goes/"
 
+# maximum number of DCP addresses fetched in a single request
+BATCH_SIZE = 100
+
+MESSAGE_COLUMNS = [
+    "dcp_address",
+    "message_timestamp_utc",
+    "failure_code",
+    "signal_strength",
+    "goes_receive_channel",
+    "message_data_length",
+    "dcp_message",
+]
+MESSAGE_MIN_ITEMSIZE = {"dcp_address": 16, "failure_code": 16, "dcp_message": 4096}
+
 # configure logging
 LOG_FORMAT = "%(message)s"
 logging.basicConfig(format=LOG_FORMAT)
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
+# reuse connections across polls
+_session = requests.Session()
+
 
 def decode(dataframe, parser, **kwargs):
     """decodes goes message data in pandas dataframe returned by
@@ -49,16 +66,21 @@ def decode(dataframe, parser, **kwargs):
     if dataframe.empty:
         return dataframe
 
-    df = []
-    for _, data in dataframe.iterrows():
-        parsed = parser(data, **kwargs)
-        parsed.dropna(how="all", inplace=True)
-        if parsed.empty:
-            empty_df = pd.DataFrame()
-            df.append(empty_df)
-        df.append(parsed)
-
-    df = pd.concat(df)
+    batch_parser = parsers.batch_parsers.get(parser)
+    if batch_parser is not None and not kwargs.get("dual_well", False):
+        # decode all messages at once
+        df = batch_parser(dataframe, **kwargs).dropna(how="all")
+    else:
+        df = []
+        for _, data in dataframe.iterrows():
+            parsed = parser(data, **kwargs)
+            parsed.dropna(how="all", inplace=True)
+            if parsed.empty:
+                empty_df = pd.DataFrame()
+                df.append(empty_df)
+            df.append(parsed)
+
+        df = pd.concat(df)
     # preserve metadata in df if it exists, since pivot will lose it
     df_save = df.drop(["channel", "channel_data"], axis=1)
     df = df.pivot_table(index=df.index, columns="channel", values="channel_data").join(
@@ -71,7 +93,15 @@ def decode(dataframe, parser, **kwargs):
     return df
 
 
-def get_data(dcp_address, hours, use_cache=False, cache_path=None, as_dataframe=True):
+def get_data(
+    dcp_address,
+    hours,
+    use_cache=False,
+    cache_path=None,
+    as_dataframe=True,
+    since_last=False,
+    batch_size=BATCH_SIZE,
+):
     """Fetches GOES Satellite DCP messages from NOAA Data Collection System
     (DCS) field test.
 
@@ -79,7 +109,9 @@ def get_data(dcp_address, hours, use_cache=False, cache_path=None, as_dataframe=
     ----------
     dcp_address : str, iterable of strings
         DCP address or list of DCP addresses to be fetched; lists will be
-        joined by a ','.
+        joined by a ',' and fetched batch_size addresses per request.
+    hours : int
+        Number of hours of messages to fetch.
     use_cache : bool,
         If True (default) use hdf file to cache data and retrieve new data on
         subsequent requests
@@ -89,45 +121,121 @@ def get_data(dcp_address, hours, use_cache=False, cache_path=None, as_dataframe=
     as_dataframe : bool
         If True (default) return data in a pandas dataframe otherwise return a
         dict.
+    since_last : bool
+        If True and use_cache is True, only fetch the hours since the last
+        cached message of each DCP (at most ``hours``) and only return the
+        messages of those hours instead of the whole cache.
+    batch_size : int
+        Maximum number of DCP addresses fetched in a single request.
 
     Returns
     -------
     message_data : {pandas.DataFrame, dict}
         Either a pandas dataframe or a dict indexed by dcp message times
     """
+    if isinstance(dcp_address, str):
+        dcp_addresses = dcp_address.split(",")
+    else:
+        dcp_addresses = list(dcp_address)
 
-    if isinstance(dcp_address, list):
-        dcp_address = ",".join(dcp_address)
+    if use_cache:
+        dcp_data_paths = {
+            address: _get_store_path(cache_path, address + ".h5")
+            for address in dcp_addresses
+        }
 
-    data = pd.DataFrame()
+    dcp_hours = {address: hours for address in dcp_addresses}
+    if use_cache and since_last:
+        for address in dcp_addresses:
+            last_message = _get_last_message_timestamp(dcp_data_paths[address], address)
+            if last_message is not None:
+                elapsed = (datetime.now() - last_message).total_seconds() / 3600
+                dcp_hours[address] = max(1, min(hours, math.ceil(elapsed) + 1))
 
-    if use_cache:
-        dcp_data_path = _get_store_path(cache_path, dcp_address + ".h5")
-        if os.path.exists(dcp_data_path):
-            data = pd.read_hdf(dcp_data_path, dcp_address)
-    params = {"addr": (dcp_address,), "hours": (hours,)}
-    messages = _fetch_url(params)
-    new_data = pd.DataFrame([_parse(row) for row in messages])
+    new_data = _fetch_messages(dcp_hours, batch_size)
 
-    if not new_data.empty:
-        new_data.index = new_data.message_timestamp_utc
-        data = new_data.combine_first(data)
-        data.sort_index(inplace=True)
-        if use_cache:
-            # write to a tmp file and move to avoid ballooning h5 file
-            tmp = dcp_data_path + ".tmp"
-            data.to_hdf(tmp, dcp_address)
-            shutil.move(tmp, dcp_data_path)
+    if use_cache:
+        data = []
+        for address in dcp_addresses:
+            if new_data.empty:
+                dcp_data = new_data
+            else:
+                dcp_data = new_data[new_data["dcp_address"] == address]
+            since = None
+            if since_last:
+                since = datetime.now() - timedelta(hours=dcp_hours[address])
+            data.append(
+                _update_cache(dcp_data_paths[address], address, dcp_data, since=since)
+            )
+        data = pd.concat(data) if data else pd.DataFrame()
+    else:
+        data = new_data
 
     if data.empty:
         return data if as_dataframe else {}
+    data.sort_index(inplace=True)
     if not as_dataframe:
         data = data.T.to_dict()
     return data
 
 
+def _append_messages(store, dcp_address, new_data):
+    """append the messages in new_data that aren't already in the
+    dcp_address table, de-duplicated on message_timestamp_utc"""
+    new_data = new_data[~new_data.index.duplicated(keep="last")]
+    if dcp_address in store:
+        window_start = new_data.index.min()
+        stored = store.select(dcp_address, where=f"index >= '{window_start}'")
+        new_data = new_data[~new_data.index.isin(stored.index)]
+    if new_data.empty:
+        return
+
+    new_data = _message_dtypes(new_data.reindex(columns=MESSAGE_COLUMNS))
+    for column in MESSAGE_MIN_ITEMSIZE:
+        new_data[column] = new_data[column].fillna("").astype(str).astype(object)
+    store.append(
+        dcp_address,
+        new_data.sort_index(),
+        format="table",
+        min_itemsize=MESSAGE_MIN_ITEMSIZE,
+        complevel=9,
+        complib="zlib",
+    )
+
+
+def _convert_legacy_messages(store, dcp_address):
+    """convert a fixed format messages frame written by older versions to a
+    table, once"""
+    if store.get_storer(dcp_address).is_table:
+        return
+    data = store[dcp_address]
+    store.remove(dcp_address)
+    if len(data):
+        _append_messages(store, dcp_address, data)
+
+
+def _fetch_messages(dcp_hours, batch_size):
+    """fetch messages for several DCPs, batch_size addresses per request;
+    addresses needing a similar number of hours are fetched together"""
+    addresses = sorted(dcp_hours, key=dcp_hours.get)
+    messages = []
+    for i in range(0, len(addresses), batch_size):
+        batch = addresses[i : i + batch_size]
+        params = {
+            "addr": (",".join(batch),),
+            "hours": (max(dcp_hours[address] for address in batch),),
+        }
+        messages.extend(_fetch_url(params))
+
+    new_data = pd.DataFrame([_parse(row) for row in messages])
+    if not new_data.empty:
+        new_data.index = new_data.message_timestamp_utc
+        new_data = _message_dtypes(new_data)
+    return new_data
+
+
 def _fetch_url(params):
-    r = requests.post(DCS_URL, params=params, timeout=60)
+    r = _session.post(DCS_URL, params=params, timeout=60)
     return r.json()
 
 
@@ -161,6 +269,23 @@ def _format_time(timestamp):
         return _format_period(timestamp)
 
 
+def _get_last_message_timestamp(dcp_data_path, dcp_address):
+    """returns the latest cached message timestamp or None"""
+    if not os.path.exists(dcp_data_path):
+        return None
+    with pd.HDFStore(dcp_data_path, mode="r") as store:
+        if dcp_address not in store:
+            return None
+        if store.get_storer(dcp_address).is_table:
+            # only read the index column
+            timestamps = store.select_column(dcp_address, "index")
+        else:
+            timestamps = store[dcp_address].index.to_series()
+    if timestamps.empty:
+        return None
+    return timestamps.max().to_pydatetime()
+
+
 def _get_store_path(path, default_file_name):
     if path is None:
         path = os.path.join(util.get_ulmo_dir(), DEFAULT_FILE_PATH)
@@ -171,6 +296,16 @@ def _get_store_path(path, default_file_name):
     return os.path.join(path, default_file_name)
 
 
+def _message_dtypes(data):
+    """cast the numeric message columns to float, the same for cached and
+    uncached messages"""
+    data = data.copy()
+    for column in ("signal_strength", "goes_receive_channel", "message_data_length"):
+        if column in data:
+            data[column] = pd.to_numeric(data[column], errors="coerce").astype(float)
+    return data
+
+
 def _parse(entry):
     return {
         "dcp_address": entry["TblDcpDataAddrCorr"],
@@ -183,3 +318,18 @@ def _parse(entry):
         "message_data_length": entry["TblDcpDataDataLen"],
         "dcp_message": entry["TblDcpDataData"],
     }
+
+
+def _update_cache(dcp_data_path, dcp_address, new_data, since=None):
+    """append new_data to the dcp_address cache and return the cached
+    messages, all of them or the ones at or after since"""
+    with pd.HDFStore(dcp_data_path) as store:
+        if dcp_address in store:
+            _convert_legacy_messages(store, dcp_address)
+        if not new_data.empty:
+            _append_messages(store, dcp_address, new_data)
+        if dcp_address not in store:
+            return pd.DataFrame()
+        if since is None:
+            return store.select(dcp_address)
+        return store.select(dcp_address, where=f"index >= '{since}'")
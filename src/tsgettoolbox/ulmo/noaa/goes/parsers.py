@@ -136,6 +136,169 @@ def twdb_texuni(dataframe, drop_dcp_metadata=True, dual_well=False):
     return df
 
 
+def _twdb_fts_batch(dataframe, drop_dcp_metadata=True, dual_well=False):
+    """twdb_fts() for every message in dataframe at once"""
+    messages = dataframe["dcp_message"].str.lower().reset_index(drop=True)
+    invalid = _invalid_messages(messages)
+
+    lines = messages[~invalid].str.strip('"').str.split(":").explode()
+    channels = lines.str[:2]
+    tokens = lines.str[10:].str.split().reset_index(drop=True).explode().dropna()
+    values, parsed = _parse_floats(tokens.str.strip("+-"))
+    # a value that doesn't parse drops its whole channel, like twdb_fts()
+    good_lines = parsed.groupby(level=0).all()
+    keep = good_lines.reindex(tokens.index).to_numpy()
+    line_ids = tokens.index.to_numpy()[keep]
+
+    return _twdb_assemble_batch(
+        dataframe,
+        invalid,
+        lines.index.to_numpy()[line_ids],
+        channels.to_numpy()[line_ids],
+        values.to_numpy()[keep],
+        _cumcount(line_ids),
+        drop_dcp_metadata,
+    )
+
+
+def _twdb_stevens_batch(dataframe, drop_dcp_metadata=True, dual_well=False):
+    """twdb_stevens() and twdb_dot() for every message in dataframe at once,
+    dual well messages are not handled"""
+    messages = dataframe["dcp_message"].str.strip().str.lower()
+    messages = messages.reset_index(drop=True)
+    invalid = _invalid_messages(messages)
+
+    fields = messages[~invalid].str.strip('" ').str.split().explode().dropna()
+    fields = fields.str.strip("\x10\x00")
+    message_ids = fields.index.to_numpy()
+    parts = fields.str.split(":")
+    n_parts = parts.str.len()
+
+    is_single = fields.str[:2].isin(battery_names) | fields.str.contains(
+        "time", regex=False
+    )
+    is_channel = ~is_single & fields.str.contains("channel", regex=False)
+    values, parsed = _parse_floats(fields.str.strip("+-$"))
+    is_value = ~is_single & ~is_channel & parsed
+
+    # battery and time fields are single values at the message hour
+    single = (is_single & (n_parts == 2)).to_numpy()
+    single_values, _ = _parse_floats(parts.str[1][single])
+
+    # other values belong to the channel named by the last channel field
+    channel_names = parts.str[1].where(is_channel & (n_parts >= 2))
+    current = channel_names.groupby(level=0).ffill().fillna("wl").to_numpy()
+    value_rows = is_value.to_numpy()
+    value_channels = current[value_rows]
+    value_message_ids = message_ids[value_rows]
+
+    # channels are reported in the order they were first named, after wl
+    named = pd.DataFrame(
+        {"message": message_ids, "channel": channel_names.to_numpy()}
+    ).dropna()
+    named = named[named["channel"] != "wl"].drop_duplicates()
+    named["rank"] = named.groupby("message").cumcount() + 1
+    rank = (
+        pd.DataFrame({"message": value_message_ids, "channel": value_channels})
+        .merge(named, how="left", on=["message", "channel"])["rank"]
+        .fillna(0)
+        .to_numpy()
+    )
+    keys = pd.Series(value_message_ids).astype(str) + "\x00" + value_channels
+    hours = _cumcount(keys.to_numpy())
+
+    order = np.lexsort(
+        (
+            np.concatenate([np.flatnonzero(single), np.flatnonzero(value_rows)]),
+            np.concatenate([np.zeros(single.sum()), rank + 1]),
+            np.concatenate([message_ids[single], value_message_ids]),
+        )
+    )
+    return _twdb_assemble_batch(
+        dataframe,
+        invalid,
+        np.concatenate([message_ids[single], value_message_ids])[order],
+        np.concatenate([parts.str[0][single].to_numpy(), value_channels])[order],
+        np.concatenate([single_values.to_numpy(), values[value_rows].to_numpy()])[
+            order
+        ],
+        np.concatenate([np.zeros(single.sum(), dtype=int), hours])[order],
+        drop_dcp_metadata,
+    )
+
+
+def _twdb_sutron_batch(dataframe, drop_dcp_metadata=True, dual_well=False):
+    """twdb_sutron() for every message in dataframe at once"""
+    messages = dataframe["dcp_message"].str.strip().str.lower()
+    messages = messages.reset_index(drop=True)
+    invalid = _invalid_messages(messages)
+
+    lines = messages[~invalid].str.strip('":').str.split(":").explode()
+    fields = lines.str.split(" ")
+    channels = fields.str[0]
+    fields = fields.where(channels.isin(battery_names), fields.str[3:])
+    fields = fields.reset_index(drop=True)
+    tokens = fields.explode().dropna()
+    values, _ = _parse_floats(tokens.str.strip('+-" '))
+    line_ids = tokens.index.to_numpy()
+
+    return _twdb_assemble_batch(
+        dataframe,
+        invalid,
+        lines.index.to_numpy()[line_ids],
+        channels.to_numpy()[line_ids],
+        values.to_numpy(),
+        _cumcount(line_ids),
+        drop_dcp_metadata,
+    )
+
+
+def _twdb_assemble_batch(
+    dataframe, invalid, message_ids, channels, values, hours, drop_dcp_metadata
+):
+    """assembles the long (timestamp, channel, value) dataframe for all
+    messages, the same as concatenating _twdb_assemble_dataframe() results for
+    each message; invalid messages get a single empty row"""
+    invalid_ids = np.flatnonzero(invalid.to_numpy())
+    message_ids = np.concatenate([message_ids, invalid_ids]).astype(int)
+    order = np.argsort(message_ids, kind="stable")
+    message_ids = message_ids[order]
+    channels = np.concatenate(
+        [np.asarray(channels, dtype=object), np.full(len(invalid_ids), np.nan)]
+    )[order]
+    values = np.concatenate(
+        [np.asarray(values, dtype=float), np.full(len(invalid_ids), np.nan)]
+    )[order]
+    hours = np.concatenate([hours, np.zeros(len(invalid_ids), dtype=int)])[order]
+
+    base = pd.to_datetime(dataframe["message_timestamp_utc"]).dt.floor("h")
+    timestamps = base.to_numpy()[message_ids] - hours.astype("timedelta64[h]")
+    df = pd.DataFrame(
+        {"channel": channels, "channel_data": values},
+        index=pd.DatetimeIndex(timestamps, name="timestamp_utc"),
+    )
+    if not drop_dcp_metadata:
+        # like _empty_df(), invalid messages don't carry the metadata
+        metadata = dataframe.reset_index(drop=True)
+        metadata = metadata.mask(invalid.reindex(metadata.index), axis=0)
+        for col in metadata.columns:
+            df[col] = metadata[col].to_numpy()[message_ids]
+    return df
+
+
+def _cumcount(ids):
+    """position of each element within its run of equal ids"""
+    return pd.Series(ids).groupby(ids, sort=False).cumcount().to_numpy()
+
+
+def _parse_floats(strings):
+    """returns (values, parsed): strings converted the way float() would, and
+    whether float() would have succeeded"""
+    values = pd.to_numeric(strings, errors="coerce")
+    parsed = values.notna() | strings.str.lower().isin(["nan", "inf", "infinity"])
+    return values.astype(float), parsed
+
+
 def _twdb_assemble_dataframe(message_timestamp, channel, channel_data, reverse=False):
     data = []
     base_timestamp = message_timestamp.replace(minute=0, second=0, microsecond=0)
@@ -280,6 +443,11 @@ def _parse_value(water_level_str):
         return water_level_str
 
 
+def _invalid_messages(messages):
+    """vectorized _invalid_message_check()"""
+    return messages.str.contains("dadds|operator|no", regex=True)
+
+
 def _invalid_message_check(message):
     is_invalid = False
     invalid_messages = ["dadds", "operator", "no"]
@@ -292,3 +460,12 @@ def _invalid_message_check(message):
 def _empty_df(message_timestamp):
     df = _twdb_assemble_dataframe(message_timestamp, np.nan, [np.nan])
     return df
+
+
+# parsers that can decode all messages at once, see ulmo.noaa.goes.decode()
+batch_parsers = {
+    twdb_dot: _twdb_stevens_batch,
+    twdb_fts: _twdb_fts_batch,
+    twdb_stevens: _twdb_stevens_batch,
+    twdb_sutron: _twdb_sutron_batch,
+}
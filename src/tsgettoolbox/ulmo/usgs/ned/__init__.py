@@ -4,6 +4,16 @@
 .. _National Elevation Dataset (NED): http://ned.usgs.gov
 """
 
-__all__ = ["get_available_layers", "get_raster", "get_raster_availability"]
+__all__ = [
+    "get_available_layers",
+    "get_raster",
+    "get_raster_availability",
+    "sample_elevations",
+]
 
-from .core import get_available_layers, get_raster, get_raster_availability
+from .core import (
+    get_available_layers,
+    get_raster,
+    get_raster_availability,
+    sample_elevations,
+)
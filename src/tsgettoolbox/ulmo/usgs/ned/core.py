@@ -13,6 +13,7 @@ Survey`_ `National Map`_ system.
 
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from geojson import Feature, FeatureCollection, Polygon
@@ -112,7 +113,13 @@ def get_raster_availability(layer, bbox=None):
 
 
 def get_raster(
-    layer, bbox, path=None, update_cache=False, check_modified=False, mosaic=False
+    layer,
+    bbox,
+    path=None,
+    update_cache=False,
+    check_modified=False,
+    mosaic=False,
+    max_workers=4,
 ):
     """downloads National Elevation Dataset raster tiles that cover the given bounding box
     for the specified data layer.
@@ -132,7 +139,9 @@ def get_raster(
         if tile exists in path, check if newer file exists online and download if available.
     mosaic: ``True`` or ``False`` (default)
         if ``True``, mosaic and clip downloaded tiles to the extents of the bbox provided. Requires
-        rasterio package and GDAL.
+        rasterio package.
+    max_workers: int
+        number of tiles downloaded at the same time.
 
     Returns
     -------
@@ -142,7 +151,10 @@ def get_raster(
     _check_layer(layer)
 
     raster_tiles = _download_tiles(
-        get_raster_availability(layer, bbox), path=path, check_modified=check_modified
+        get_raster_availability(layer, bbox),
+        path=path,
+        check_modified=check_modified,
+        max_workers=max_workers,
     )
 
     if mosaic:
@@ -164,6 +176,43 @@ def get_raster(
     return raster_tiles
 
 
+def sample_elevations(layer, points, path=None, check_modified=False, max_workers=4):
+    """returns elevations at points from the National Elevation Dataset tiles
+    of the specified data layer, reading only the tile blocks around the
+    points instead of building a mosaic.
+
+    Parameters
+    ----------
+    layer : str
+        dataset layer name. (see get_available_layers for list)
+    points : sequence of (float, float)
+        (longitude, latitude) of the points
+    path : ``None`` or path
+        if ``None`` default path will be used
+    check_modified: ``True`` or ``False`` (default)
+        if tile exists in path, check if newer file exists online and download if available.
+    max_workers: int
+        number of tiles downloaded at the same time.
+
+    Returns
+    -------
+    elevations : numpy.ndarray
+        elevation at each point, NaN where no tile has data
+    """
+    _check_layer(layer)
+
+    xs, ys = zip(*points)
+    bbox = (min(xs), min(ys), max(xs), max(ys))
+    raster_tiles = _download_tiles(
+        get_raster_availability(layer, bbox),
+        path=path,
+        check_modified=check_modified,
+        max_workers=max_workers,
+    )
+    raster_files = [tile["properties"]["file"] for tile in raster_tiles["features"]]
+    return util.sample_raster_tiles(raster_files, points)
+
+
 def _check_layer(layer):
     """
     make sure the passed layer name is one of the handled options
@@ -180,6 +229,7 @@ def _download_features(
     feature_ids,
     path=None,
     check_modified=False,
+    max_workers=4,
 ):
     if path is None:
         path = os.path.join(util.get_ulmo_dir(), DEFAULT_FILE_PATH)
@@ -187,14 +237,16 @@ def _download_features(
     if isinstance(feature_ids, str):
         feature_ids = [feature_ids]
 
+    def _get_metadata(feature_id):
+        url = f"https://www.sciencebase.gov/catalogMaps/mapping/ows/{feature_id}?service=wcs&request=getcapabilities&version=1.0.0"
+        return requests.get(url, timeout=60).json()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        metadatas = list(executor.map(_get_metadata, feature_ids))
+
     tiles = []
     tile_fmt = ".img"
-    for feature_id in feature_ids:
-        url = (
-            "https://www.sciencebase.gov/catalogMaps/mapping/ows/{0}?service=wcs&request=getcapabilities&version=1.0.0"
-            % feature_id
-        )
-        metadata = requests.get(url, timeout=60).json()
+    for feature_id, metadata in zip(feature_ids, metadatas):
         layer = [a for a in list(layer_dict.keys()) if a in metadata["title"]][0]
         layer_path = os.path.join(path, layer_dict[layer])
         tile_urls = [
@@ -204,7 +256,11 @@ def _download_features(
             {
                 "feature_id": feature_id,
                 "tiles": util.download_tiles(
-                    layer_path, tile_urls, tile_fmt, check_modified
+                    layer_path,
+                    tile_urls,
+                    tile_fmt,
+                    check_modified,
+                    max_workers=max_workers,
                 ),
             }
         )
@@ -221,15 +277,27 @@ def _bbox2poly(bbox):
     return [[(xmin, ymin), (xmin, ymax), (xmax, ymax), (xmax, ymin), (xmin, ymin)]]
 
 
-def _download_tiles(tiles, path=None, check_modified=False):
+def _download_tiles(tiles, path=None, check_modified=False, max_workers=4):
     if path is None:
         path = os.path.join(util.get_ulmo_dir(), DEFAULT_FILE_PATH)
 
+    # download the tiles of each layer (and format) together
+    groups = {}
     for tile in tiles["features"]:
         metadata = tile["properties"]
-        layer_path = os.path.join(path, layer_dict[metadata["layer"]])
-        tile["properties"]["file"] = util.download_tiles(
-            layer_path, metadata["download url"], metadata["format"], check_modified
-        )[0]
+        key = (metadata["layer"], metadata["format"])
+        groups.setdefault(key, []).append(tile)
+
+    for (layer, tile_fmt), layer_tiles in groups.items():
+        layer_path = os.path.join(path, layer_dict[layer])
+        files = util.download_tiles(
+            layer_path,
+            [tile["properties"]["download url"] for tile in layer_tiles],
+            tile_fmt,
+            check_modified,
+            max_workers=max_workers,
+        )
+        for tile, file in zip(layer_tiles, files):
+            tile["properties"]["file"] = file
 
     return tiles
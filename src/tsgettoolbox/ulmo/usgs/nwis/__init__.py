@@ -23,11 +23,13 @@ try:
 except ImportError:
     hdf5 = util.module_with_dependency_errors(
         [
+            "compact",
             "get_site",
             "get_sites",
             "get_site_data",
             "update_site_list",
             "update_site_data",
+            "update_sites_data",
         ]
     )
 
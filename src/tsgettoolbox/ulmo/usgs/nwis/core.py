@@ -244,42 +244,16 @@ def get_site_data(
     data_dict : dict
         a python dict with parameter codes mapped to value dicts
     """
-    url_params = {"format": "waterml", "site": site_code}
-    if isinstance(parameter_code, str):
-        url_params["parameterCd"] = parameter_code
-    elif isinstance(parameter_code, list):
-        url_params["parameterCd"] = ",".join(parameter_code)
-    if statistic_code:
-        url_params["statCd"] = statistic_code
-    if modified_since:
-        url_params["modifiedSince"] = isodate.duration_isoformat(modified_since)
-
-    if start is not None and end is not None and period is not None:
-        raise ValueError(
-            "must use either a date range with start/end OR a period, but not both"
-        )
-    if period is not None:
-        if isinstance(period, str):
-            if period == "all":
-                if service in ("iv", "instantaneous"):
-                    start = datetime.datetime(1910, 1, 1)
-                elif service in ("dv", "daily"):
-                    start = datetime.datetime(1851, 1, 1)
-            else:
-                url_params["period"] = period
-        elif isinstance(period, datetime.timedelta):
-            url_params["period"] = isodate.duration_isoformat(period)
-
-    if service in ("dv", "daily"):
-        datetime_formatter = isodate.date_isoformat
-    else:
-        datetime_formatter = isodate.datetime_isoformat
-    if start is not None:
-        start_datetime = util.convert_datetime(start)
-        url_params["startDT"] = datetime_formatter(start_datetime)
-    if end is not None:
-        end_datetime = util.convert_datetime(end)
-        url_params["endDT"] = datetime_formatter(end_datetime)
+    url_params = _site_data_url_params(
+        site_code,
+        service,
+        parameter_code=parameter_code,
+        statistic_code=statistic_code,
+        start=start,
+        end=end,
+        period=period,
+        modified_since=modified_since,
+    )
 
     if service is not None:
         url_params.update(kwargs)
@@ -330,6 +304,58 @@ def _extract_site_properties(site):
     return site
 
 
+def _site_data_url_params(
+    site_code,
+    service,
+    parameter_code=None,
+    statistic_code=None,
+    start=None,
+    end=None,
+    period=None,
+    modified_since=None,
+):
+    """builds the url parameters for a get_site_data request, site_code can
+    be a comma delimited list of sites"""
+    url_params = {"format": "waterml", "site": site_code}
+    if isinstance(parameter_code, str):
+        url_params["parameterCd"] = parameter_code
+    elif isinstance(parameter_code, list):
+        url_params["parameterCd"] = ",".join(parameter_code)
+    if statistic_code:
+        url_params["statCd"] = statistic_code
+    if modified_since:
+        url_params["modifiedSince"] = isodate.duration_isoformat(modified_since)
+
+    if start is not None and end is not None and period is not None:
+        raise ValueError(
+            "must use either a date range with start/end OR a period, but not both"
+        )
+    if period is not None:
+        if isinstance(period, str):
+            if period == "all":
+                if service in ("iv", "instantaneous"):
+                    start = datetime.datetime(1910, 1, 1)
+                elif service in ("dv", "daily"):
+                    start = datetime.datetime(1851, 1, 1)
+            else:
+                url_params["period"] = period
+        elif isinstance(period, datetime.timedelta):
+            url_params["period"] = isodate.duration_isoformat(period)
+
+    if service in ("dv", "daily"):
+        datetime_formatter = isodate.date_isoformat
+    else:
+        datetime_formatter = isodate.datetime_isoformat
+    if start is not None:
+        start_datetime = util.convert_datetime(start)
+        url_params["startDT"] = datetime_formatter(start_datetime)
+    if end is not None:
+        end_datetime = util.convert_datetime(end)
+        url_params["endDT"] = datetime_formatter(end_datetime)
+
+    return url_params
+
+
 def _get_service_url(service):
     if service in ("daily", "dv"):
         return DAILY_URL
@@ -341,34 +367,55 @@ def _get_service_url(service):
         )
 
 
+def _fetch_site_values(service, url_params, session=None):
+    """downloads values for a site (or comma delimited sites)
+
+    returns a (content, query_isodate) tuple or None if the request failed
+    """
+    query_isodate = isodate.datetime_isoformat(datetime.datetime.now())
+    service_url = _get_service_url(service)
+
+    try:
+        req = (session or requests).get(service_url, params=url_params, timeout=60)
+    except requests.exceptions.RequestException as e:
+        log.info(
+            f"There was a request error ({e}) with query:\n\t{service_url}\n\t{url_params}"
+        )
+        return None
+    log.info(f"processing data from request: {req.request.url}")
+
+    if req.status_code != 200:
+        return None
+    return util.to_bytes(req.content), query_isodate
+
+
 def _get_site_values(service, url_params, input_file=None, methods=None):
     """downloads and parses values for a site
 
     returns a values dict containing variable and data values
     """
     if input_file is None:
-        query_isodate = isodate.datetime_isoformat(datetime.datetime.now())
-        service_url = _get_service_url(service)
-
-        try:
-            req = requests.get(service_url, params=url_params, timeout=60)
-        except requests.exceptions.ConnectionError:
-            log.info(
-                f"There was a connection error with query:\n\t{service_url}\n\t{url_params}"
-            )
+        fetched = _fetch_site_values(service, url_params)
+        if fetched is None:
             return {}
-        log.info(f"processing data from request: {req.request.url}")
-
-        if req.status_code != 200:
-            return {}
-        input_file = io.BytesIO(util.to_bytes(req.content))
+        content, query_isodate = fetched
+        input_file = io.BytesIO(content)
     else:
         query_isodate = None
 
     with _open_input_file(input_file) as content_io:
-        data_dict = wml.parse_site_values(content_io, query_isodate, methods=methods)
+        return _parse_site_values(content_io, query_isodate, methods=methods)
+
+
+def _parse_site_values(content_io, query_isodate, methods=None, by_site=False):
+    """parses values for a site, or for each site if by_site is True"""
+    data_dict = wml.parse_site_values(
+        content_io, query_isodate, methods=methods, by_site=by_site
+    )
 
-        for variable_dict in list(data_dict.values()):
+    site_dicts = data_dict.values() if by_site else [data_dict]
+    for site_dict in site_dicts:
+        for variable_dict in list(site_dict.values()):
             variable_dict["site"] = _extract_site_properties(variable_dict["site"])
 
     return data_dict
@@ -1,14 +1,19 @@
+import concurrent.futures
 import contextlib
 import copy
+import io
 import os
 import shutil
 import sys
 import tempfile
+import time
 import warnings
 
 import numpy as np
 import pandas
+import requests
 import tables
+from lxml import etree
 from tables.scripts import ptrepack
 
 from ... import util
@@ -17,6 +22,15 @@ from . import core
 # default hdf5 file path
 DEFAULT_HDF5_FILE_PATH = util.get_default_h5file_path("usgs/")
 
+# errors that fail a batch or site instead of the whole update
+_PARSE_ERRORS = (
+    etree.Error,
+    KeyError,
+    ValueError,
+    concurrent.futures.BrokenExecutor,
+)
+_WRITE_ERRORS = (OSError, TypeError, ValueError, tables.HDF5ExtError)
+
 # define column sizes for strings stored in hdf5 tables
 # note: this is currently not used as we simply read in and write out entire
 # site dataframes to the store (not using tables type)
@@ -38,6 +52,11 @@ SITES_MIN_ITEMSIZE = {
 
 SITES_TABLE = "sites"
 
+# values are stored as appendable, datetime-indexed tables so that a refresh
+# only touches the rows it changes
+VALUES_COLUMNS = ["datetime", "value", "qualifiers", "last_checked", "last_modified"]
+VALUES_MIN_ITEMSIZE = {column: 32 for column in VALUES_COLUMNS}
+
 
 def get_sites(path=None, complevel=None, complib=None):
     """Fetches previously-cached site information from an hdf5 file.
@@ -188,7 +207,7 @@ def get_site_data(
 
 
 def remove_values(
-    site_code, datetime_dicts, path=None, complevel=None, complib=None, autorepack=True
+    site_code, datetime_dicts, path=None, complevel=None, complib=None, autorepack=False
 ):
     """Remove values from hdf5 file.
 
@@ -199,6 +218,9 @@ def remove_values(
     datetime_dicts : a python dict with a list of datetimes for a given variable
         (key) to set as NaNs.
     path : file path to hdf5 file.
+    autorepack : bool
+        Whether or not to repack the h5 file afterwards. Only the affected
+        rows are rewritten, so this defaults to False; see compact().
 
     Returns
     -------
@@ -223,28 +245,29 @@ def remove_values(
 
             datetimes = [util.convert_datetime(dt) for dt in datetimes]
 
-            if values_path in store:
-                values_df = store[values_path]
-                original_datetimes = set(values_df.dropna(how="all").index.tolist())
-                datetimes_to_remove = original_datetimes.intersection(set(datetimes))
-                if not datetimes_to_remove:
-                    core.log.info(
-                        f"No {variable_code} values matching the given datetimes to remove were found."
-                    )
-                    continue
-                else:
-                    values_df.ix[list(datetimes_to_remove), "value"] = np.nan
-                    core.log.info(
-                        f"{len(datetimes_to_remove)} {variable_code} values were set to NaNs in file"
-                    )
-
-            else:
+            if values_path not in store:
                 core.log.warning(
                     f"Values path {values_path} not found in {site_data_path}."
                 )
                 continue
 
-            store[values_path] = values_df
+            _convert_legacy_values(store, values_path)
+            window_start = min(datetimes)
+            window_end = max(datetimes)
+            values_df = _select_values(store, values_path, window_start, window_end)
+            original_datetimes = set(values_df.dropna(how="all").index.tolist())
+            datetimes_to_remove = original_datetimes.intersection(set(datetimes))
+            if not datetimes_to_remove:
+                core.log.info(
+                    f"No {variable_code} values matching the given datetimes to remove were found."
+                )
+                continue
+
+            values_df.loc[list(datetimes_to_remove), "value"] = np.nan
+            core.log.info(
+                f"{len(datetimes_to_remove)} {variable_code} values were set to NaNs in file"
+            )
+            _replace_values(store, values_path, values_df, window_start, window_end)
             something_changed = True
 
     if autorepack and something_changed:
@@ -281,6 +304,42 @@ def repack(path, complevel=None, complib=None):
     shutil.move(temp_path, path)
 
 
+def compact(path=None, complevel=None, complib=None):
+    """Compact the hdf5 cache offline.
+
+    Updates append to and delete from the values tables in place, which
+    leaves free space behind in the file. Run this periodically (for example
+    from a nightly job, while no updates are running) to reclaim it.
+
+    Parameters
+    ----------
+    path : ``None`` or file path
+        Path to an hdf5 file, or a directory of hdf5 files, to compact. If
+        ``None`` then the default path will be used.
+    complevel : ``None`` or int {0-9}
+        Repack with this level of compression, see repack().
+    complib : ``None`` or str {'zlib', 'bzip2', 'lzo', 'blosc'}
+        Repack with this type of compression, see repack().
+
+    Returns
+    -------
+    None : ``None``
+    """
+    if path is None:
+        path = DEFAULT_HDF5_FILE_PATH
+    if os.path.isdir(path):
+        paths = sorted(
+            os.path.join(path, name)
+            for name in os.listdir(path)
+            if name.endswith(".h5")
+        )
+    else:
+        paths = [path]
+
+    for h5_path in paths:
+        repack(h5_path, complevel=complevel, complib=complib)
+
+
 def update_site_list(
     sites=None,
     state_code=None,
@@ -293,7 +352,7 @@ def update_site_list(
     input_file=None,
     complevel=None,
     complib=None,
-    autorepack=True,
+    autorepack=False,
     path=None,
     **kwargs,
 ):
@@ -324,11 +383,8 @@ def update_site_list(
         used.
     autorepack : bool
         Whether or not to automatically repack the h5 file after updating.
-        There is a tradeoff between performance and disk space here: large files
-        take a longer time to repack but also tend to grow larger faster, the
-        default of True conserves disk space because untamed file growth can
-        become quite destructive.  If you set this to False, you can manually
-        repack files with repack().
+        The sites table is small, so the default of False is usually fine;
+        files can be compacted offline with compact() or repack().
 
     Returns
     -------
@@ -370,7 +426,7 @@ def update_site_data(
     input_file=None,
     complevel=None,
     complib=None,
-    autorepack=True,
+    autorepack=False,
 ):
     """Update cached site data.
 
@@ -408,12 +464,11 @@ def update_site_data(
         data from the NWIS web services.
     autorepack : bool
         Whether or not to automatically repack the h5 file(s) after updating.
-        There is a tradeoff between performance and disk space here: large files
-        take a longer time to repack but also tend to grow larger faster, the
-        default of True conserves disk space because untamed file growth can
-        become quite destructive.  If you set this to False, you can manually
-        repack files with repack().
-
+        Values are stored as appendable tables indexed on datetime: new rows
+        are appended and revised rows are replaced in place, so a refresh only
+        writes the refreshed window. Repacking rewrites the whole file, so the
+        default is False; run compact() periodically instead to reclaim the
+        space left behind by replaced rows.
 
     Returns
     -------
@@ -442,63 +497,180 @@ def update_site_data(
 
     comp_kwargs = _compression_kwargs(complevel=complevel, complib=complib)
 
-    something_changed = False
-    with _get_store(site_data_path, mode="a", **comp_kwargs) as store:
-        for variable_code, data_dict in new_site_data.items():
-            variable_group_path = site_code + "/" + variable_code
+    site_dict, something_changed = _write_site_data(
+        site_code, new_site_data, site_data_path, comp_kwargs
+    )
 
-            site_dict = data_dict.pop("site")
+    sites_store_path = _get_store_path(path, "sites.h5")
+    if len(site_dict):
+        with _get_store(sites_store_path, mode="a", **comp_kwargs) as store:
+            _update_stored_sites(store, {site_dict["code"]: site_dict})
 
-            values_path = variable_group_path + "/values"
-            new_values = _values_dicts_to_df(data_dict.pop("values", {}))
+    if autorepack:
+        if something_changed:
+            repack(site_data_path, complevel=complevel, complib=complib)
+        if site_data_path != sites_store_path:
+            repack(sites_store_path, complevel=complevel, complib=complib)
 
-            last_refresh = data_dict.get("last_refresh")
-            if last_refresh is None:
-                last_refresh = np.nan
-            new_values["last_checked"] = last_refresh
-            if values_path in store:
-                if len(new_values) == 0:
-                    continue
 
-                compare_cols = ["value", "qualifiers"]
-                original_values = store[values_path]
-                original_align, new_align = original_values.align(new_values)
-                new_nulls = (
-                    pandas.isnull(new_align[compare_cols]).sum(axis=1).astype(bool)
-                )
-                modified_mask = ~new_nulls & (
-                    (original_align[compare_cols] == new_align[compare_cols]).sum(
-                        axis=1
-                    )
-                    < len(compare_cols)
-                )
+def update_sites_data(
+    site_codes,
+    start=None,
+    end=None,
+    period=None,
+    path=None,
+    methods=None,
+    complevel=None,
+    complib=None,
+    autorepack=False,
+    batch_size=100,
+    max_workers=4,
+    parse_workers=None,
+):
+    """Update cached data for many sites.
 
-                combined = new_values.combine_first(original_values)
-                combined["last_modified"][modified_mask] = last_refresh
-                new_values = combined
-            else:
-                new_values["last_modified"] = last_refresh
+    Sites are requested from NWIS in batches of up to batch_size sites per
+    request, and the requests are made concurrently. Responses are parsed in
+    worker processes while all writes are made from the calling process, so
+    each hdf5 file only ever has a single writer.
 
-            store[values_path] = new_values
-            something_changed = True
+    Parameters
+    ----------
+    site_codes : list of str
+        The site codes of the sites you want to update.
+    start, end, period, path, methods, complevel, complib, autorepack
+        See update_site_data(). If start, end and period are all ``None``,
+        each batch is requested from the earliest last refresh of its sites,
+        and sites that have never been refreshed are requested with
+        period='all'.
+    batch_size : int
+        Maximum number of sites to request at once.
+    max_workers : int
+        Number of concurrent NWIS requests.
+    parse_workers : ``None`` or int
+        Number of worker processes used for parsing, if ``None`` (default)
+        the number of processors is used.
 
-            variable_group = store.get_node(variable_group_path)
-            for key, value in data_dict.items():
-                setattr(variable_group._v_attrs, key, value)
+    Returns
+    -------
+    status_dict : dict
+        a python dict with site codes mapped to a dict containing the 'status'
+        ('updated', 'no data' or 'failed'), an 'error' message and the
+        'fetch_seconds', 'parse_seconds' and 'write_seconds' spent on the site
+    """
+    comp_kwargs = _compression_kwargs(complevel=complevel, complib=complib)
+    status = {
+        site_code: {
+            "status": "no data",
+            "error": None,
+            "fetch_seconds": 0.0,
+            "parse_seconds": 0.0,
+            "write_seconds": 0.0,
+        }
+        for site_code in site_codes
+    }
+
+    def _failed(site_codes, error):
+        for site_code in site_codes:
+            status[site_code]["status"] = "failed"
+            status[site_code]["error"] = error
+
+    site_dicts = {}
+    changed_paths = set()
+    with (
+        requests.Session() as session,
+        concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as fetchers,
+        concurrent.futures.ProcessPoolExecutor(max_workers=parse_workers) as parsers,
+    ):
+        fetches = {}
+        for batch, url_params in _site_batches(
+            site_codes, start, end, period, path, batch_size
+        ):
+            future = fetchers.submit(_fetch_batch, session, url_params)
+            fetches[future] = batch, url_params["service"]
+        parses = {}
+        pending = set(fetches)
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future in fetches:
+                    batch, service = fetches.pop(future)
+                    fetched, seconds = future.result()
+                    for site_code in batch:
+                        status[site_code]["fetch_seconds"] += seconds
+                    if fetched is None:
+                        _failed(batch, f"the NWIS {service} request failed")
+                        continue
+                    parse = parsers.submit(_parse_batch, *fetched, methods)
+                    parses[parse] = batch
+                    pending.add(parse)
+                    continue
 
-        site_group = store.get_node(site_code)
-        site_group._v_attrs.last_refresh = last_refresh
+                batch = parses.pop(future)
+                try:
+                    sites_data, seconds = future.result()
+                except _PARSE_ERRORS as e:
+                    _failed(batch, f"could not parse the NWIS response: {e}")
+                    continue
+                for site_code in batch:
+                    status[site_code]["parse_seconds"] += seconds
+
+                for site_code, new_site_data in sites_data.items():
+                    if site_code not in batch:
+                        continue
+                    site_data_path = _get_store_path(path, site_code + ".h5")
+                    write_start = time.time()
+                    try:
+                        site_dict, changed = _write_site_data(
+                            site_code, new_site_data, site_data_path, comp_kwargs
+                        )
+                    except _WRITE_ERRORS as e:
+                        _failed([site_code], f"could not write site data: {e}")
+                        continue
+                    finally:
+                        status[site_code]["write_seconds"] += time.time() - write_start
+                    if status[site_code]["status"] != "failed":
+                        status[site_code]["status"] = "updated"
+                    if len(site_dict):
+                        site_dicts[site_dict["code"]] = site_dict
+                    if changed:
+                        changed_paths.add(site_data_path)
 
-    if len(site_dict):
-        sites_store_path = _get_store_path(path, "sites.h5")
+    sites_store_path = _get_store_path(path, "sites.h5")
+    if site_dicts:
         with _get_store(sites_store_path, mode="a", **comp_kwargs) as store:
-            _update_stored_sites(store, {site_dict["code"]: site_dict})
+            _update_stored_sites(store, site_dicts)
 
     if autorepack:
-        if something_changed:
+        for site_data_path in changed_paths | {sites_store_path}:
             repack(site_data_path, complevel=complevel, complib=complib)
-        if site_data_path != sites_store_path:
-            repack(sites_store_path, complevel=complevel, complib=complib)
+
+    failed = sum(d["status"] == "failed" for d in status.values())
+    core.log.info(f"updated {len(status) - failed} sites, {failed} failed")
+    return status
+
+
+def _append_values(store, values_path, values_df):
+    """append values to the datetime indexed table at values_path"""
+    values_df = values_df.reindex(columns=VALUES_COLUMNS).astype(object)
+    # a table keeps the timezone it was created with, so values with another
+    # UTC offset (after a daylight saving change) are converted to it
+    if getattr(values_df.index, "tz", None) is not None and values_path in store:
+        stored_tz = store.select(values_path, stop=0).index.tz
+        if stored_tz is not None:
+            values_df.index = values_df.index.tz_convert(stored_tz)
+    # map() infers float64 for all NaN columns, which would create a float
+    # column in the table that strings can't be appended to later
+    for column in VALUES_COLUMNS:
+        values_df[column] = values_df[column].map(_str_or_nan).astype(object)
+    store.append(
+        values_path,
+        values_df.sort_index(),
+        format="table",
+        min_itemsize=VALUES_MIN_ITEMSIZE,
+    )
 
 
 def _compression_kwargs(complevel=None, complib=None):
@@ -518,6 +690,26 @@ def _compression_kwargs(complevel=None, complib=None):
     return dict(complevel=complevel, complib=complib)
 
 
+def _convert_legacy_values(store, values_path):
+    """convert a fixed format values frame written by older versions to a
+    table, once"""
+    if store.get_storer(values_path).is_table:
+        return
+    values_df = store[values_path]
+    store.remove(values_path)
+    if len(values_df):
+        _append_values(store, values_path, values_df)
+
+
+def _fetch_batch(session, url_params):
+    """fetch a batch of sites, returns (fetched, seconds)"""
+    fetch_start = time.time()
+    url_params = dict(url_params)
+    service = url_params.pop("service")
+    fetched = core._fetch_site_values(service, url_params, session=session)
+    return fetched, time.time() - fetch_start
+
+
 @contextlib.contextmanager
 def _filter_warnings():
     with warnings.catch_warnings():
@@ -547,9 +739,8 @@ def _get_store(path, **kwargs):
     if not os.path.exists(dir_path):
         os.makedirs(dir_path)
 
-    with pandas.io.pytables.get_store(path, **kwargs) as store:
-        with _filter_warnings():
-            yield store
+    with pandas.HDFStore(path, **kwargs) as store, _filter_warnings():
+        yield store
 
 
 def _get_store_path(path, default_file_name):
@@ -581,6 +772,16 @@ def _nest_dataframe_dicts(unnested_df, nested_column, keys):
     return df
 
 
+def _parse_batch(content, query_isodate, methods):
+    """parse a batch of sites in a worker process, returns (sites_data,
+    seconds)"""
+    parse_start = time.time()
+    sites_data = core._parse_site_values(
+        io.BytesIO(content), query_isodate, methods=methods, by_site=True
+    )
+    return sites_data, time.time() - parse_start
+
+
 def _ptrepack(src, dst, complevel, complib):
     """run ptrepack to repack from src to dst"""
 
@@ -595,6 +796,7 @@ def _ptrepack(src, dst, complevel, complib):
             "",
             f"--complevel={complevel}",
             f"--complib={complib}",
+            "--propindexes",
             src,
             dst,
         ]
@@ -602,6 +804,64 @@ def _ptrepack(src, dst, complevel, complib):
             ptrepack.main()
 
 
+def _replace_values(store, values_path, values_df, window_start, window_end):
+    """replace the stored rows between window_start and window_end (inclusive)
+    with values_df"""
+    if values_path in store:
+        store.remove(values_path, where="index >= window_start & index <= window_end")
+    _append_values(store, values_path, values_df)
+
+
+def _select_values(store, values_path, window_start, window_end):
+    """read the stored rows between window_start and window_end (inclusive)"""
+    if values_path not in store:
+        return pandas.DataFrame(columns=VALUES_COLUMNS)
+    return store.select(
+        values_path, where="index >= window_start & index <= window_end"
+    )
+
+
+def _site_batches(site_codes, start, end, period, path, batch_size):
+    """yields (batch, url_params) for each batch of sites and service"""
+    if start is None and end is None and period is None:
+        last_refreshes = {
+            site_code: _get_last_refresh(
+                site_code, _get_store_path(path, site_code + ".h5")
+            )
+            for site_code in site_codes
+        }
+        never_refreshed = [
+            site_code for site_code in site_codes if last_refreshes[site_code] is None
+        ]
+        # sort so that each batch covers a similar refresh window
+        refreshed = sorted(
+            (site_code for site_code in site_codes if last_refreshes[site_code]),
+            key=lambda site_code: str(last_refreshes[site_code]),
+        )
+        groups = [(never_refreshed, False), (refreshed, True)]
+    else:
+        groups = [(list(site_codes), False)]
+
+    for group, from_last_refresh in groups:
+        for i in range(0, len(group), batch_size):
+            batch = group[i : i + batch_size]
+            batch_start, batch_period = start, period
+            if from_last_refresh:
+                batch_start = min(last_refreshes[site_code] for site_code in batch)
+            elif start is None and end is None and period is None:
+                batch_period = "all"
+            for service in ("daily", "instantaneous"):
+                url_params = core._site_data_url_params(
+                    ",".join(batch),
+                    service,
+                    start=batch_start,
+                    end=end,
+                    period=batch_period,
+                )
+                url_params["service"] = service
+                yield batch, url_params
+
+
 def _sites_df_to_dict(df):
     df = _nest_dataframe_dicts(df, "location", ["latitude", "longitude", "srs"])
     for tz_type in ["default_tz", "dst_tz"]:
@@ -631,6 +891,12 @@ def _sites_dict_to_df(sites_dict):
     return df
 
 
+def _str_or_nan(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return np.nan
+    return str(value)
+
+
 @contextlib.contextmanager
 def _sysargs_hacks():
     """temporarily replace sys.argv without leaking global state"""
@@ -654,6 +920,76 @@ def _unnest_dataframe_dicts(df, nested_column, keys):
     return df
 
 
+def _upsert_values(store, values_path, new_values, last_refresh):
+    """merge new_values into the stored table, only reading and rewriting the
+    rows in the window covered by new_values"""
+    _convert_legacy_values(store, values_path)
+    window_start = new_values.index.min()
+    window_end = new_values.index.max()
+
+    compare_cols = ["value", "qualifiers"]
+    original_values = _select_values(store, values_path, window_start, window_end)
+    if len(original_values) == 0:
+        new_values["last_modified"] = last_refresh
+        _append_values(store, values_path, new_values)
+        return
+
+    original_align, new_align = original_values.align(new_values)
+    new_nulls = pandas.isnull(new_align[compare_cols]).sum(axis=1).astype(bool)
+    modified_mask = ~new_nulls & (
+        (original_align[compare_cols] == new_align[compare_cols]).sum(axis=1)
+        < len(compare_cols)
+    )
+
+    # a column that is all NaN is read back as float64
+    combined = new_values.combine_first(original_values).astype(object)
+    combined.loc[modified_mask, "last_modified"] = last_refresh
+    _replace_values(store, values_path, combined, window_start, window_end)
+
+
+def _write_site_data(site_code, new_site_data, site_data_path, comp_kwargs):
+    """write the values and attributes for a site to its store
+
+    returns a (site_dict, something_changed) tuple
+    """
+    site_dict = {}
+    something_changed = False
+    with _get_store(site_data_path, mode="a", **comp_kwargs) as store:
+        for variable_code, data_dict in new_site_data.items():
+            variable_group_path = site_code + "/" + variable_code
+
+            site_dict = data_dict.pop("site")
+
+            values_path = variable_group_path + "/values"
+            new_values = _values_dicts_to_df(data_dict.pop("values", {}))
+
+            last_refresh = data_dict.get("last_refresh")
+            if last_refresh is None:
+                last_refresh = np.nan
+            new_values["last_checked"] = last_refresh
+            if values_path in store:
+                if len(new_values) == 0:
+                    continue
+                _upsert_values(store, values_path, new_values, last_refresh)
+            elif len(new_values) == 0:
+                # an empty table can't be created, keep a placeholder so the
+                # variable group and its attributes exist
+                store.put(values_path, new_values)
+            else:
+                new_values["last_modified"] = last_refresh
+                _append_values(store, values_path, new_values)
+            something_changed = True
+
+            variable_group = store.get_node(variable_group_path)
+            for key, value in data_dict.items():
+                setattr(variable_group._v_attrs, key, value)
+
+        site_group = store.get_node(site_code)
+        site_group._v_attrs.last_refresh = last_refresh
+
+    return site_dict, something_changed
+
+
 def _values_dicts_to_df(values_dicts):
     df = pandas.DataFrame(values_dicts, dtype=object)
     if len(df) == 0:
@@ -676,9 +1012,12 @@ def _variable_group_to_dict(store, variable_group, start=None):
     _v_attrs = variable_group._v_attrs
     variable_dict = {key: getattr(_v_attrs, key) for key in _v_attrs._f_list()}
     values_path = variable_group._v_pathname + "/values"
-    values_df = store[values_path]
-    if start:
-        values_df = values_df[values_df.index > start]
+    if start and store.get_storer(values_path).is_table:
+        values_df = store.select(values_path, where="index > start").sort_index()
+    else:
+        values_df = store[values_path].sort_index()
+        if start:
+            values_df = values_df[values_df.index > start]
     variable_dict["values"] = _values_df_to_dicts(values_df)
 
     return variable_dict
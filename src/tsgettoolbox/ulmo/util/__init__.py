@@ -4,6 +4,7 @@ __all__ = [
     "convert_datetime",
     "dict_from_dataframe",
     "dir_list",
+    "download_files",
     "download_if_new",
     "get_ulmo_dir",
     "mkdir_if_doesnt_exist",
@@ -18,6 +19,7 @@ __all__ = [
     "extract_from_zip",
     "generate_raster_uid",
     "mosaic_and_clip",
+    "sample_raster_tiles",
     "get_default_h5file_path",
     "get_or_create_group",
     "get_or_create_table",
@@ -31,6 +33,7 @@ from .misc import (
     convert_datetime,
     dict_from_dataframe,
     dir_list,
+    download_files,
     download_if_new,
     get_ulmo_dir,
     mkdir_if_doesnt_exist,
@@ -47,6 +50,7 @@ from .raster import (
     extract_from_zip,
     generate_raster_uid,
     mosaic_and_clip,
+    sample_raster_tiles,
 )
 
 try:
@@ -5,20 +5,406 @@ ulmo.util.raster
 Collection of useful functions for raster manipulation
 """
 
+import contextlib
 import hashlib
+import json
+import math
 import os
+import shutil
+import urllib.parse
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
 
 from .misc import download_if_new, mkdir_if_doesnt_exist
 
+CHUNK_SIZE = 1024 * 1024
+
+# attempts to finish an interrupted tile download
+DOWNLOAD_RETRIES = 3
+
+# largest window (in pixels) read at once to sample points from a tile
+MAX_SAMPLE_WINDOW = 4096 * 4096
+
+# reuse connections across tile downloads
+_session = requests.Session()
+
+
+def mosaic_and_clip(raster_tiles, xmin, ymin, xmax, ymax, output_path=None):
+    """mosaics raster_tiles and clips the mosaic to a bounding box in
+    geographic coordinates, reading only the part of each tile that overlaps
+    it.
+
+    Tiles are expected to share a crs and be aligned to the same pixel grid,
+    like the NED tiles of a layer; otherwise gdalbuildvrt and gdalwarp are
+    used. Requires rasterio.
+
+    Parameters
+    ----------
+    raster_tiles : list of str
+        paths of the raster tiles
+    xmin, ymin, xmax, ymax : float
+        bounding box in geographic coordinates
+    output_path : ``None`` or str
+        if ``None`` return the clipped mosaic, otherwise save it as a GeoTIFF
+        at output_path
+
+    Returns
+    -------
+    output : str or (numpy.ndarray, dict)
+        output_path if given, otherwise the clipped mosaic and its rasterio
+        profile
+    """
+    import numpy as np
+    import rasterio
+    from rasterio.warp import transform_bounds
+    from rasterio.windows import Window
+
+    print("Mosaic and clip to bounding box extents")
+    with rasterio.Env(), contextlib.ExitStack() as stack:
+        sources = [stack.enter_context(rasterio.open(tile)) for tile in raster_tiles]
+        first = sources[0]
+        if not _aligned(sources):
+            if output_path is None:
+                raise ValueError(
+                    "tiles don't share a crs and pixel grid, an output_path is "
+                    "needed to mosaic them with gdalwarp"
+                )
+            _gdal_mosaic_and_clip(raster_tiles, xmin, ymin, xmax, ymax, output_path)
+            return output_path
+
+        if not first.crs.is_geographic:
+            xmin, ymin, xmax, ymax = transform_bounds(
+                "EPSG:4326", first.crs, xmin, ymin, xmax, ymax
+            )
+
+        # snap the bounding box to the pixel grid of the tiles
+        transform = first.transform
+        col_off, row_off = (
+            math.floor(v)
+            for v in ~transform * (xmin, ymax)  # pixel of the top left corner
+        )
+        col_end, row_end = (math.ceil(v) for v in ~transform * (xmax, ymin))
+        out_transform = transform * transform.translation(col_off, row_off)
+        width, height = col_end - col_off, row_end - row_off
+        if width <= 0 or height <= 0:
+            raise ValueError("bounding box is empty")
+
+        dtype = first.dtypes[0]
+        nodata = first.nodata
+        if nodata is None:
+            nodata = np.nan if np.issubdtype(dtype, np.floating) else 0
+        mosaic = np.full((height, width), nodata, dtype=dtype)
+
+        for src in sources:
+            # pixel of the tile at the top left corner of the mosaic
+            col, row = (
+                round(v) for v in ~src.transform * (out_transform.c, out_transform.f)
+            )
+            # read only the part of the tile that falls in the mosaic
+            c0, r0 = max(col, 0), max(row, 0)
+            c1, r1 = min(col + width, src.width), min(row + height, src.height)
+            if c1 <= c0 or r1 <= r0:
+                continue
+            data = src.read(1, window=Window(c0, r0, c1 - c0, r1 - r0))
+            valid = np.ones(data.shape, dtype=bool)
+            if src.nodata is not None:
+                valid = data != src.nodata
+                if np.isnan(src.nodata):
+                    valid = ~np.isnan(data)
+            mosaic[r0 - row : r1 - row, c0 - col : c1 - col][valid] = data[valid]
+
+        profile = {
+            "driver": "GTiff",
+            "dtype": dtype,
+            "nodata": nodata,
+            "width": width,
+            "height": height,
+            "count": 1,
+            "crs": first.crs,
+            "transform": out_transform,
+            "tiled": True,
+            "compress": "deflate",
+        }
+
+    if output_path is None:
+        return mosaic, profile
+
+    with rasterio.open(output_path, "w", **profile) as dst:
+        dst.write(mosaic, 1)
+    print(f"Output raster saved at {output_path}")
+    return output_path
+
+
+def sample_raster_tiles(raster_tiles, points):
+    """returns the values of raster_tiles at points, without building a
+    mosaic. Requires rasterio.
+
+    Parameters
+    ----------
+    raster_tiles : list of str
+        paths of the raster tiles
+    points : sequence of (float, float)
+        (longitude, latitude) of the points
+
+    Returns
+    -------
+    values : numpy.ndarray
+        value at each point, NaN if no tile covers it or it is nodata
+    """
+    import numpy as np
+    import rasterio
+    from rasterio.warp import transform
+    from rasterio.windows import Window
+
+    xs, ys = (np.asarray(v, dtype=float) for v in zip(*points))
+    values = np.full(len(xs), np.nan)
+    with rasterio.Env():
+        for tile in raster_tiles:
+            with rasterio.open(tile) as src:
+                tile_xs, tile_ys = xs, ys
+                if not src.crs.is_geographic:
+                    tile_xs, tile_ys = (
+                        np.asarray(v) for v in transform("EPSG:4326", src.crs, xs, ys)
+                    )
+                cols, rows = ~src.transform * (tile_xs, tile_ys)
+                cols, rows = np.floor(cols).astype(int), np.floor(rows).astype(int)
+                todo = (
+                    np.isnan(values)
+                    & (rows >= 0)
+                    & (rows < src.height)
+                    & (cols >= 0)
+                    & (cols < src.width)
+                )
+                if not todo.any():
+                    continue
+                rows, cols = rows[todo], cols[todo]
+
+                row_off, col_off = rows.min(), cols.min()
+                window = Window(
+                    col_off,
+                    row_off,
+                    cols.max() - col_off + 1,
+                    rows.max() - row_off + 1,
+                )
+                if window.width * window.height <= MAX_SAMPLE_WINDOW:
+                    # read the blocks around the points once
+                    data = src.read(1, window=window, masked=True)
+                    sampled = data[rows - row_off, cols - col_off]
+                else:
+                    sampled = np.ma.concatenate(
+                        list(
+                            src.sample(
+                                zip(tile_xs[todo], tile_ys[todo]),
+                                indexes=1,
+                                masked=True,
+                            )
+                        )
+                    )
+                values[todo] = np.ma.filled(sampled.astype(float), np.nan)
+    return values
+
+
+def download_tiles(
+    path, tile_urls, tile_fmt, check_modified=False, cache_path=None, max_workers=4
+):
+    """downloads tile_urls concurrently into a content addressed cache shared
+    by every layer and bounding box, then links or extracts them into path.
+
+    Parameters
+    ----------
+    path : str
+        directory the tiles are placed in
+    tile_urls : str or list of str
+        urls of the tiles, or of zip files containing them
+    tile_fmt : str
+        extension of the raster file to extract from each zip file, or ``""``
+        if the urls point directly at the tiles
+    check_modified : bool
+        if ``True``, use a conditional request to check if a newer version of
+        a cached tile is available
+    cache_path : ``None`` or str
+        directory of the tile cache, if ``None`` the "tiles" directory next
+        to path
+    max_workers : int
+        number of tiles downloaded at the same time
+
+    Returns
+    -------
+    raster_tiles : list of str
+        paths of the tiles, in the order of tile_urls
+    """
+    if isinstance(tile_urls, str):
+        tile_urls = [tile_urls]
+
+    if cache_path is None:
+        cache_path = os.path.join(os.path.dirname(os.path.abspath(path)), "tiles")
+    mkdir_if_doesnt_exist(path)
+    mkdir_if_doesnt_exist(os.path.join(cache_path, "objects"))
+    mkdir_if_doesnt_exist(os.path.join(cache_path, "partial"))
+    index = _load_tile_index(cache_path)
+
+    def _download(url):
+        return _download_tile(url, cache_path, index.get(url), check_modified)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_download, url): url for url in tile_urls}
+        for i, future in enumerate(as_completed(futures)):
+            url = futures[future]
+            index[url] = future.result()
+            print(f"... tile {i + 1} of {len(tile_urls)} ready from {url}")
+    _save_tile_index(cache_path, index)
+
+    raster_tiles = []
+    for url in tile_urls:
+        object_path = _tile_object_path(cache_path, index[url]["sha256"])
+        tile_path = os.path.join(path, os.path.split(url)[-1])
+        if tile_fmt == "":
+            _link_or_copy(object_path, tile_path)
+        else:
+            tile_path = extract_from_zip(object_path, tile_path, tile_fmt)
+        raster_tiles.append(tile_path)
+    return raster_tiles
+
+
+def extract_from_zip(zip_path, tile_path, tile_fmt):
+    """extracts the tile_fmt raster in zip_path to tile_path (with its
+    extension replaced by tile_fmt), streaming the zip member to disk; an
+    already extracted tile is reused"""
+    tile_path = os.path.splitext(tile_path)[0] + tile_fmt
+    with zipfile.ZipFile(zip_path) as z:
+        info = [x for x in z.infolist() if tile_fmt in x.filename[-4:]][0]
+        if (
+            os.path.exists(tile_path)
+            and os.path.getsize(tile_path) == info.file_size
+            and os.path.getmtime(tile_path) >= os.path.getmtime(zip_path)
+        ):
+            return tile_path
+
+        tmp_path = f"{tile_path}.tmp"
+        with z.open(info) as member, open(tmp_path, "wb") as f:
+            shutil.copyfileobj(member, f, CHUNK_SIZE)
+        os.replace(tmp_path, tile_path)
+        print(f"... ... {tile_fmt} format raster saved at {tile_path}")
+
+    return tile_path
+
+
+def generate_raster_uid(layer, xmin, ymin, xmax, ymax):
+    return hashlib.md5(
+        ",".join([layer, repr(xmin), repr(ymin), repr(xmax), repr(ymax)]).encode()
+    ).hexdigest()
+
+
+def _aligned(sources):
+    """True if the rasterio datasets share a crs, resolution and pixel grid"""
+    first = sources[0]
+    for src in sources[1:]:
+        if src.crs != first.crs or not _close(src.res, first.res):
+            return False
+        # offsets between tiles must be whole pixels
+        col, row = ~first.transform * (src.transform.c, src.transform.f)
+        if not _close((col, row), (round(col), round(row))):
+            return False
+    return True
 
-def mosaic_and_clip(raster_tiles, xmin, ymin, xmax, ymax, output_path):
+
+def _close(a, b, tolerance=1e-6):
+    return all(abs(x - y) <= tolerance for x, y in zip(a, b))
+
+
+def _download_tile(url, cache_path, entry=None, check_modified=False):
+    """downloads url into the object store of cache_path unless entry (its
+    index entry) is current; resumes interrupted downloads with a Range
+    request guarded by If-Range, so a tile that changed on the server is
+    downloaded again from the start, and returns the new index entry"""
+    if entry is not None:
+        if not os.path.exists(_tile_object_path(cache_path, entry["sha256"])):
+            entry = None
+        elif not check_modified:
+            return entry
+
+    parsed = urllib.parse.urlparse(url)
+    if not parsed.scheme.startswith("http"):
+        # no range or conditional requests, download to a partial file
+        part_path = _tile_partial_path(cache_path, url)
+        download_if_new(url, part_path, check_modified=True)
+        with open(part_path, "rb") as f:
+            sha256 = hashlib.sha256()
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        return _store_tile_object(cache_path, part_path, sha256, {})
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    part_path = _tile_partial_path(cache_path, url)
+    for attempt in range(DOWNLOAD_RETRIES):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        validator = _load_tile_validator(part_path) if offset else None
+        if offset and validator is None:
+            # can't tell if the tile changed since, start over
+            os.remove(part_path)
+            offset = 0
+        request_headers = dict(headers)
+        if offset:
+            request_headers["Range"] = f"bytes={offset}-"
+            request_headers["If-Range"] = validator
+        try:
+            with _session.get(
+                url, headers=request_headers, stream=True, timeout=60
+            ) as r:
+                if r.status_code == 304:
+                    return entry
+                if r.status_code == 416:
+                    # stale partial file, start over
+                    os.remove(part_path)
+                    continue
+                r.raise_for_status()
+                if r.status_code != 206:
+                    offset = 0
+                    _save_tile_validator(part_path, r.headers)
+
+                sha256 = hashlib.sha256()
+                if offset:
+                    with open(part_path, "rb") as f:
+                        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                            sha256.update(chunk)
+                with open(part_path, "ab" if offset else "wb") as f:
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        sha256.update(chunk)
+
+                content_length = r.headers.get("content-length")
+                if content_length and os.path.getsize(part_path) != offset + int(
+                    content_length
+                ):
+                    raise requests.exceptions.ChunkedEncodingError(
+                        f"incomplete download of {url}"
+                    )
+                return _store_tile_object(cache_path, part_path, sha256, r.headers)
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+        ):
+            if attempt == DOWNLOAD_RETRIES - 1:
+                raise
+            print(f"... ... resuming download of {url}")
+    raise OSError(f"could not download {url}")
+
+
+def _gdal_mosaic_and_clip(raster_tiles, xmin, ymin, xmax, ymax, output_path):
+    """mosaic and clip with gdalbuildvrt and gdalwarp"""
     import subprocess
 
     import rasterio
     from pyproj import Proj
 
-    print("Mosaic and clip to bounding box extents")
     output_vrt = f"{os.path.splitext(output_path)[0]}.vrt"
     print(
         subprocess.check_output(
@@ -26,7 +412,7 @@ def mosaic_and_clip(raster_tiles, xmin, ymin, xmax, ymax, output_path):
         )
     )
     # check crs
-    with rasterio.drivers():
+    with rasterio.Env():
         with rasterio.open(output_vrt) as src:
             p = Proj(src.crs)
 
@@ -48,45 +434,90 @@ def mosaic_and_clip(raster_tiles, xmin, ymin, xmax, ymax, output_path):
             ]
         )
     )
-    print("Output raster saved at %s", output_path)
+    print(f"Output raster saved at {output_path}")
 
 
-def download_tiles(path, tile_urls, tile_fmt, check_modified=False):
-    raster_tiles = []
+def _link_or_copy(src, dst):
+    """hard link src to dst if possible, otherwise copy it"""
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
 
-    if isinstance(tile_urls, str):
-        tile_urls = [tile_urls]
 
-    for i, url in enumerate(tile_urls):
-        filename = os.path.split(url)[-1]
-        print(f"... downloading tile {i + 1} of {len(tile_urls)} from {url}")
-        mkdir_if_doesnt_exist(path)
-        mkdir_if_doesnt_exist(os.path.join(path, "zip"))
-        tile_path = os.path.join(path, filename)
-        if tile_fmt == "":
-            download_if_new(url, tile_path, check_modified=check_modified)
-        else:
-            zip_path = os.path.join(path, "zip", filename)
-            download_if_new(url, zip_path, check_modified=check_modified)
-            print(f"... ... zipfile saved at {zip_path}")
-            tile_path = extract_from_zip(zip_path, tile_path, tile_fmt)
+def _load_tile_index(cache_path):
+    """returns the {url: {"sha256", "etag", "last_modified"}} tile index"""
+    index_path = os.path.join(cache_path, "index.json")
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path) as f:
+        return json.load(f)
 
-        raster_tiles.append(tile_path)
-    return raster_tiles
 
+def _load_tile_validator(part_path):
+    """returns the ETag or Last-Modified the partial download started with"""
+    with (
+        contextlib.suppress(FileNotFoundError),
+        open(_tile_validator_path(part_path)) as f,
+    ):
+        return f.read()
+    return None
 
-def extract_from_zip(zip_path, tile_path, tile_fmt):
-    tile_path = os.path.splitext(tile_path)[0] + tile_fmt
-    with zipfile.ZipFile(zip_path) as z:
-        fname = [x for x in z.namelist() if tile_fmt in x[-4:]][0]
-        with open(tile_path, "wb") as f:
-            f.write(z.read(fname))
-            print(f"... ... {tile_fmt} format raster saved at {tile_path}")
 
-    return tile_path
+def _save_tile_index(cache_path, index):
+    index_path = os.path.join(cache_path, "index.json")
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
 
 
-def generate_raster_uid(layer, xmin, ymin, xmax, ymax):
-    return hashlib.md5(
-        ",".join([layer, repr(xmin), repr(ymin), repr(xmax), repr(ymax)])
-    ).hexdigest()
+def _save_tile_validator(part_path, headers):
+    """keeps the validator for If-Range, a weak ETag can't be used for it"""
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        validator = etag
+    else:
+        validator = headers.get("last-modified")
+    validator_path = _tile_validator_path(part_path)
+    if validator is None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(validator_path)
+        return
+    with open(validator_path, "w") as f:
+        f.write(validator)
+
+
+def _store_tile_object(cache_path, part_path, sha256, headers):
+    """moves a completed download into the object store, returns its index
+    entry"""
+    digest = sha256.hexdigest()
+    object_path = _tile_object_path(cache_path, digest)
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(_tile_validator_path(part_path))
+    if os.path.exists(object_path):
+        os.remove(part_path)
+    else:
+        os.replace(part_path, object_path)
+    return {
+        "sha256": digest,
+        "etag": headers.get("etag"),
+        "last_modified": headers.get("last-modified"),
+    }
+
+
+def _tile_object_path(cache_path, digest):
+    return os.path.join(cache_path, "objects", digest)
+
+
+def _tile_partial_path(cache_path, url):
+    url_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(cache_path, "partial", url_hash)
+
+
+def _tile_validator_path(part_path):
+    return f"{part_path}.validator"
@@ -1,11 +1,44 @@
+import re
+
 import isodate
+import numpy as np
+import pandas
 from lxml import etree
 
 from .. import util
 
+# key used for the text of value elements when collecting values
+_VALUE_TEXT = "#text"
+
+# the iso 8601 forms used by WaterML services, anything else is parsed with
+# isodate
+_DATETIME_RE = (
+    r"^(?P<minutes>\d{4}-\d{2}-\d{2}T\d{2}:\d{2})(?P<seconds>:\d{2})?(?:\.\d+)?"
+    r"(?P<offset>Z|[+-]\d{2}:?\d{2})?$"
+)
+_SUFFIX_RE = re.compile(r"^(\.\d+)?(?:Z|([+-])(\d{2}):?(\d{2}))?$")
+
+
+def parse_site_values(
+    content_io,
+    namespace,
+    query_isodate=None,
+    methods=None,
+    by_site=False,
+    columns=False,
+):
+    """parses values out of a waterml file; content_io should be a file-like object
+
+    The file is parsed incrementally and value elements are discarded as soon
+    as they have been collected, so memory use is bounded by the size of the
+    values rather than the size of the document tree.
+
+    If by_site is True, the returned dict is keyed by site code first, which is
+    needed for responses that contain more than one site.
 
-def parse_site_values(content_io, namespace, query_isodate=None, methods=None):
-    """parses values out of a waterml file; content_io should be a file-like object"""
+    If columns is True, "values" is a dict of NumPy arrays (see
+    _values_columns) instead of a list of dicts, one per value.
+    """
     data_dict = {}
     metadata_elements = [
         # (element name, name of collection,
@@ -17,76 +50,105 @@ def parse_site_values(content_io, namespace, query_isodate=None, methods=None):
         ("qualityControlLevel", "quality_control_levels", "id"),
         ("source", "sources", "id"),
     ]
-    for event, ele in etree.iterparse(content_io):
-        if ele.tag == f"{namespace}timeSeries":
-            source_info_element = ele.find(f"{namespace}sourceInfo")
-            site_info = _parse_site_info(source_info_element, namespace)
-            var_element = ele.find(f"{namespace}variable")
-            variable = _parse_variable(var_element, namespace)
-            values_elements = ele.findall(f"{namespace}values")
-            code = variable["code"]
-            if isinstance(methods, str):
-                method = methods
-            elif isinstance(methods, dict):
-                method = methods.get(code, None)
-            else:
-                method = None
-            if "statistic" in variable:
-                code += f":{variable['statistic']['code']}"
-
-            if method is None:
-                if len(values_elements) > 1:
-                    raise ValueError(
-                        f'found more than one method for {variable["code"]}. need to specifyspecify code or "all".'
-                    )
-                values_element = values_elements[0]
-                values = _parse_values(values_element, namespace)
-                data_dict[code] = {
-                    "site": site_info,
+    value_tag = f"{namespace}value"
+    values_tag = f"{namespace}values"
+    time_series_tag = f"{namespace}timeSeries"
+    values_view = _values_columns if columns else _values_dicts
+
+    # raw values collected for each values element of the current timeSeries
+    collected = []
+    raw_values = _new_raw_values()
+    for event, ele in etree.iterparse(
+        content_io, tag=(value_tag, values_tag, time_series_tag)
+    ):
+        if ele.tag == value_tag:
+            _collect_value(raw_values, ele)
+            # drop the value elements that have already been collected
+            ele.clear()
+            previous = ele.getprevious()
+            if previous is not None and previous.tag == value_tag:
+                ele.getparent().remove(previous)
+            continue
+
+        if ele.tag == values_tag:
+            for value_element in ele.findall(value_tag):
+                ele.remove(value_element)
+            collected.append(raw_values)
+            raw_values = _new_raw_values()
+            continue
+
+        source_info_element = ele.find(f"{namespace}sourceInfo")
+        site_info = _parse_site_info(source_info_element, namespace)
+        site_dict = (
+            data_dict.setdefault(site_info["code"], {}) if by_site else data_dict
+        )
+        var_element = ele.find(f"{namespace}variable")
+        variable = _parse_variable(var_element, namespace)
+        values_elements = list(zip(ele.findall(values_tag), collected))
+        collected = []
+        code = variable["code"]
+        if isinstance(methods, str):
+            method = methods
+        elif isinstance(methods, dict):
+            method = methods.get(code, None)
+        else:
+            method = None
+        if "statistic" in variable:
+            code += f":{variable['statistic']['code']}"
+
+        if method is None:
+            if len(values_elements) > 1:
+                raise ValueError(
+                    f'found more than one method for {variable["code"]}. need to specifyspecify code or "all".'
+                )
+            values_element, raw = values_elements[0]
+            site_dict[code] = {
+                "site": site_info,
+                "variable": variable,
+            }
+            site_dict[code].update({"values": values_view(raw)})
+            metadata = _parse_metadata(values_element, metadata_elements, namespace)
+            site_dict[code].update(metadata)
+            if query_isodate:
+                site_dict[code]["last_refresh"] = query_isodate
+        elif method == "all":
+            for values_element, raw in values_elements:
+                metadata = _parse_metadata(values_element, metadata_elements, namespace)
+                updated_code = (
+                    f"{code}:" + str(list(metadata["methods"].values())[0]["id"])
+                    if len(values_elements) > 1
+                    else code
+                )
+                site_dict[updated_code] = {
+                    "site": site_info.copy(),
                     "variable": variable,
                 }
-                data_dict[code].update({"values": values})
-                metadata = _parse_metadata(values_element, metadata_elements, namespace)
-                data_dict[code].update(metadata)
+                site_dict[updated_code].update({"values": values_view(raw)})
+                site_dict[updated_code].update(metadata)
                 if query_isodate:
-                    data_dict[code]["last_refresh"] = query_isodate
-            elif method == "all":
-                for values_element in values_elements:
-                    values = _parse_values(values_element, namespace)
+                    site_dict[updated_code]["last_refresh"] = query_isodate
+        else:
+            for values_element, raw in values_elements:
+                if (
+                    values_element.find(f'{namespace}method[@methodID="{method}"]')
+                    is not None
+                ):
                     metadata = _parse_metadata(
                         values_element, metadata_elements, namespace
                     )
-                    updated_code = (
-                        f"{code}:" + str(list(metadata["methods"].values())[0]["id"])
-                        if len(values_elements) > 1
-                        else code
-                    )
-                    data_dict[updated_code] = {
-                        "site": site_info.copy(),
+                    site_dict[code] = {
+                        "site": site_info,
                         "variable": variable,
                     }
-                    data_dict[updated_code].update({"values": values})
-                    data_dict[updated_code].update(metadata)
+                    site_dict[code].update({"values": values_view(raw)})
+                    site_dict[code].update(metadata)
                     if query_isodate:
-                        data_dict[updated_code]["last_refresh"] = query_isodate
-            else:
-                for values_element in values_elements:
-                    if (
-                        values_element.find(f'{namespace}method[@methodID="{method}"]')
-                        is not None
-                    ):
-                        values = _parse_values(values_element, namespace)
-                        metadata = _parse_metadata(
-                            values_element, metadata_elements, namespace
-                        )
-                        data_dict[code] = {
-                            "site": site_info,
-                            "variable": variable,
-                        }
-                        data_dict[code].update({"values": values})
-                        data_dict[code].update(metadata)
-                        if query_isodate:
-                            data_dict[code]["last_refresh"] = query_isodate
+                        site_dict[code]["last_refresh"] = query_isodate
+
+        # the timeSeries has been parsed, drop it and any earlier ones
+        ele.clear()
+        while ele.getprevious() is not None:
+            del ele.getparent()[0]
 
     return data_dict
 
@@ -148,6 +210,24 @@ def parse_variables(content_io, namespace):
     return variables
 
 
+def _collect_value(raw_values, value_element):
+    """appends the text and attributes of a value element to raw_values, a
+    dict of equal length lists (missing entries are None)"""
+    raw_values["count"] += 1
+    count = raw_values["count"]
+    columns = raw_values["columns"]
+    items = list(value_element.attrib.items())
+    if len(value_element) == 0 and value_element.text is not None:
+        items.append((_VALUE_TEXT, value_element.text))
+    for key, value in items:
+        column = columns.get(key)
+        if column is None:
+            column = columns[key] = []
+        if len(column) < count - 1:
+            column.extend([None] * (count - 1 - len(column)))
+        column.append(value)
+
+
 def _element_dict(element, exclude_children=None, prepend_attributes=True):
     """converts an element to a dict representation with CamelCase tag names and
     attributes converted to underscores; this is a generic converter for cases
@@ -204,6 +284,16 @@ def _find_unit(element, namespace):
     return unit_element
 
 
+def _new_raw_values():
+    return {"count": 0, "columns": {}}
+
+
+def _padded(column, count):
+    """returns column as an object array padded with None to count"""
+    column = np.array(column + [None] * (count - len(column)), dtype=object)
+    return column
+
+
 def _parse_datetime(datetime_str):
     """returns an iso 8601 datetime string; USGS returns fractions of a second
     which are usually all 0s. ISO 8601 does not limit the number of decimal
@@ -215,6 +305,58 @@ def _parse_datetime(datetime_str):
     return isodate.datetime_isoformat(isodate.parse_datetime(datetime_str))
 
 
+def _parse_datetimes64(datetime_strs):
+    """vectorized parse of iso 8601 datetime strings to datetime64, converted
+    to UTC where the strings carry an offset"""
+    datetime_strs = pandas.Series(datetime_strs, dtype=object)
+    local = pandas.to_datetime(
+        datetime_strs.str[:19], format="%Y-%m-%dT%H:%M:%S", errors="coerce"
+    )
+    # whatever follows the seconds (fractions and offset) only takes a
+    # handful of distinct values, so parse those once each
+    suffixes = datetime_strs.str[19:]
+    suffix_offsets = {}
+    for suffix in suffixes.unique():
+        match = _SUFFIX_RE.match(suffix) if isinstance(suffix, str) else None
+        if match is None:
+            suffix_offsets = None
+            break
+        fraction, sign, hours, minutes = match.groups()
+        offset = pandas.Timedelta(float(fraction or 0), unit="s")
+        if sign:
+            offset -= int(f"{sign}1") * pandas.Timedelta(
+                hours=int(hours), minutes=int(minutes)
+            )
+        suffix_offsets[suffix] = offset
+
+    if suffix_offsets is None or local.isna().any():
+        parsed = pandas.to_datetime(
+            _parse_datetimes(datetime_strs), utc=True, format="ISO8601"
+        )
+        return parsed.tz_convert(None).to_numpy()
+    return (local + pandas.to_timedelta(suffixes.map(suffix_offsets))).to_numpy()
+
+
+def _parse_datetimes(datetime_strs):
+    """vectorized _parse_datetime, returns an object array of iso 8601
+    datetime strings"""
+    datetime_strs = pandas.Series(datetime_strs, dtype=object)
+    parts = datetime_strs.str.extract(_DATETIME_RE)
+    seconds = parts["seconds"].fillna(":00")
+    offset = parts["offset"].fillna("")
+    offset = offset.str.replace(r"^([+-]\d{2})(\d{2})$", r"\1:\2", regex=True)
+    offset = offset.mask(offset.isin(["+00:00", "-00:00"]), "Z")
+    parsed = parts["minutes"] + seconds + offset
+
+    # anything the fast path can't handle goes through isodate
+    unmatched = parts["minutes"].isna()
+    if unmatched.any():
+        parsed[unmatched] = [
+            _parse_datetime(datetime_str) for datetime_str in datetime_strs[unmatched]
+        ]
+    return parsed.to_numpy(dtype=object)
+
+
 def _parse_geog_location(geog_location, namespace):
     """returns a dict representation of a geogLocation etree element"""
     return_dict = {
@@ -421,21 +563,59 @@ def _parse_unit(unit_element, namespace):
     return return_dict
 
 
-def _parse_value(value_element, namespace):
-    value_dict = _element_dict(value_element, prepend_attributes=False)
-    datetime = _parse_datetime(value_dict.pop("date_time"))
-    value_dict["datetime"] = datetime
-    return value_dict
-
-
-def _parse_values(values_element, namespace):
-    """returns a list of dicts that represent the values for a given etree
-    values element
+def _values_columns(raw_values):
+    """returns the values collected in raw_values as a dict of NumPy arrays:
+    'datetime' (datetime64, converted to UTC if the values carry offsets),
+    'value' (float64), 'qualifiers' and 'method' (object, None if missing) and
+    an object array for each other attribute of the value elements
     """
+    count = raw_values["count"]
+    columns = {
+        key: _padded(column, count) for key, column in raw_values["columns"].items()
+    }
+    date_times = columns.pop("dateTime", np.full(count, None, dtype=object))
+    values = columns.pop(_VALUE_TEXT, np.full(count, None, dtype=object))
+    method = columns.pop("methodCode", columns.pop("methodID", None))
+
+    values_columns = {
+        "datetime": _parse_datetimes64(date_times),
+        "value": pandas.to_numeric(
+            pandas.Series(values, dtype=object), errors="coerce"
+        ).to_numpy(dtype=np.float64),
+        "qualifiers": columns.pop("qualifiers", np.full(count, None, dtype=object)),
+        "method": method if method is not None else np.full(count, None, dtype=object),
+    }
+    for key, column in columns.items():
+        values_columns[util.camel_to_underscore(key.split("}")[-1])] = column
+    return values_columns
+
+
+def _values_dicts(raw_values):
+    """returns the values collected in raw_values as a list of dicts, one per
+    value element, in the form produced by _element_dict"""
+    count = raw_values["count"]
+    columns = {
+        (
+            _VALUE_TEXT
+            if key == _VALUE_TEXT
+            else _element_dict_attribute_name(key, "value", prepend_element_name=False)
+        ): _padded(column, count)
+        for key, column in raw_values["columns"].items()
+    }
+    if "date_time" in columns:
+        columns["datetime"] = _parse_datetimes(columns.pop("date_time"))
+    if _VALUE_TEXT in columns:
+        columns["value"] = columns.pop(_VALUE_TEXT)
 
+    keys = list(columns)
     return [
-        _parse_value(value, namespace)
-        for value in values_element.findall(namespace + "value")
+        {
+            key: value
+            for key, value in zip(keys, row)
+            if value is not None
+            and not (isinstance(value, str) and value.split(":")[0] in ["xsd", "xsi"])
+        }
+        for row in zip(*columns.values())
     ]
 
 
@@ -10,10 +10,13 @@ def parse_site_infos(content_io):
     )
 
 
-def parse_site_values(content_io, query_isodate=None):
+def parse_site_values(content_io, query_isodate=None, columns=False):
     """parses values out of a waterml file; content_io should be a file-like object"""
     return common.parse_site_values(
-        content_io, WATERML_V1_0_NAMESPACE, query_isodate=query_isodate
+        content_io,
+        WATERML_V1_0_NAMESPACE,
+        query_isodate=query_isodate,
+        columns=columns,
     )
 
 
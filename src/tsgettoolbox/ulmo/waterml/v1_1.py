@@ -10,10 +10,17 @@ def parse_site_infos(content_io):
     )
 
 
-def parse_site_values(content_io, query_isodate=None, methods=None):
+def parse_site_values(
+    content_io, query_isodate=None, methods=None, by_site=False, columns=False
+):
     """parses values out of a waterml file; content_io should be a file-like object"""
     return common.parse_site_values(
-        content_io, WATERML_V1_1_NAMESPACE, query_isodate=query_isodate, methods=methods
+        content_io,
+        WATERML_V1_1_NAMESPACE,
+        query_isodate=query_isodate,
+        methods=methods,
+        by_site=by_site,
+        columns=columns,
     )
 
 
@@ -7,10 +7,13 @@ import contextlib
 import datetime
 import getpass
 import io
+import json
 import os
 import platform
 import sys
+import tempfile
 import textwrap
+import time
 import xml
 from multiprocessing import Pool
 from netrc import netrc
@@ -21,7 +24,7 @@ import numpy as np
 import pandas as pd
 import requests
 from haversine import haversine_vector
-from platformdirs import user_config_dir
+from platformdirs import user_config_dir, user_data_dir
 from pydap.client import open_url
 from requests.adapters import HTTPAdapter, Retry
 from siphon.ncss import NCSS
@@ -132,6 +135,42 @@ def read_api_key(service):
     return api_key
 
 
+def get_tsget_dir(sub_dir=None):
+    """Return the tsgettoolbox data directory, creating it if needed."""
+    return_dir = user_data_dir("tsgettoolbox", "tsgettoolbox")
+    if sub_dir:
+        return_dir = os.path.join(return_dir, sub_dir)
+    os.makedirs(return_dir, exist_ok=True)
+    return return_dir
+
+
+def cached_json(path, ttl, fetch):
+    """Return JSON cached at `path`, calling `fetch` when older than `ttl`.
+
+    Parameters
+    ----------
+    path : str
+        File that holds the cached JSON.
+    ttl : float or None
+        Maximum age of the cached file in seconds.  If None the cached file
+        never expires.
+    fetch : callable
+        Function without arguments that returns the JSON serializable object
+        to cache.
+    """
+    with contextlib.suppress(OSError, ValueError):
+        if ttl is None or time.time() - os.path.getmtime(path) < ttl:
+            with open(path, encoding="utf-8") as fpcache:
+                return json.load(fpcache)
+    data = fetch()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as fpcache:
+        json.dump(data, fpcache)
+    os.replace(tmppath, path)
+    return data
+
+
 def requests_retry_session(
     retries=3,
     backoff_factor=0.1,
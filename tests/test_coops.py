@@ -0,0 +1,129 @@
+import pandas as pd
+import pytest
+
+from tsgettoolbox.functions import coops
+
+
+def _records(flags):
+    return [
+        {"t": f"2020-01-01 0{hour}:00", "v": str(hour), "s": "0.01", "f": flags}
+        for hour in range(3)
+    ]
+
+
+def test_coops_flags(monkeypatch):
+    def retrieve_json(urls, kwds, disable=False):
+        return [{"data": _records("1,0,0,1")}, {"data": _records("0,0,0")}]
+
+    monkeypatch.setattr(coops.ar, "retrieve_json", retrieve_json)
+
+    df = coops.coops(
+        "8720218",
+        product=["water_level", "ofs_water_level"],
+        range=24,
+        time_zone="GMT",
+        datum="MLLW",
+    )
+
+    assert df["water_level:m"].tolist() == [0.0, 1.0, 2.0]
+    assert df["water_level_Inferred"].tolist() == [True] * 3
+    assert df["water_level_TempRateTol"].tolist() == [True] * 3
+    assert not df["water_level_RateTol"].any()
+    # products without a known flag layout keep the flags as strings
+    assert df["ofs_water_level:"].tolist() == [0.0, 1.0, 2.0]
+    assert df["f"].tolist() == ["0,0,0"] * 3
+    assert df.index[0] == pd.Timestamp("2020-01-01")
+
+
+@pytest.fixture
+def mdapi(tmp_path, monkeypatch):
+    """serves mdapi station metadata and empty datagetter responses, returns
+    the requested (url, params)"""
+    requested = []
+
+    def retrieve_json(urls, kwds, disable=False):
+        requested.extend((url, kwd["params"]) for url, kwd in zip(urls, kwds))
+        if urls[0].endswith("/stations.json"):
+            return [
+                {
+                    "stations": [
+                        {
+                            "id": 8720218,
+                            "details": {
+                                "established": "2010-01-01 00:00:00",
+                                "removed": "2015-01-01 00:00:00",
+                                "timezone": -5,
+                            },
+                        },
+                        {"id": 8720219, "timezonecorr": -5},
+                    ]
+                }
+            ]
+        if urls[0].endswith("/8720219/details.json"):
+            raise coops.ar.exceptions.ServiceError("not found")
+        if urls[0].endswith("/8720219.json"):
+            return [{"established": "2012-01-01 00:00:00", "timezonecorr": -5}]
+        return [{"data": []} for _ in urls]
+
+    monkeypatch.setattr(coops.ar, "retrieve_json", retrieve_json)
+    monkeypatch.setattr(
+        coops.utils, "get_tsget_dir", lambda sub_dir: str(tmp_path / sub_dir)
+    )
+    return requested
+
+
+def test_station_registry(mdapi):
+    assert coops._station_metadata("8720218") == {
+        "established": "2010-01-01 00:00:00",
+        "removed": "2015-01-01 00:00:00",
+        "timezone": -5,
+    }
+    assert coops._station_metadata("8720218")["timezone"] == -5
+    # the registry is loaded once
+    assert len(mdapi) == 1
+
+    coops._load_station_registry(refresh=True)
+    assert len(mdapi) == 2
+
+
+def test_station_metadata_fallback(mdapi):
+    # the registry entry has no established date, so the station is looked up
+    # on its own, falling back to the older station service
+    expected = {"established": "2012-01-01 00:00:00", "timezone": -5}
+    assert coops._station_metadata("8720219") == expected
+    assert coops._station_metadata("8720219") == expected
+    assert [url.rsplit("/", 1)[-1] for url, _ in mdapi] == [
+        "stations.json",
+        "details.json",
+        "8720219.json",
+    ]
+
+
+def test_coops_clips_to_station_period(mdapi):
+    with pytest.warns(UserWarning, match="No data"):
+        coops.coops(
+            "8720218",
+            product=["monthly_mean"],
+            begin_date=pd.Timestamp("2000-01-01"),
+            end_date=pd.Timestamp("2020-01-01"),
+            time_zone="GMT",
+            datum="MLLW",
+        )
+
+    _, params = mdapi[-1]
+    assert (params["begin_date"], params["end_date"]) == ("20100101", "20150101")
+
+
+def test_coops_outside_station_period(mdapi):
+    with pytest.warns(UserWarning, match="no data between the requested"):
+        df = coops.coops(
+            "8720218",
+            product=["monthly_mean"],
+            begin_date=pd.Timestamp("2016-01-01"),
+            end_date=pd.Timestamp("2017-01-01"),
+            time_zone="GMT",
+            datum="MLLW",
+        )
+
+    assert df.empty
+    assert not any(url.endswith("datagetter") for url, _ in mdapi)
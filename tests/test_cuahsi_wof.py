@@ -0,0 +1,104 @@
+import io
+from xml.sax.saxutils import escape
+
+import pytest
+import requests
+import suds.transport
+import suds.transport.https
+import utils
+
+from tsgettoolbox.ulmo.cuahsi.wof import core
+
+VALUES_FILE = "cuahsi/wof/get_values_1_1_ipswich_MMB_ipswich_Temp.xml"
+
+
+def _envelope(operation, body):
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+        f'<soap:Body><{operation}Response xmlns="http://www.cuahsi.org/his/1.1/ws/">'
+        f"{body}</{operation}Response></soap:Body></soap:Envelope>"
+    ).encode()
+
+
+def _values_xml():
+    with open(utils.get_test_file_path(VALUES_FILE)) as f:
+        return f.read().split("?>", 1)[-1]
+
+
+@pytest.fixture
+def wsdl_url(tmp_path, monkeypatch):
+    """a local WaterOneFlow 1.1 WSDL, with an empty client pool"""
+    with open(utils.get_test_file_path("cuahsi/wof/twdb_wsdl.xml")) as f:
+        wsdl = f.read().replace("his/1.0/ws/", "his/1.1/ws/")
+    path = tmp_path / "wsdl.xml"
+    path.write_text(wsdl)
+    monkeypatch.setattr(core, "_suds_clients", {})
+    return path.as_uri()
+
+
+class _Response:
+    def __init__(self, content):
+        self.raw = io.BytesIO(content)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+
+def test_get_values_streamed(wsdl_url, monkeypatch):
+    posted = []
+
+    def post(url, data, headers, stream, timeout):
+        posted.append((url, data, headers))
+        return _Response(_envelope("GetValuesObject", _values_xml()))
+
+    monkeypatch.setattr(core._session, "post", post)
+
+    for _ in range(2):
+        values = core.get_values(
+            wsdl_url, "ipswich:MMB", "ipswich:Temp", suds_cache=None
+        )
+        assert len(values["values"]) == 112
+        assert values["variable"]["code"] == "Temp"
+
+    url, envelope, headers = posted[0]
+    assert url == "http://his.crwr.utexas.edu/TWDB_Sondes/cuahsi_1_0.asmx"
+    assert headers["SOAPAction"] == '"http://www.cuahsi.org/his/1.1/ws/GetValuesObject"'
+    assert b"<ns0:GetValuesObject><ns0:location>ipswich:MMB</ns0:location>" in envelope
+    # both requests used the same pooled clone of the client
+    ((_, idle),) = core._suds_clients.values()
+    assert idle.qsize() == 1
+
+
+def test_get_values_falls_back(wsdl_url, monkeypatch):
+    def post(*args, **kwargs):
+        raise requests.exceptions.ConnectionError("refused")
+
+    sent = []
+
+    def send(self, request):
+        sent.append(request)
+        return suds.transport.Reply(
+            200,
+            {},
+            _envelope(
+                "GetValues",
+                f"<GetValuesResult>{escape(_values_xml())}</GetValuesResult>",
+            ),
+        )
+
+    monkeypatch.setattr(core._session, "post", post)
+    monkeypatch.setattr(suds.transport.https.HttpAuthenticated, "send", send)
+
+    values = core.get_values(wsdl_url, "ipswich:MMB", "ipswich:Temp", suds_cache=None)
+
+    assert len(values["values"]) == 112
+    assert (
+        sent[0].headers["SOAPAction"] == b'"http://www.cuahsi.org/his/1.1/ws/GetValues"'
+    )
@@ -0,0 +1,154 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from tsgettoolbox import download_utils
+
+
+@pytest.fixture
+def server():
+    """serves the path of each request with an ETag, records the headers of
+    every request"""
+    etag = '"v1"'
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(dict(self.headers))
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = self.path.encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}", requests
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_if_new_conditional_get(server, tmp_path):
+    base, requests = server
+    url = f"{base}/data/file.txt"
+    path = tmp_path / "cache" / "file.txt"
+
+    download_utils.download_if_new(url, str(path))
+    assert path.read_text() == "/data/file.txt"
+    assert "If-None-Match" not in requests[-1]
+
+    path.write_text("cached")
+    download_utils.download_if_new(url, str(path))
+    assert requests[-1]["If-None-Match"] == '"v1"'
+    assert "If-Modified-Since" in requests[-1]
+    assert path.read_text() == "cached"
+    # no partial files are left behind
+    assert sorted(p.name for p in path.parent.iterdir()) == [
+        "file.txt",
+        "file.txt.etag",
+    ]
+
+
+def test_download_files(server, tmp_path):
+    base, _ = server
+    urls_and_paths = [(f"{base}/{i}.txt", str(tmp_path / f"{i}.txt")) for i in range(5)]
+
+    paths = download_utils.download_files(urls_and_paths, max_workers=3)
+
+    assert paths == [path for _, path in urls_and_paths]
+    for i, path in enumerate(paths):
+        with open(path) as f:
+            assert f.read() == f"/{i}.txt"
+
+
+@pytest.fixture
+def fake_ftp(monkeypatch):
+    """replaces ftplib.FTP, returns the list of connections made; a
+    connection fails its first `failures` calls with EOFError"""
+    connections = []
+
+    class FakeFTP:
+        failures = 0
+
+        def __init__(self, host, user):
+            self.host = host
+            self.closed = False
+            self.failures = FakeFTP.failures
+            connections.append(self)
+
+        def _call(self):
+            if self.failures:
+                self.failures -= 1
+                raise EOFError
+            return self
+
+        def cwd(self, path):
+            self._call()
+            self.path = path
+
+        def nlst(self):
+            return [f"{self.path}/a.txt"]
+
+        def sendcmd(self, cmd):
+            self._call()
+            return "213 20200101000000"
+
+        def size(self, path):
+            return len(b"ftp data")
+
+        def retrbinary(self, cmd, callback):
+            callback(b"ftp data")
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(download_utils.ftplib, "FTP", FakeFTP)
+    monkeypatch.setattr(download_utils, "_ftp_connections", threading.local())
+    return FakeFTP, connections
+
+
+def test_ftp_connection_reused(fake_ftp, tmp_path):
+    _, connections = fake_ftp
+
+    assert download_utils.dir_list("ftp://example.com/pub") == ["/pub/a.txt"]
+    download_utils.download_if_new("ftp://example.com/pub/a.txt", str(tmp_path / "a"))
+
+    assert len(connections) == 1
+    assert (tmp_path / "a").read_bytes() == b"ftp data"
+
+
+def test_ftp_reconnects_once(fake_ftp):
+    fake_ftp_class, connections = fake_ftp
+    download_utils.dir_list("ftp://example.com/pub")
+    connections[0].failures = 1
+
+    assert download_utils.dir_list("ftp://example.com/pub") == ["/pub/a.txt"]
+    assert len(connections) == 2
+    assert connections[0].closed
+
+    # a new connection that fails as well is not retried again
+    fake_ftp_class.failures = 1
+    connections[1].failures = 1
+    with pytest.raises(EOFError):
+        download_utils.dir_list("ftp://example.com/pub")
+    assert len(connections) == 3
+
+
+def test_ftp_download_if_new_skips_current_file(fake_ftp, tmp_path):
+    path = tmp_path / "a"
+    path.write_bytes(b"local da")  # same size as the server file
+
+    download_utils.download_if_new("ftp://example.com/pub/a.txt", str(path))
+
+    # the local file is newer than the server's 2020 timestamp
+    assert path.read_bytes() == b"local da"
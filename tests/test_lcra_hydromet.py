@@ -0,0 +1,18 @@
+import pandas as pd
+import utils
+
+from tsgettoolbox.ulmo.lcra.hydromet import core
+
+
+def test_parse_data_table():
+    with open(
+        utils.get_test_file_path("lcra/hydromet/4598_stage_flow_data.html"), "rb"
+    ) as f:
+        df = core._parse_data_table(f.read())
+
+    assert list(df.columns) == ["Stage(feet)", "Flow(cfs)"]
+    assert df.index.name == "Date - Time"
+    assert (df.dtypes == float).all()
+    assert df.index[0] == pd.Timestamp("2015-12-03 13:10")
+    assert df.iloc[0].tolist() == [6.00, 58.0]
+    assert df.index[1] == pd.Timestamp("2015-12-03 12:55")
@@ -0,0 +1,100 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from tsgettoolbox.functions import modis
+
+
+def test_sinusoidal_tile():
+    assert modis._sinusoidal_tile(38.9, -77.0) == "h12v05"
+    assert modis._sinusoidal_tile(48.85, 2.35) == "h18v04"
+    assert modis._sinusoidal_tile(-33.87, 151.2) == "h30v12"
+    assert modis._sinusoidal_tile(0.5, 0.5) == "h18v08"
+    # the east and south edges belong to the last tile
+    assert modis._sinusoidal_tile(0.0, 180.0) == "h35v09"
+    assert modis._sinusoidal_tile(-90.0, 0.0) == "h18v17"
+
+
+def test_catalog_ttl(tmp_path, monkeypatch):
+    requested = []
+
+    def retrieve_text(urls, disable=False):
+        requested.append(disable)
+        return [json.dumps({"dates": len(requested)})]
+
+    monkeypatch.setattr(modis.ar, "retrieve_text", retrieve_text)
+    monkeypatch.setattr(modis.utils, "get_tsget_dir", lambda sub_dir: str(tmp_path))
+
+    assert modis._catalog("url", 60, "dates.json") == {"dates": 1}
+    assert modis._catalog("url", 60, "dates.json") == {"dates": 1}
+
+    # an expired catalog is fetched again, bypassing the response cache
+    stale = time.time() - 120
+    os.utime(tmp_path / "dates.json", (stale, stale))
+    assert modis._catalog("url", 60, "dates.json") == {"dates": 2}
+    assert requested == [True, True]
+
+
+def _subset(dates, data):
+    return json.dumps(
+        {
+            "subset": [
+                {"calendar_date": date, "data": pixels}
+                for date, pixels in zip(dates, data)
+            ]
+        }
+    )
+
+
+def test_decode_subsets():
+    texts = [
+        _subset(["2020-01-01", "2020-01-09"], [[1, 2, 3], [4, 5, 6]]),
+        _subset(["2020-01-17"], [[7, 8, 9]]),
+    ]
+
+    dates, data = modis._decode_subsets(texts)
+
+    assert (
+        dates.tolist()
+        == pd.to_datetime(["2020-01-01", "2020-01-09", "2020-01-17"]).tolist()
+    )
+    np.testing.assert_array_equal(data, np.arange(1, 10).reshape(3, 3))
+
+
+def test_decode_band():
+    data = np.array([[0, 55, 100], [101, 255, 7]])
+
+    decoded = modis._decode_band("Lai_500m", data)
+
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(
+        decoded, [[0.0, 5.5, 10.0], [np.nan, np.nan, 0.7]], rtol=1e-6
+    )
+
+
+def test_decode_band_offset():
+    decoded = modis._decode_band("Emis_31", np.array([[0, 100]]))
+
+    np.testing.assert_allclose(decoded, [[np.nan, 0.69]], rtol=1e-6)
+
+
+def test_unpack_qc():
+    flags = modis._unpack_qc("FparLai_QC", np.array([[2, 255]]))
+
+    assert flags["FparLai_QC.good_quality"].tolist() == [[True, False]]
+    assert flags["FparLai_QC.aqua"].tolist() == [[True, False]]
+    assert flags["FparLai_QC.cloud_clear"].tolist() == [[True, False]]
+    assert flags["FparLai_QC.main_method"].tolist() == [[True, False]]
+    assert not flags["FparLai_QC.cloud_mixed"].any()
+
+
+def test_unpack_qc_fill():
+    flags = modis._unpack_qc("250m_16_days_VI_Quality", np.array([[0, -1, 65535]]))
+
+    # fill and out of range pixels have no quality flags set
+    for values in flags.values():
+        assert not values[0, 1:].any()
+    assert flags["250m_16_days_VI_Quality.good_quality"][0, 0]
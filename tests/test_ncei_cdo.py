@@ -0,0 +1,90 @@
+import json
+import multiprocessing
+import time
+
+import pandas as pd
+import pytest
+
+from tsgettoolbox.functions import ncei
+
+
+def test_cdo_windows_daily():
+    windows = ncei._cdo_windows(
+        "GHCND", pd.Timestamp("2019-06-15"), pd.Timestamp("2021-02-01")
+    )
+    assert windows == [
+        (pd.Timestamp("2019-01-01"), pd.Timestamp("2019-12-31")),
+        (pd.Timestamp("2020-01-01"), pd.Timestamp("2020-12-31")),
+        (pd.Timestamp("2021-01-01"), pd.Timestamp("2021-12-31")),
+    ]
+
+
+def test_cdo_windows_decades():
+    windows = ncei._cdo_windows(
+        "GSOM", pd.Timestamp("1995-03-01"), pd.Timestamp("2012-01-01")
+    )
+    # aligned to decades, so overlapping requests share cache entries
+    assert windows == [
+        (pd.Timestamp("1990-01-01"), pd.Timestamp("1999-12-31")),
+        (pd.Timestamp("2000-01-01"), pd.Timestamp("2009-12-31")),
+        (pd.Timestamp("2010-01-01"), pd.Timestamp("2019-12-31")),
+    ]
+
+
+def _budget(tmp_path):
+    with open(tmp_path / "budget.json", encoding="ascii") as fpbudget:
+        return json.load(fpbudget)
+
+
+def test_cdo_spend_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(ncei, "CDO_DIR", str(tmp_path))
+    monkeypatch.setattr(ncei, "_CDO_PER_DAY", 10)
+
+    ncei._cdo_spend_budget(4)
+    ncei._cdo_spend_budget(5)
+    assert _budget(tmp_path)["count"] == 9
+
+    # requests that would exceed the quota aren't recorded
+    with pytest.raises(ValueError):
+        ncei._cdo_spend_budget(2)
+    assert _budget(tmp_path)["count"] == 9
+    ncei._cdo_spend_budget(1)
+    assert _budget(tmp_path)["count"] == 10
+
+
+def test_cdo_spend_budget_new_day(tmp_path, monkeypatch):
+    monkeypatch.setattr(ncei, "CDO_DIR", str(tmp_path))
+    with open(tmp_path / "budget.json", "w", encoding="ascii") as fpbudget:
+        json.dump({"date": "2000-01-01", "count": ncei._CDO_PER_DAY}, fpbudget)
+
+    ncei._cdo_spend_budget(3)
+
+    assert _budget(tmp_path)["count"] == 3
+
+
+def _spend(cdo_dir, count):
+    ncei.CDO_DIR = cdo_dir
+    for _ in range(count):
+        ncei._cdo_spend_budget(1)
+
+
+def test_cdo_spend_budget_processes(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_spend, args=(str(tmp_path), 50)) for _ in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0] * 4
+    assert _budget(tmp_path)["count"] == 200
+
+
+def test_token_bucket():
+    bucket = ncei._TokenBucket(100)
+    bucket.acquire(100)
+    start = time.monotonic()
+    # the bucket is empty, 20 more tokens take 0.2 seconds to refill
+    bucket.acquire(20)
+    assert time.monotonic() - start >= 0.15
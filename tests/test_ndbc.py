@@ -0,0 +1,84 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tsgettoolbox.functions import ndbc
+
+
+def _wlevel_reference(df):
+    """Reshape the way ndbc_to_df did before it was vectorized."""
+    df = df.copy()
+    df.columns = list(range(0, 55, 6))
+    df = pd.DataFrame(df.stack())
+    df.index = [i + datetime.timedelta(minutes=j) for i, j in df.index]
+    df.index.name = "Datetime"
+    df.columns = ["WLEVEL:ft:MLLW"]
+    # Newer pandas keeps missing values in stack().
+    return df.dropna()
+
+
+@pytest.fixture(scope="module")
+def wlevel_decade():
+    """Ten years of hourly wlevel rows, ten 6-minute samples per row."""
+    index = pd.date_range("2010-01-01", "2019-12-31 23:00", freq="h", name="datetime")
+    rng = np.random.default_rng(42)
+    values = rng.normal(2.0, 0.5, (len(index), 10))
+    values[rng.random(values.shape) < 0.05] = np.nan
+    return pd.DataFrame(values, index=index, columns=[f"L{i:02d}" for i in range(10)])
+
+
+def test_wlevel_to_long(wlevel_decade):
+    wide = wlevel_decade.iloc[: 24 * 31]
+    df = ndbc._wlevel_to_long(wide)
+    expected = _wlevel_reference(wide)
+    pd.testing.assert_frame_equal(df, expected, check_index_type=False)
+    assert df.index[1] - df.index[0] <= pd.Timedelta(minutes=12)
+    assert not df["WLEVEL:ft:MLLW"].isna().any()
+
+
+def test_wlevel_to_long_decade(wlevel_decade):
+    df = ndbc._wlevel_to_long(wlevel_decade)
+
+    values = wlevel_decade.to_numpy()
+    valid = ~np.isnan(values)
+    assert len(df) == np.count_nonzero(valid)
+    # samples keep the row-major order of the hourly rows
+    np.testing.assert_array_equal(df["WLEVEL:ft:MLLW"].to_numpy(), values[valid])
+    assert df.index.is_monotonic_increasing
+    assert set(df.index.minute) <= set(range(0, 60, 6))
+    assert df.index[-1] == pd.Timestamp("2019-12-31 23:54")
+
+
+def test_ndbc_to_df_precedence(tmp_path, monkeypatch):
+    monkeypatch.setattr(ndbc, "NDBC_DIR", str(tmp_path))
+    now = pd.Timestamp.now(tz="UTC").tz_convert(None)
+    stamp = now.floor("h") - pd.Timedelta(hours=1)
+    row = f"{stamp:%Y %m %d %H %M}"
+    header = "#YY  MM DD hh mm WSPD\n#yr  mo dy hr mn m/s\n"
+    calls = []
+
+    def retrieve_binary(urls, kwds, disable=False, raise_status=True):
+        calls.append((urls, disable))
+        monthly = (header + f"{row} 1.0\n").encode()
+        realtime = (header + f"{row} 2.0\n{now:%Y %m %d %H} 00 3.0\n").encode()
+        return [realtime if "realtime2" in url else monthly for url in urls]
+
+    monkeypatch.setattr(ndbc.ar, "retrieve_binary", retrieve_binary)
+    df = ndbc.ndbc_to_df(
+        "https://www.ndbc.noaa.gov/data",
+        realtime=True,
+        table="stdmet",
+        station="41012",
+        startUTC=f"{stamp:%Y-%m-%d}T00:00Z",
+        endUTC=None,
+    )
+
+    # the monthly file wins over the realtime tail
+    assert df.iloc[:, 0].tolist() == [1.0, 3.0]
+    live = [url for urls, disable in calls if disable for url in urls]
+    assert any("realtime2" in url for url in live)
+    assert all(
+        "realtime2" not in url for urls, disable in calls if not disable for url in urls
+    )
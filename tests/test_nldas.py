@@ -20,3 +20,39 @@ def test_nldas():
     assert np.isclose(
         df["NLDAS_FORA0125_H_2_0_Rainf:mm"].mean(), 0.155496623554996, rtol=1e-3
     ) and df.shape[1] == len(variables)
+
+
+def test_giovanni_token_cached(monkeypatch, tmp_path):
+    from tsgettoolbox.functions import ldas
+
+    signins = []
+
+    class _Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"token": "abc"}
+
+    def _get(*args, **kwargs):
+        signins.append(args)
+        return _Response()
+
+    token_path = tmp_path / "giovanni_token.json"
+    monkeypatch.setattr(ldas.requests, "get", _get)
+    monkeypatch.setattr(ldas.utils, "read_netrc", lambda machine: ("user", "pass"))
+    monkeypatch.setattr(ldas, "_token_path", lambda: str(token_path))
+    monkeypatch.setattr(ldas, "_TOKEN", {})
+
+    assert ldas._giovanni_token() == "abc"
+    assert ldas._giovanni_token() == "abc"
+    assert len(signins) == 1
+    assert token_path.stat().st_mode & 0o777 == 0o600
+
+    # A new process reads the token from disk.
+    ldas._TOKEN.clear()
+    assert ldas._giovanni_token() == "abc"
+    assert len(signins) == 1
+
+    ldas._giovanni_token(refresh=True)
+    assert len(signins) == 2
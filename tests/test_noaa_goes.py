@@ -1,9 +1,9 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import numpy as np
 import pandas as pd
 import utils
-from pandas.testing import assert_frame_equal
+from pandas.testing import assert_frame_equal, assert_series_equal
 
 from tsgettoolbox.ulmo.noaa import goes
 
@@ -287,6 +287,108 @@ def test_parser_twdb_fts():
         _assert(test_set, columns, "twdb_fts")
 
 
+def test_decode_matches_row_parsers():
+    test_sets = {
+        "twdb_fts": twdb_fts_test_sets,
+        "twdb_stevens": twdb_stevens_test_sets,
+        "twdb_sutron": twdb_sutron_test_sets,
+    }
+    for parser, sets in test_sets.items():
+        messages = pd.DataFrame(
+            [{k: v for k, v in s.items() if k != "return_value"} for s in sets]
+        )
+        row_parser = getattr(goes.parsers, parser)
+        expected = pd.concat(
+            [row_parser(row) for _, row in messages.iterrows()]
+        ).dropna(how="all")
+        df = goes.parsers.batch_parsers[row_parser](messages).dropna(how="all")
+        assert_frame_equal(
+            df, expected, check_dtype=False, check_index_type=False, check_names=False
+        )
+
+
+def _dcs_entry(dcp_address, now, hours_ago, message="x"):
+    timestamp = now - timedelta(hours=hours_ago)
+    return {
+        "TblDcpDataAddrCorr": dcp_address,
+        "TblDcpDataDtMsgCar": f"/Date({int(timestamp.timestamp() * 1000)})/",
+        "TblDcpDataProcessInfo": "G",
+        "TblDcpDataSigStrength": 48.4,
+        "TblDcpDataChan": 166,
+        "TblDcpDataDataLen": 123,
+        "TblDcpDataData": message,
+    }
+
+
+def _mock_dcs(monkeypatch, entries):
+    """serve entries from _fetch_url, returns the list of request params"""
+    requests = []
+
+    def fetch_url(params):
+        requests.append(params)
+        return entries
+
+    monkeypatch.setattr(goes.core, "_fetch_url", fetch_url)
+    return requests
+
+
+def test_cache_appends_without_duplicates(tmp_path, monkeypatch):
+    now = datetime.now().replace(microsecond=0)
+    entries = [_dcs_entry("C5149430", now, hours) for hours in (30, 20, 10)]
+    _mock_dcs(monkeypatch, entries)
+    uncached = goes.get_data("C5149430", hours=48)
+    goes.get_data("C5149430", hours=48, use_cache=True, cache_path=str(tmp_path))
+
+    entries[:] = [*entries[1:], _dcs_entry("C5149430", now, 5)]
+    data = goes.get_data("C5149430", hours=48, use_cache=True, cache_path=str(tmp_path))
+
+    assert len(data) == 4
+    assert data.index.is_unique
+    assert data.index.is_monotonic_increasing
+    assert_series_equal(
+        data.dtypes[["signal_strength", "goes_receive_channel"]],
+        uncached.dtypes[["signal_strength", "goes_receive_channel"]],
+    )
+
+
+def test_cache_since_last(tmp_path, monkeypatch):
+    now = datetime.now().replace(microsecond=0)
+    entries = [_dcs_entry("C5149430", now, hours) for hours in (30, 20, 3)]
+    requests = _mock_dcs(monkeypatch, entries)
+    goes.get_data("C5149430", hours=48, use_cache=True, cache_path=str(tmp_path))
+
+    entries[:] = [_dcs_entry("C5149430", now, hours) for hours in (3, 1)]
+    data = goes.get_data(
+        "C5149430",
+        hours=48,
+        use_cache=True,
+        cache_path=str(tmp_path),
+        since_last=True,
+    )
+
+    # only the hours since the last cached message are fetched and returned
+    assert requests[-1]["hours"] == (5,)
+    assert len(data) == 2
+    with pd.HDFStore(str(tmp_path / "C5149430.h5"), mode="r") as store:
+        assert len(store["C5149430"]) == 4
+
+
+def test_cache_converts_legacy_store(tmp_path, monkeypatch):
+    now = datetime.now().replace(microsecond=0)
+    entries = [_dcs_entry("C5149430", now, hours) for hours in (30, 20)]
+    _mock_dcs(monkeypatch, entries)
+    legacy = goes.get_data("C5149430", hours=48)
+    with pd.HDFStore(str(tmp_path / "C5149430.h5")) as store:
+        store.put("C5149430", legacy, format="fixed")
+
+    entries[:] = [_dcs_entry("C5149430", now, hours) for hours in (20, 10)]
+    data = goes.get_data("C5149430", hours=48, use_cache=True, cache_path=str(tmp_path))
+
+    assert len(data) == 3
+    with pd.HDFStore(str(tmp_path / "C5149430.h5"), mode="r") as store:
+        assert store.get_storer("C5149430").is_table
+
+
 def _assert(test_set, columns, parser):
     expected = pd.DataFrame(test_set["return_value"], columns=columns)
     expected.index = pd.to_datetime(expected["timestamp_utc"])
@@ -0,0 +1,152 @@
+import os
+
+import pandas as pd
+import utils
+
+from tsgettoolbox.ulmo.usgs.nwis import hdf5
+
+VALUES_PATH = "01117800/00065:00011/values"
+
+
+def _values(times, values, **columns):
+    df = hdf5._values_dicts_to_df(
+        [
+            {"datetime": time, "value": value, "qualifiers": "P"}
+            for time, value in zip(times, values)
+        ]
+    )
+    for column, value in columns.items():
+        df[column] = value
+    return df
+
+
+def test_upsert_values(tmp_path):
+    with hdf5._get_store(str(tmp_path / "site.h5"), mode="a") as store:
+        hdf5._append_values(
+            store,
+            VALUES_PATH,
+            _values(
+                [f"2020-11-01T0{hour}:00:00-04:00" for hour in range(4)],
+                ["1", "2", "3", "4"],
+                last_checked="old",
+                last_modified="old",
+            ),
+        )
+        # after the daylight saving change the same instants have another
+        # UTC offset
+        new_values = _values(
+            [f"2020-11-01T0{hour}:00:00-05:00" for hour in range(1, 4)],
+            ["3", "9", "5"],
+            last_checked="new",
+        )
+        hdf5._upsert_values(store, VALUES_PATH, new_values, "new")
+
+        stored = store[VALUES_PATH]
+        assert store.get_storer(VALUES_PATH).is_table
+
+    assert stored.index.is_unique
+    assert stored["value"].tolist() == ["1", "2", "3", "9", "5"]
+    assert stored["last_modified"].tolist() == ["old", "old", "old", "new", "new"]
+    assert stored["last_checked"].tolist() == ["old", "old", "new", "new", "new"]
+
+
+def test_convert_legacy_values(tmp_path):
+    with hdf5._get_store(str(tmp_path / "site.h5"), mode="a") as store:
+        legacy = _values(
+            ["2020-01-01", "2020-01-02"], ["1", "2"], last_checked="old"
+        ).astype(object)
+        store.put(VALUES_PATH, legacy, format="fixed")
+
+        new_values = _values(["2020-01-02", "2020-01-03"], ["2", "3"])
+        hdf5._upsert_values(store, VALUES_PATH, new_values, "new")
+
+        assert store.get_storer(VALUES_PATH).is_table
+        assert store[VALUES_PATH]["value"].tolist() == ["1", "2", "3"]
+
+
+def test_update_site_data_upserts(tmp_path):
+    path = f"{tmp_path}/"
+    hdf5.update_site_data(
+        "01117800",
+        path=path,
+        input_file=utils.get_test_file_path("usgs/nwis/site_01117800_daily.xml"),
+    )
+    hdf5.update_site_data(
+        "01117800",
+        path=path,
+        input_file=utils.get_test_file_path("usgs/nwis/site_01117800_daily_update.xml"),
+    )
+
+    values = pd.DataFrame(
+        hdf5.get_site_data("01117800", path=path)["00060:00003"]["values"]
+    )
+    assert len(values) == 535
+    assert values["datetime"].is_unique
+    assert values["datetime"].iloc[-1] == "2012-06-06T00:00:00"
+
+    # compacting keeps the values
+    hdf5.compact(path)
+    pd.testing.assert_frame_equal(
+        pd.DataFrame(
+            hdf5.get_site_data("01117800", path=path)["00060:00003"]["values"]
+        ),
+        values,
+    )
+
+
+def test_update_sites_data(tmp_path, monkeypatch):
+    def fetch_site_values(service, url_params, session=None):
+        if service == "instantaneous" and "01111300" in url_params["site"]:
+            return None
+        with open(utils.get_test_file_path(f"usgs/nwis/RI_{service}.xml"), "rb") as f:
+            return f.read(), "2020-01-01T00:00:00"
+
+    monkeypatch.setattr(hdf5.core, "_fetch_site_values", fetch_site_values)
+    path = f"{tmp_path}/"
+
+    status = hdf5.update_sites_data(
+        ["01106000", "01109403", "01111300"],
+        path=path,
+        methods="all",
+        batch_size=2,
+        max_workers=2,
+        parse_workers=1,
+    )
+
+    assert {site: d["status"] for site, d in status.items()} == {
+        "01106000": "updated",
+        "01109403": "updated",
+        "01111300": "failed",
+    }
+    assert sorted(os.listdir(tmp_path)) == [
+        "01106000.h5",
+        "01109403.h5",
+        "01111300.h5",
+        "sites.h5",
+    ]
+    site_data = hdf5.get_site_data("01109403", path=path)
+    assert any(code.endswith(":00011") for code in site_data)
+    assert sorted(hdf5.get_sites(path=path)) == ["01106000", "01109403", "01111300"]
+
+
+def test_site_batches(tmp_path, monkeypatch):
+    last_refreshes = {"a": "2020-01-02", "b": None, "c": "2020-01-01", "d": None}
+    monkeypatch.setattr(
+        hdf5, "_get_last_refresh", lambda site_code, path: last_refreshes[site_code]
+    )
+
+    batches = [
+        (batch, url_params["service"], url_params["startDT"])
+        for batch, url_params in hdf5._site_batches(
+            ["a", "b", "c", "d"], None, None, None, f"{tmp_path}/", 2
+        )
+    ]
+
+    # never refreshed sites get the whole period of record, refreshed sites
+    # are requested from the earliest last refresh of their batch
+    assert batches == [
+        (["b", "d"], "daily", "1851-01-01"),
+        (["b", "d"], "instantaneous", "1910-01-01T00:00:00"),
+        (["c", "a"], "daily", "2020-01-01"),
+        (["c", "a"], "instantaneous", "2020-01-01T00:00:00"),
+    ]
@@ -0,0 +1,122 @@
+import os
+
+import pandas as pd
+import pytest
+
+from tsgettoolbox.functions import nwis
+
+
+def _rdb(*rows):
+    lines = ["# comment", "agency_cd\tsite_no\tstation_nm", "5s\t15s\t50s"]
+    lines.extend(f"USGS\t{site}\t{name}" for site, name in rows)
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture
+def site_service(tmp_path, monkeypatch):
+    """serves the responses queued per query, returns the queue and the list
+    of requested query params; a response of None is a failed request and
+    an int is its status code"""
+    responses = []
+    requested = []
+
+    def retrieve_text(urls, kwds, raise_status=True):
+        requested.extend(i["params"] for i in kwds)
+        return [responses.pop(0) for _ in urls]
+
+    class Response:
+        def __init__(self, status_code):
+            self.status_code = status_code
+
+    def get(url, params, timeout):
+        return Response(responses.pop(0))
+
+    monkeypatch.setattr(nwis, "NWIS_CATALOG_DIR", str(tmp_path))
+    monkeypatch.setattr(nwis, "_CATALOG", {})
+    monkeypatch.setattr(nwis.ar, "retrieve_text", retrieve_text)
+    monkeypatch.setattr(nwis.requests, "get", get)
+    return responses, requested
+
+
+def _age(table, kind, key, seconds):
+    """make the stored and loaded partition `seconds` older"""
+    part = nwis._CATALOG[(table, kind, key)]
+    part["fetched"] -= seconds
+    pd.to_pickle(part, nwis._catalog_path(table, kind, key))
+
+
+def test_catalog_partition_written_once(site_service):
+    responses, requested = site_service
+    responses.append(_rdb(("01", "a"), ("02", "b")))
+
+    (df,) = nwis._catalog_partitions("expanded", [("state", "RI")])
+    assert df["site_no"].tolist() == ["01", "02"]
+    assert os.path.exists(nwis._catalog_path("expanded", "state", "RI"))
+
+    # later lookups, in this or a new process, don't download it again
+    nwis._CATALOG.clear()
+    (df,) = nwis._catalog_partitions("expanded", [("state", "RI")])
+    assert df["site_no"].tolist() == ["01", "02"]
+    assert len(requested) == 1
+    assert requested[0]["stateCd"] == "RI"
+
+
+def test_catalog_partition_refreshed(site_service):
+    responses, requested = site_service
+    responses.append(_rdb(("01", "a"), ("02", "b")))
+    nwis._catalog_partitions("expanded", [("state", "RI")])
+    _age("expanded", "state", "RI", 2 * 86400 - 3600)
+
+    responses.append(_rdb(("02", "renamed"), ("03", "c")))
+    (df,) = nwis._catalog_partitions("expanded", [("state", "RI")])
+
+    # only the sites modified since the last download are requested
+    assert requested[-1]["modifiedSince"] == "P2D"
+    assert df.sort_index()["station_nm"].tolist() == ["a", "renamed", "c"]
+    stored = pd.read_pickle(nwis._catalog_path("expanded", "state", "RI"))
+    assert stored["df"].sort_index()["station_nm"].tolist() == ["a", "renamed", "c"]
+
+
+def test_catalog_refresh_not_found(site_service):
+    responses, requested = site_service
+    responses.append(_rdb(("01", "a")))
+    nwis._catalog_partitions("expanded", [("state", "RI")])
+    _age("expanded", "state", "RI", 2 * 86400 - 3600)
+
+    # a confirmed 404, no site was modified
+    responses.extend([None, 404])
+    (df,) = nwis._catalog_partitions("expanded", [("state", "RI")])
+    assert df["site_no"].tolist() == ["01"]
+    nwis._catalog_partitions("expanded", [("state", "RI")])
+    assert len(requested) == 2
+
+
+def test_catalog_refresh_failed(site_service):
+    responses, requested = site_service
+    responses.append(_rdb(("01", "a")))
+    nwis._catalog_partitions("expanded", [("state", "RI")])
+    _age("expanded", "state", "RI", 2 * 86400 - 3600)
+
+    # any other failure keeps the partition stale, so it is retried
+    responses.extend([None, 503])
+    (df,) = nwis._catalog_partitions("expanded", [("state", "RI")])
+    assert df["site_no"].tolist() == ["01"]
+    responses.append(_rdb())
+    nwis._catalog_partitions("expanded", [("state", "RI")])
+    assert len(requested) == 3
+
+
+def test_catalog_load_not_found(site_service):
+    responses, requested = site_service
+
+    # a grid cell without sites is an empty partition, a state that
+    # failed to download is not cached
+    responses.extend([None, None, 404, 503])
+    cell, state = nwis._catalog_partitions(
+        "expanded", [("cell", "41_-72"), ("state", "RI")]
+    )
+    assert cell is not None
+    assert len(cell) == 0
+    assert state is None
+    assert os.path.exists(nwis._catalog_path("expanded", "cell", "41_-72"))
+    assert not os.path.exists(nwis._catalog_path("expanded", "state", "RI"))
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tsgettoolbox.functions import nwis
+
+STATS = ["mean_va", "p05_va", "p10_va", "p20_va", "p25_va", "p50_va"]
+STATS += ["p75_va", "p80_va", "p90_va", "p95_va"]
+
+
+def _stat_rdb(nsites, report="daily"):
+    """RDB response of the stat service for `nsites` sites."""
+    if report == "daily":
+        dates = pd.date_range("2000-01-01", "2000-12-31")
+        keys = ["month_nu", "day_nu"]
+        parts = [[d.month, d.day] for d in dates]
+    else:
+        keys = ["year_nu", "month_nu"]
+        parts = [[y, m] for y in range(1990, 2020) for m in range(1, 13)]
+    names = ["agency_cd", "site_no", "parameter_cd", "ts_id", "loc_web_ds"]
+    names += keys + STATS
+    lines = ["# synthetic", "\t".join(names), "\t".join(["5s"] * len(names))]
+    rng = np.random.default_rng(7)
+    for site in range(nsites):
+        values = rng.random((len(parts), len(STATS))).round(2)
+        for part, vals in zip(parts, values):
+            lines.append(
+                "\t".join(
+                    ["USGS", f"{2000000 + site:08d}", "00060", "1234", ""]
+                    + [str(i) for i in part]
+                    + [str(i) for i in vals]
+                )
+            )
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture(scope="module")
+def daily_stat_rdb():
+    return _stat_rdb(100)
+
+
+@pytest.fixture
+def mock_rdb(monkeypatch):
+    def _mock(text):
+        monkeypatch.setattr(nwis.ar, "retrieve_text", lambda urls, kwds: [text])
+
+    return _mock
+
+
+def test_stat_daily_labels(mock_rdb):
+    mock_rdb(_stat_rdb(2))
+    df = nwis.usgs_stat_rdb_to_df("https://stat", sites="02000000,02000001")
+    assert df.shape == (366, 2 * (len(STATS) + 1))
+    assert df.index[0] == "01-01"
+    assert df.index[59] == "02-29"
+    assert df.index[-1] == "12-31"
+
+
+def test_stat_monthly_dates(mock_rdb):
+    mock_rdb(_stat_rdb(2, report="monthly"))
+    df = nwis.usgs_stat_rdb_to_df(
+        "https://stat", sites="02000000,02000001", statReportType="monthly"
+    )
+    assert df.index[0] == pd.Timestamp("1990-01-01")
+    assert df.index[-1] == pd.Timestamp("2019-12-01")
+    assert len(df) == 30 * 12
+
+
+def test_stat_long_format(mock_rdb):
+    mock_rdb(_stat_rdb(3))
+    wide = nwis.usgs_stat_rdb_to_df("https://stat", sites="x")
+    mock_rdb(_stat_rdb(3))
+    long = nwis.usgs_stat_rdb_to_df("https://stat", sites="x", long_format=True)
+    assert long.index.names == [
+        "agency_cd",
+        "site_no",
+        "parameter_cd",
+        "ts_id",
+        "Datetime",
+    ]
+    assert len(long) == 3 * 366
+    assert (
+        long.loc[("USGS", "02000001", "00060", "1234", "07-04"), "p50_va"]
+        == wide.loc["07-04", "USGS_02000001_00060_1234_p50_va"]
+    )
+
+
+def test_stat_long_matches_wide(mock_rdb, daily_stat_rdb):
+    mock_rdb(daily_stat_rdb)
+    long = nwis.usgs_stat_rdb_to_df("https://stat", sites="x", long_format=True)
+    mock_rdb(daily_stat_rdb)
+    wide = nwis.usgs_stat_rdb_to_df("https://stat", sites="x")
+
+    assert len(long) == 100 * 366
+    assert long.index.is_unique
+    for stat in STATS:
+        from_long = long[stat].unstack("Datetime")
+        columns = ["_".join(i) + f"_{stat}" for i in from_long.index]
+        expected = wide.loc[from_long.columns, columns].T
+        np.testing.assert_array_equal(
+            from_long.to_numpy(dtype=float), expected.to_numpy(dtype=float)
+        )
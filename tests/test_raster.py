@@ -0,0 +1,176 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+import pytest
+
+from tsgettoolbox.ulmo.util import raster
+
+
+@pytest.fixture
+def server():
+    """serves files {path: (body, etag)} with ETag, Range and If-Range
+    support, records the headers of every request"""
+    files = {}
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(dict(self.headers))
+            body, etag = files[self.path]
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            byte_range = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            if byte_range and if_range in (None, etag):
+                start = int(byte_range.split("=")[1].rstrip("-"))
+                self.send_response(206)
+                body = body[start:]
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}", files, requests
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _write_partial(cache_path, url, data, validator=None):
+    part_path = raster._tile_partial_path(str(cache_path), url)
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+    os.makedirs(cache_path / "objects", exist_ok=True)
+    with open(part_path, "wb") as f:
+        f.write(data)
+    if validator is not None:
+        with open(raster._tile_validator_path(part_path), "w") as f:
+            f.write(validator)
+
+
+def test_download_tiles_shares_objects(server, tmp_path):
+    base, files, requests = server
+    files["/a.tif"] = (b"tile" * 1000, '"a1"')
+    files["/b.tif"] = (b"tile" * 1000, '"b1"')
+    urls = [f"{base}/a.tif", f"{base}/b.tif"]
+
+    tiles = raster.download_tiles(str(tmp_path / "layer"), urls, "")
+
+    assert [os.path.basename(i) for i in tiles] == ["a.tif", "b.tif"]
+    for tile in tiles:
+        with open(tile, "rb") as f:
+            assert f.read() == b"tile" * 1000
+    assert len(os.listdir(tmp_path / "tiles" / "objects")) == 1
+
+    raster.download_tiles(str(tmp_path / "layer"), urls, "", check_modified=True)
+    assert {i["If-None-Match"] for i in requests[2:]} == {'"a1"', '"b1"'}
+
+
+def test_download_tile_resumes_with_if_range(server, tmp_path):
+    base, files, requests = server
+    body = bytes(range(256)) * 64
+    files["/a.tif"] = (body, '"a1"')
+    url = f"{base}/a.tif"
+    _write_partial(tmp_path, url, body[:1000], '"a1"')
+
+    entry = raster._download_tile(url, str(tmp_path))
+
+    assert requests[-1]["Range"] == "bytes=1000-"
+    assert requests[-1]["If-Range"] == '"a1"'
+    assert entry["sha256"] == hashlib.sha256(body).hexdigest()
+    with open(raster._tile_object_path(str(tmp_path), entry["sha256"]), "rb") as f:
+        assert f.read() == body
+
+
+def test_download_tile_restarts_changed_tile(server, tmp_path):
+    base, files, requests = server
+    old, new = b"o" * 4000, b"n" * 4000
+    files["/a.tif"] = (new, '"a2"')
+    url = f"{base}/a.tif"
+    _write_partial(tmp_path, url, old[:1000], '"a1"')
+
+    entry = raster._download_tile(url, str(tmp_path))
+
+    assert requests[-1]["If-Range"] == '"a1"'
+    assert entry["sha256"] == hashlib.sha256(new).hexdigest()
+
+
+def test_download_tile_restarts_without_validator(server, tmp_path):
+    base, files, requests = server
+    files["/a.tif"] = (b"n" * 4000, '"a1"')
+    url = f"{base}/a.tif"
+    _write_partial(tmp_path, url, b"o" * 1000)
+
+    entry = raster._download_tile(url, str(tmp_path))
+
+    assert "Range" not in requests[-1]
+    assert entry["sha256"] == hashlib.sha256(b"n" * 4000).hexdigest()
+
+
+@pytest.fixture
+def tiles(tmp_path):
+    """two 10x10 tiles of 0.1 degree pixels, side by side from 0 to 2 east"""
+    rasterio = pytest.importorskip("rasterio")
+    from rasterio.transform import from_origin
+
+    paths = []
+    for i in range(2):
+        path = str(tmp_path / f"tile{i}.tif")
+        data = (np.arange(100, dtype="float32").reshape(10, 10) + 1000 * i).copy()
+        data[0, 0] = -9999
+        with rasterio.open(
+            path,
+            "w",
+            driver="GTiff",
+            width=10,
+            height=10,
+            count=1,
+            dtype="float32",
+            crs="EPSG:4326",
+            transform=from_origin(i, 1, 0.1, 0.1),
+            nodata=-9999,
+        ) as dst:
+            dst.write(data, 1)
+        paths.append(path)
+    return paths
+
+
+def test_mosaic_and_clip(tiles, tmp_path):
+    import rasterio
+    from rasterio.transform import from_origin
+
+    mosaic, profile = raster.mosaic_and_clip(tiles, 0.5, 0.2, 1.5, 0.8)
+
+    assert mosaic.shape == (6, 10)
+    rows = np.arange(2, 8)[:, None] * 10
+    expected = np.hstack([rows + np.arange(5, 10), rows + np.arange(5) + 1000])
+    np.testing.assert_array_equal(mosaic, expected)
+    assert profile["transform"] == from_origin(0.5, 0.8, 0.1, 0.1)
+
+    output_path = str(tmp_path / "mosaic.tif")
+    assert raster.mosaic_and_clip(tiles, 0.5, 0.2, 1.5, 0.8, output_path) == (
+        output_path
+    )
+    with rasterio.open(output_path) as src:
+        np.testing.assert_array_equal(src.read(1), expected)
+
+
+def test_sample_raster_tiles(tiles):
+    points = [(0.55, 0.75), (1.05, 0.15), (0.05, 0.95), (3.0, 0.5)]
+
+    values = raster.sample_raster_tiles(tiles, points)
+
+    np.testing.assert_array_equal(values[:2], [25.0, 1080.0])
+    # nodata, and no tile
+    assert np.isnan(values[2:]).all()
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from tsgettoolbox.functions import twc
+
+CSV = "County,Min,Max,Average,Change\nAnderson,429,684,559,+5\n"
+
+
+def test_get_data_retries_failed_days(tmp_path, monkeypatch):
+    monkeypatch.setattr(twc, "TWC_DIR", str(tmp_path))
+    requested = []
+
+    def retrieve_text(urls, raise_status=True):
+        requested.append(urls)
+        # 20200101 is missing on the server, 20200102 timed out
+        return [CSV if "20200103" in url else None for url in urls]
+
+    def confirm_absent(dates):
+        return {date for date in dates if date == pd.Timestamp("2020-01-01")}
+
+    monkeypatch.setattr(twc.ar, "retrieve_text", retrieve_text)
+    monkeypatch.setattr(twc, "_confirm_absent", confirm_absent)
+
+    df = twc.get_data(["ANDERSON"], start="2020-01-01", end="2020-01-03")
+    assert df.index.tolist() == [pd.Timestamp("2020-01-03")]
+    assert df["KBDI_AVG_ANDERSON"].tolist() == [559.0]
+
+    twc.get_data(["ANDERSON"], start="2020-01-01", end="2020-01-03")
+    assert len(requested[1]) == 1
+    assert "20200102" in requested[1][0]
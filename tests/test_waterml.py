@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import utils
+
+from tsgettoolbox.ulmo import waterml
+
+
+def _parse(file_path, **kwargs):
+    with open(utils.get_test_file_path(file_path), "rb") as content_io:
+        return waterml.v1_1.parse_site_values(content_io, methods="all", **kwargs)
+
+
+def test_parse_site_values_columns_match_dicts():
+    file_path = "usgs/nwis/site_01117800_instantaneous_update.xml"
+    dicts = _parse(file_path)
+    columns = _parse(file_path, columns=True)
+
+    assert sorted(dicts) == sorted(columns)
+    for code, data in dicts.items():
+        values = data["values"]
+        value_columns = columns[code]["values"]
+        assert value_columns["value"].dtype == np.float64
+        assert np.issubdtype(value_columns["datetime"].dtype, np.datetime64)
+
+        expected = pd.to_datetime(
+            [value["datetime"] for value in values], utc=True, format="ISO8601"
+        ).tz_convert(None)
+        np.testing.assert_array_equal(value_columns["datetime"], expected.to_numpy())
+        np.testing.assert_allclose(
+            value_columns["value"], [float(value["value"]) for value in values]
+        )
+        assert list(value_columns["qualifiers"]) == [
+            value.get("qualifiers") for value in values
+        ]
+
+
+def test_parse_site_values_datetimes():
+    values = _parse("usgs/nwis/site_01117800_daily.xml")["00060:00003"]["values"]
+    # fractions of a second are dropped, as before
+    assert values[0]["datetime"] == "1964-01-23T00:00:00"